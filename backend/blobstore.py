@@ -0,0 +1,454 @@
+from fastapi import HTTPException, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import update, delete, select, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from typing import Iterator, Optional
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from .models import Blob, Submission, Assignment
+from .settings import STORAGE_ROOT
+from .utils.files import SavedFile, save_upload, file_response, ranged_response, iter_file, CHUNK_SIZE
+from .utils.compression import SUFFIXES, HEAD_BYTES, TAIL_BYTES, ZSTD, compress_file, decoded_size, iter_decompressed
+
+# Blobs are addressed by the SHA-256 of their content, so a student re-uploading
+# the same file or a teacher re-attaching the same PDF stores the bytes once.
+# `blobs.refcount` counts the submission/assignment rows pointing at each hash;
+# collect_garbage() removes blobs nobody references any more.
+#
+# Old versions may be stored compressed by the storage lifecycle job
+# (storage_lifecycle.py) under `<hash>.zst` / `<hash>.gz`. The stores find the
+# variant themselves: size() and open_range() always describe the original
+# bytes, so readers never need to know whether a blob was compressed.
+BLOB_BACKEND = os.getenv("BLOB_BACKEND", "local")
+BLOB_ROOT = os.getenv("BLOB_ROOT", os.path.join(STORAGE_ROOT, "blobs"))
+S3_BUCKET = os.getenv("S3_BUCKET", "plataforma")
+S3_PREFIX = os.getenv("S3_PREFIX", "blobs/")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")  # e.g. http://minio:9000
+
+
+def _fanout(sha256: str) -> str:
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+
+class LocalBlobStore:
+    def __init__(self, root: str):
+        self.root = root
+        self.staging_dir = os.path.join(root, "tmp")
+
+    def staging_path(self) -> str:
+        os.makedirs(self.staging_dir, exist_ok=True)
+        return os.path.join(self.staging_dir, uuid.uuid4().hex)
+
+    def _path(self, sha256: str, encoding: Optional[str] = None) -> str:
+        return os.path.join(self.root, *_fanout(sha256).split("/")) + SUFFIXES.get(encoding, "")
+
+    # None when stored as uploaded, else the codec; FileNotFoundError if missing
+    def encoding(self, sha256: str) -> Optional[str]:
+        if os.path.exists(self._path(sha256)):
+            return None
+        for encoding in SUFFIXES:
+            if os.path.exists(self._path(sha256, encoding)):
+                return encoding
+        raise FileNotFoundError(sha256)
+
+    # Path of the uncompressed file (served directly, or by nginx); None when
+    # only a compressed copy exists and the bytes must go through open_range().
+    def local_path(self, sha256: str) -> Optional[str]:
+        path = self._path(sha256)
+        if not os.path.exists(path) and self.exists(sha256):
+            return None
+        return path
+
+    def exists(self, sha256: str) -> bool:
+        try:
+            self.encoding(sha256)
+            return True
+        except FileNotFoundError:
+            return False
+
+    # Move a fully written staging file into place. Returns False when the blob
+    # was already stored; the staged copy is then left for acquire() to drop.
+    def put(self, staged: str, sha256: str) -> bool:
+        dest = self._path(sha256)
+        if os.path.exists(dest):
+            # refresh mtime so a concurrent GC run treats it as recently used
+            os.utime(dest)
+            return False
+        compressed = [e for e in SUFFIXES if os.path.exists(self._path(sha256, e))]
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(staged, dest)
+        # uploaded again, so current again: keep the plain copy instead
+        for encoding in compressed:
+            self.discard(sha256, encoding)
+        return not compressed
+
+    def size(self, sha256: str) -> int:
+        encoding = self.encoding(sha256)
+        path = self._path(sha256, encoding)
+        if encoding is None:
+            return os.path.getsize(path)
+        with open(path, "rb") as f:
+            if encoding == ZSTD:
+                return decoded_size(encoding, head=f.read(HEAD_BYTES))
+            f.seek(-TAIL_BYTES, os.SEEK_END)
+            return decoded_size(encoding, tail=f.read())
+
+    def open_range(self, sha256: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        encoding = self.encoding(sha256)
+        if encoding is None:
+            return iter_file(self._path(sha256), start, end)
+        return iter_decompressed(iter_file(self._path(sha256, encoding)), encoding, start, end)
+
+    # Write a compressed copy next to the plain one. Returns its size, or None
+    # (nothing written) when it would be larger than `max_size`. The plain copy
+    # stays until discard(sha256, None), once the caller has recorded the change.
+    def compress(self, sha256: str, encoding: str, level: int, max_size: int) -> Optional[int]:
+        staged = self.staging_path()
+        try:
+            stored = compress_file(self._path(sha256), staged, encoding, level)
+            if stored > max_size:
+                return None
+            os.replace(staged, self._path(sha256, encoding))
+            return stored
+        finally:
+            if os.path.exists(staged):
+                os.unlink(staged)
+
+    def discard(self, sha256: str, encoding: Optional[str]) -> None:
+        try:
+            os.unlink(self._path(sha256, encoding))
+        except FileNotFoundError:
+            pass
+
+    def delete(self, sha256: str) -> None:
+        for encoding in (None, *SUFFIXES):
+            self.discard(sha256, encoding)
+
+    # yields (sha256, last_modified_timestamp) for every stored blob
+    def iter_blobs(self):
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            if os.path.abspath(dirpath) == os.path.abspath(self.staging_dir):
+                dirnames[:] = []
+                continue
+            seen = set()
+            for name in filenames:
+                sha256 = name[:64]
+                if len(sha256) == 64 and name[64:] in ("", *SUFFIXES.values()) and sha256 not in seen:
+                    seen.add(sha256)
+                    yield sha256, os.path.getmtime(os.path.join(dirpath, name))
+
+    def iter_stale_staging(self, older_than: float):
+        return _stale_files(self.staging_dir, older_than)
+
+
+def _stale_files(directory: str, older_than: float):
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if os.path.getmtime(path) < older_than:
+            yield path
+
+
+# S3-compatible backend (AWS S3, MinIO, Azure via gateway...). boto3 is only
+# needed when BLOB_BACKEND=s3; credentials come from the usual AWS_* variables.
+class S3BlobStore:
+    def __init__(self, bucket: str, prefix: str = "blobs/", endpoint_url: Optional[str] = None):
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError as e:
+            raise RuntimeError("BLOB_BACKEND=s3 requires boto3 (pip install boto3)") from e
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+        self._client_error = ClientError
+        self.bucket = bucket
+        self.prefix = prefix
+        self.staging_dir = os.path.join(tempfile.gettempdir(), "plataforma_staging")
+
+    def staging_path(self) -> str:
+        os.makedirs(self.staging_dir, exist_ok=True)
+        return os.path.join(self.staging_dir, uuid.uuid4().hex)
+
+    def key(self, sha256: str, encoding: Optional[str] = None) -> str:
+        return self.prefix + _fanout(sha256) + SUFFIXES.get(encoding, "")
+
+    def local_path(self, sha256: str) -> None:
+        return None
+
+    def _head(self, sha256: str, encoding: Optional[str] = None):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.key(sha256, encoding))
+        except self._client_error as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    # plain object first: one HEAD for every blob that was never compressed
+    def encoding(self, sha256: str) -> Optional[str]:
+        for encoding in (None, *SUFFIXES):
+            if self._head(sha256, encoding) is not None:
+                return encoding
+        raise FileNotFoundError(sha256)
+
+    def exists(self, sha256: str) -> bool:
+        try:
+            self.encoding(sha256)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def put(self, staged: str, sha256: str) -> bool:
+        if self._head(sha256) is not None:
+            return False
+        try:
+            compressed = self.exists(sha256)
+            self.client.upload_file(staged, self.bucket, self.key(sha256))
+            if compressed:
+                # uploaded again, so current again: keep the plain copy instead
+                for encoding in SUFFIXES:
+                    self.discard(sha256, encoding)
+            return not compressed
+        finally:
+            os.unlink(staged)
+
+    def _read(self, key: str, byte_range: str) -> Iterator[bytes]:
+        body = self.client.get_object(Bucket=self.bucket, Key=key, Range=byte_range)["Body"]
+        try:
+            yield from body.iter_chunks(CHUNK_SIZE)
+        finally:
+            body.close()
+
+    def size(self, sha256: str) -> int:
+        encoding = self.encoding(sha256)
+        if encoding is None:
+            return self._head(sha256)["ContentLength"]
+        if encoding == ZSTD:
+            return decoded_size(encoding, head=b"".join(self._read(self.key(sha256, encoding), f"bytes=0-{HEAD_BYTES - 1}")))
+        return decoded_size(encoding, tail=b"".join(self._read(self.key(sha256, encoding), f"bytes=-{TAIL_BYTES}")))
+
+    def open_range(self, sha256: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        encoding = self.encoding(sha256)
+        if encoding is None:
+            return self._read(self.key(sha256), f"bytes={start}-{'' if end is None else end}")
+        return iter_decompressed(self._read(self.key(sha256, encoding), "bytes=0-"), encoding, start, end)
+
+    def compress(self, sha256: str, encoding: str, level: int, max_size: int) -> Optional[int]:
+        original, staged = self.staging_path(), self.staging_path()
+        try:
+            self.client.download_file(self.bucket, self.key(sha256), original)
+            stored = compress_file(original, staged, encoding, level)
+            if stored > max_size:
+                return None
+            self.client.upload_file(staged, self.bucket, self.key(sha256, encoding))
+            return stored
+        finally:
+            for path in (original, staged):
+                if os.path.exists(path):
+                    os.unlink(path)
+
+    def discard(self, sha256: str, encoding: Optional[str]) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(sha256, encoding))
+
+    def delete(self, sha256: str) -> None:
+        keys = [{"Key": self.key(sha256, encoding)} for encoding in (None, *SUFFIXES)]
+        self.client.delete_objects(Bucket=self.bucket, Delete={"Objects": keys, "Quiet": True})
+
+    def iter_blobs(self):
+        paginator = self.client.get_paginator("list_objects_v2")
+        last = None
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get("Contents", []):
+                # keys are listed in order, so variants of a blob are adjacent
+                sha256 = obj["Key"].rsplit("/", 1)[-1][:64]
+                if sha256 != last:
+                    last = sha256
+                    yield sha256, obj["LastModified"].timestamp()
+
+    def iter_stale_staging(self, older_than: float):
+        return _stale_files(self.staging_dir, older_than)
+
+
+_store = None
+
+
+def get_blobstore():
+    global _store
+    if _store is None:
+        if BLOB_BACKEND == "s3":
+            _store = S3BlobStore(S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL)
+        else:
+            _store = LocalBlobStore(BLOB_ROOT)
+    return _store
+
+
+# Stream an upload into the blob store; the caller records the reference with
+# acquire(..., saved.path) in the same transaction as the row that points at it.
+async def store_upload(upload: UploadFile) -> SavedFile:
+    store = get_blobstore()
+    saved = await save_upload(upload, store.staging_path())
+    await run_in_threadpool(store.put, saved.path, saved.sha256)
+    return saved
+
+
+# `staged`: the upload's staging file, still there when put() found the blob
+# already stored. Once the row is written (and so locked until our commit) a GC
+# run can no longer delete the file; one that did so after put() has committed
+# by now, and the blob is restored from the staged copy.
+def acquire(db: Session, sha256: str, size: int, staged: Optional[str] = None) -> None:
+    # put() leaves an uploaded blob uncompressed even if an older copy was not
+    updated = db.execute(update(Blob).where(Blob.sha256 == sha256).values(refcount=Blob.refcount + 1, encoding=None, stored_size=None, compacted_at=None)).rowcount
+    if not updated:
+        try:
+            with db.begin_nested():
+                db.add(Blob(sha256=sha256, size=size, refcount=1))
+        except IntegrityError:
+            # another request registered the same content first
+            db.execute(update(Blob).where(Blob.sha256 == sha256).values(refcount=Blob.refcount + 1))
+    if staged and os.path.exists(staged):
+        store = get_blobstore()
+        if store.exists(sha256):
+            os.unlink(staged)
+        else:
+            logging.warning("Blob %s was collected while being uploaded again; restoring it", sha256)
+            store.put(staged, sha256)
+
+
+def release(db: Session, sha256: str) -> None:
+    db.execute(update(Blob).where(Blob.sha256 == sha256).values(refcount=Blob.refcount - 1))
+
+
+def blob_response(request: Request, sha256: Optional[str], filename: str, media_type: Optional[str] = None, legacy_path: Optional[str] = None):
+    if not sha256:
+        # rows written before the blob store existed point at a plain file
+        if not legacy_path:
+            raise HTTPException(status_code=404, detail="File missing")
+        return file_response(request, legacy_path, filename, media_type)
+    store = get_blobstore()
+    path = store.local_path(sha256)
+    if path is not None:
+        return file_response(request, path, filename, media_type)
+    try:
+        size = store.size(sha256)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File missing")
+    # content-addressed: the hash itself is a strong validator
+    return ranged_response(request, size, f'"{sha256}"', filename, lambda start, end: store.open_range(sha256, start, end), media_type)
+
+
+# (size, reader) for a stored file, reader() yielding its bytes in chunks; None
+# when the file is missing. Blocking: call from a worker thread.
+def open_stored(sha256: Optional[str], legacy_path: Optional[str] = None):
+    if not sha256:
+        if legacy_path and os.path.exists(legacy_path):
+            return os.path.getsize(legacy_path), lambda: iter_file(legacy_path)
+        return None
+    store = get_blobstore()
+    try:
+        size = store.size(sha256)
+    except FileNotFoundError:
+        return None
+    return size, lambda: store.open_range(sha256)
+
+
+def recount(db: Session) -> None:
+    submissions = select(func.count()).where(Submission.blob_sha256 == Blob.sha256).scalar_subquery()
+    attachments = select(func.count()).where(Assignment.attachment_sha256 == Blob.sha256).scalar_subquery()
+    db.execute(update(Blob).values(refcount=submissions + attachments))
+    db.commit()
+
+
+# Remove unreferenced blobs. Blobs, orphan objects (stored but never committed)
+# and staging leftovers younger than `grace` are kept, so uploads in flight are
+# never collected.
+def collect_garbage(db: Session, grace: timedelta = timedelta(hours=24), dry_run: bool = False, recount_refs: bool = False) -> dict:
+    store = get_blobstore()
+    if recount_refs and not dry_run:
+        recount(db)
+    cutoff = datetime.utcnow() - grace
+    cutoff_ts = time.time() - grace.total_seconds()
+    stats = {"blobs_deleted": 0, "orphans_deleted": 0, "staging_deleted": 0, "bytes_freed": 0}
+
+    rows = db.execute(select(Blob.sha256, func.coalesce(Blob.stored_size, Blob.size)).where(Blob.refcount <= 0, Blob.created_at < cutoff)).all()
+    for sha256, size in rows:
+        if dry_run:
+            stats["blobs_deleted"] += 1
+            stats["bytes_freed"] += size
+            continue
+        # conditional delete: skip blobs re-acquired since the SELECT. The file
+        # goes before the commit, while the row is locked: a concurrent
+        # acquire() of the same content waits for us, then restores the file
+        if db.execute(delete(Blob).where(Blob.sha256 == sha256, Blob.refcount <= 0)).rowcount:
+            try:
+                store.delete(sha256)
+            except Exception:
+                db.rollback()
+                raise
+            db.commit()
+            stats["blobs_deleted"] += 1
+            stats["bytes_freed"] += size
+
+    known = set(db.execute(select(Blob.sha256)).scalars())
+    for sha256, mtime in list(store.iter_blobs()):
+        if sha256 in known or mtime >= cutoff_ts:
+            continue
+        stats["orphans_deleted"] += 1
+        if not dry_run:
+            stats["bytes_freed"] += store.size(sha256)
+            store.delete(sha256)
+
+    for path in list(store.iter_stale_staging(cutoff_ts)):
+        stats["staging_deleted"] += 1
+        if not dry_run:
+            os.unlink(path)
+    logging.info("Blob GC%s: %s", " (dry run)" if dry_run else "", stats)
+    return stats
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _adopt(db: Session, path: str) -> Optional[str]:
+    if not os.path.exists(path):
+        return None
+    store = get_blobstore()
+    sha256 = _hash_file(path)
+    size = os.path.getsize(path)
+    staged = store.staging_path()
+    shutil.copyfile(path, staged)
+    store.put(staged, sha256)
+    acquire(db, sha256, size, staged)
+    return sha256
+
+
+# Move files written before the blob store existed (plain names under
+# SUBMIT_DIR/ATTACH_DIR) into it. Originals are removed once the row commits.
+def adopt_legacy_files(db: Session, submit_dir: str, attach_dir: str) -> dict:
+    stats = {"submissions": 0, "assignments": 0}
+    for sub in db.execute(select(Submission).where(Submission.blob_sha256.is_(None))).scalars().all():
+        path = os.path.join(submit_dir, sub.file_name)
+        sub.blob_sha256 = _adopt(db, path)
+        if sub.blob_sha256:
+            db.commit()
+            os.unlink(path)
+            stats["submissions"] += 1
+    query = select(Assignment).where(Assignment.attachment_sha256.is_(None), Assignment.attachment_filename.is_not(None))
+    for a in db.execute(query).scalars().all():
+        path = os.path.join(attach_dir, a.attachment_filename)
+        a.attachment_sha256 = _adopt(db, path)
+        if a.attachment_sha256:
+            db.commit()
+            os.unlink(path)
+            stats["assignments"] += 1
+    return stats
@@ -1,19 +1,430 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import InterfaceError, OperationalError, ProgrammingError
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from fastapi import Request, Response
+from contextlib import asynccontextmanager, contextmanager
+import asyncio
+import functools
+import itertools
+import logging
 import os
+import re
+import threading
+import time
+from .metrics import instrument_engine
+from .utils.cache import TTLCache
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./backend.db")
-connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
 
-engine = create_engine(DATABASE_URL, echo=False, future=True, connect_args=connect_args)
+# Requests use an AsyncEngine; migrations and the scripts in tools/ use a sync
+# engine on the same database. DATABASE_URL may name either kind of driver, the
+# other one is derived from it (psycopg 3 serves both modes).
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+SYNC_DRIVERS = {
+    "sqlite+aiosqlite": "sqlite",
+    "postgresql+asyncpg": "postgresql+psycopg",
+}
+
+def _with_driver(url: str, mapping: dict) -> str:
+    parsed = make_url(url)
+    driver = mapping.get(parsed.drivername)
+    return parsed.set(drivername=driver).render_as_string(hide_password=False) if driver else url
+
+ASYNC_DATABASE_URL = _with_driver(DATABASE_URL, ASYNC_DRIVERS)
+SYNC_DATABASE_URL = _with_driver(DATABASE_URL, SYNC_DRIVERS)
+
+# Pool sizing is per process: with N uvicorn workers the database sees up to
+# N * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections per engine.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1").lower() in ("1", "true", "yes")
+
+# WAL lets readers proceed while a write is in progress, busy_timeout makes a
+# writer wait for the lock instead of failing with "database is locked", and
+# synchronous=NORMAL is durable across application crashes in WAL mode.
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+
+IS_SQLITE = make_url(SYNC_DATABASE_URL).get_backend_name() == "sqlite"
+IN_MEMORY = IS_SQLITE and make_url(SYNC_DATABASE_URL).database in (None, "", ":memory:")
+
+
+# Records how long checkouts wait for a free connection; the pool's own
+# counters only describe its current state.
+class _WaitTimedPool:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._wait_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            with self._wait_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._wait_lock:
+                self.checkouts += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+
+class TimedQueuePool(_WaitTimedPool, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_WaitTimedPool, AsyncAdaptedQueuePool):
+    pass
+
+
+def _pool_options(poolclass) -> dict:
+    if IN_MEMORY:
+        # each connection would get its own empty database; keep SQLAlchemy's default
+        return {}
+    return {
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def _sqlite_pragmas(dbapi_conn, record):
+    cursor = dbapi_conn.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.close()
+
+
+connect_args = {"check_same_thread": False} if IS_SQLITE else {}
+
+engine = create_engine(SYNC_DATABASE_URL, echo=False, future=True, connect_args=connect_args, **_pool_options(TimedQueuePool))
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, future=True)
 
+async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False, **_pool_options(TimedAsyncQueuePool))
+if IS_SQLITE:
+    event.listen(engine, "connect", _sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _sqlite_pragmas)
+# statement count/time, per request and overall (GET /metrics)
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+# expire_on_commit=False: handlers return ORM objects after commit and an async
+# session cannot lazily reload expired attributes during serialization
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
 class Base(DeclarativeBase):
     pass
 
-def get_db():
-    db = SessionLocal()
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_LOCK_KEY = 0x706C6174  # pg_advisory_lock key
+
+_REVISION_LINE = re.compile(r"^(revision|down_revision)\b[^=]*=(.*)$", re.M)
+
+# The head is the revision no other revision names as down_revision, read from
+# the `revision = ...` lines of migrations/versions so the check at startup does
+# not load Alembic. Works for any id (`--rev-id 0007` or Alembic's hex ids).
+@functools.lru_cache(maxsize=None)
+def head_revision() -> str:
+    revisions, parents = set(), set()
+    versions = os.path.join(MIGRATIONS_DIR, "versions")
+    for name in os.listdir(versions):
+        if not name.endswith(".py"):
+            continue
+        with open(os.path.join(versions, name), encoding="utf-8") as f:
+            for key, value in _REVISION_LINE.findall(f.read()):
+                ids = re.findall(r"[\"']([^\"']+)[\"']", value)
+                (revisions if key == "revision" else parents).update(ids)
+    heads = revisions - parents
+    if len(heads) != 1:
+        raise RuntimeError(f"Expected one migration head, found {sorted(heads)}: merge them with `alembic merge`")
+    return heads.pop()
+
+def current_revision():
     try:
-        yield db
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT version_num FROM alembic_version")).scalar()
+    except (OperationalError, ProgrammingError):
+        return None  # no alembic_version table yet
+
+# Several workers starting together must not run the same DDL concurrently.
+@contextmanager
+def _migration_lock():
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        return
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+    if not IS_SQLITE or IN_MEMORY or fcntl is None:
+        yield
+        return
+    with open(make_url(SYNC_DATABASE_URL).database + ".migrate.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def run_migrations() -> bool:
+    # Bring the schema to the latest Alembic revision (backend/migrations).
+    # Databases created by the old create_all() are adopted by revision 0001.
+    # Returns whether anything had to be applied; at head this is one SELECT.
+    try:
+        if current_revision() == head_revision():
+            return False
+        with _migration_lock():
+            # another process may have upgraded while we waited
+            if current_revision() == head_revision():
+                return False
+            from alembic import command
+            from alembic.config import Config
+            cfg = Config(os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini"))
+            cfg.attributes["configure_logger"] = False
+            command.upgrade(cfg, "head")
+            return True
     finally:
-        db.close()
+        # no pooled connections survive into forked workers (preload mode); an
+        # in-memory database lives only as long as its connection
+        if not IN_MEMORY:
+            engine.dispose()
+
+# INSERT construct with ON CONFLICT support for the configured backend
+def dialect_insert(dialect_name: str):
+    from sqlalchemy.dialects import postgresql, sqlite
+    return {"postgresql": postgresql.insert, "sqlite": sqlite.insert}[dialect_name]
+
+def pool_stats(eng) -> dict:
+    pool = eng.pool
+    stats = {"class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "max_overflow": DB_MAX_OVERFLOW,
+            "timeout_seconds": DB_POOL_TIMEOUT,
+        })
+    if isinstance(pool, _WaitTimedPool):
+        stats.update({
+            "checkouts": pool.checkouts,
+            "checkout_timeouts": pool.timeouts,
+            "wait_ms_avg": round(pool.wait_total * 1000 / pool.checkouts, 3) if pool.checkouts else None,
+            "wait_ms_max": round(pool.wait_max * 1000, 3),
+        })
+    return stats
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# Read replicas (optional). DATABASE_REPLICA_URLS is a comma-separated list of
+# copies of DATABASE_URL: PostgreSQL streaming replicas, or SQLite files for
+# local testing. GET endpoints that only read take their session from
+# get_read_db, which uses the healthy replicas in turn and falls back to the
+# primary when there is none. A replica leaves the rotation when a query on it
+# fails with a connection/database error or its health check (every
+# REPLICA_CHECK_INTERVAL seconds while the app runs) fails, finds an older
+# schema or more than REPLICA_MAX_LAG seconds of replication lag; it returns
+# with the next passing check.
+DATABASE_REPLICA_URLS = [u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "5"))
+REPLICA_CHECK_TIMEOUT = float(os.getenv("REPLICA_CHECK_TIMEOUT", "2"))
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "30"))
+# read-your-writes: after a client's own upload or grade its reads go to the
+# primary for this long (keep it above the usual replication lag)
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+READ_PRIMARY_COOKIE = "read_primary_until"
+
+# seconds behind the primary; 0 when every received WAL record is applied (an
+# idle primary would otherwise look like a growing lag)
+_PG_LAG = """SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"""
+
+
+def _sqlite_replica_pragmas(dbapi_conn, record):
+    # read-only sessions; journal_mode is the primary's business
+    cursor = dbapi_conn.cursor()
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA query_only=1")
+    cursor.close()
+
+
+class Replica:
+    def __init__(self, url: str):
+        parsed = make_url(_with_driver(url, ASYNC_DRIVERS))
+        self.name = parsed.render_as_string(hide_password=True)
+        self.backend = parsed.get_backend_name()
+        # a hot standby refuses writes anyway; this also covers a plain copy
+        args = {"server_settings": {"default_transaction_read_only": "on"}} if parsed.drivername == "postgresql+asyncpg" else {}
+        self.engine = create_async_engine(parsed, echo=False, connect_args=args, **_pool_options(TimedAsyncQueuePool))
+        if self.backend == "sqlite":
+            event.listen(self.engine.sync_engine, "connect", _sqlite_replica_pragmas)
+        instrument_engine(self.engine.sync_engine)
+        self.sessionmaker = async_sessionmaker(bind=self.engine, autoflush=False, expire_on_commit=False, info={"replica": self.name})
+        self.healthy = True  # until a check or a query says otherwise
+        self.lag = None
+        self.error = None
+        self.checked_at = None
+        self.reads = 0
+        self.failures = 0
+
+    def mark_down(self, error) -> None:
+        self.error = (str(error) or type(error).__name__).splitlines()[0][:200]
+        if self.healthy:
+            logging.warning("Read replica %s out of rotation: %s", self.name, self.error)
+        self.healthy = False
+        self.failures += 1
+
+    async def check(self) -> None:
+        try:
+            async with self.engine.connect() as conn:
+                revision = (await asyncio.wait_for(conn.execute(text("SELECT version_num FROM alembic_version")), REPLICA_CHECK_TIMEOUT)).scalar()
+                lag = 0.0
+                if self.backend == "postgresql":
+                    lag = float((await asyncio.wait_for(conn.execute(text(_PG_LAG)), REPLICA_CHECK_TIMEOUT)).scalar())
+        except Exception as e:
+            self.mark_down(e)
+            return
+        finally:
+            self.checked_at = time.time()
+        self.lag = lag
+        if revision != head_revision():
+            self.mark_down(f"schema at revision {revision}, expected {head_revision()}")
+        elif lag > REPLICA_MAX_LAG:
+            self.mark_down(f"replication lag {lag:.1f}s")
+        else:
+            if not self.healthy:
+                logging.info("Read replica %s back in rotation", self.name)
+            self.healthy, self.error = True, None
+
+    def stats(self) -> dict:
+        return {"healthy": self.healthy, "lag_seconds": self.lag, "error": self.error, "checked_at": self.checked_at,
+                "reads": self.reads, "failures": self.failures, "pool": pool_stats(self.engine.sync_engine)}
+
+
+class ReplicaSet:
+    def __init__(self, urls: list[str]):
+        self.replicas = [Replica(u) for u in urls]
+        self._turn = itertools.count()
+        self._task = None
+        self.primary_reads = 0
+        self.sticky_reads = 0
+
+    def pick(self):
+        healthy = [r for r in self.replicas if r.healthy]
+        return healthy[next(self._turn) % len(healthy)] if healthy else None
+
+    async def check(self) -> None:
+        await asyncio.gather(*(r.check() for r in self.replicas))
+
+    async def start(self) -> None:
+        if self.replicas:
+            await self.check()
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(REPLICA_CHECK_INTERVAL)
+            try:
+                await self.check()
+            except Exception:
+                logging.exception("Read replica health check failed")
+
+    def stats(self) -> dict:
+        return {"replicas": {r.name: r.stats() for r in self.replicas}, "primary_reads": self.primary_reads,
+                "sticky_reads": self.sticky_reads, "read_your_writes_seconds": READ_YOUR_WRITES_SECONDS}
+
+
+replicas = ReplicaSet(DATABASE_REPLICA_URLS)
+# bearer token -> True for READ_YOUR_WRITES_SECONDS after that client's write;
+# the cookie carries the same window to the other workers/instances
+_recent_writers = TTLCache(maxsize=10000, ttl=READ_YOUR_WRITES_SECONDS)
+
+
+# Call from a write endpoint after its commit (uploads and grades).
+def mark_write(request: Request, response: Response) -> None:
+    if not replicas.replicas or READ_YOUR_WRITES_SECONDS <= 0:
+        return
+    token = request.headers.get("authorization")
+    if token:
+        _recent_writers.set(token, True)
+    until = time.time() + READ_YOUR_WRITES_SECONDS
+    response.set_cookie(READ_PRIMARY_COOKIE, f"{until:.0f}", max_age=int(READ_YOUR_WRITES_SECONDS) + 1, httponly=True, samesite="lax")
+
+
+def _reads_own_writes(request: Request) -> bool:
+    token = request.headers.get("authorization")
+    if token and _recent_writers.get(token):
+        return True
+    try:
+        return float(request.cookies.get(READ_PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def is_replica(db: AsyncSession) -> bool:
+    return "replica" in db.info
+
+
+# A read session routed like get_read_db, for code outside the endpoint's own
+# dependencies (the user lookup in deps.get_current_user).
+@asynccontextmanager
+async def read_session(request: Request):
+    sticky = bool(replicas.replicas) and _reads_own_writes(request)
+    replica = None if sticky else replicas.pick()
+    if replica is None:
+        if sticky:
+            replicas.sticky_reads += 1
+        else:
+            replicas.primary_reads += 1
+        async with AsyncSessionLocal() as db:
+            yield db
+        return
+    replica.reads += 1
+    async with replica.sessionmaker() as db:
+        try:
+            yield db
+        except (OperationalError, InterfaceError) as e:
+            # this request fails; the following ones go elsewhere
+            replica.mark_down(e)
+            raise
+
+
+async def get_read_db(request: Request):
+    async with read_session(request) as db:
+        yield db
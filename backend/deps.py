@@ -1,27 +1,96 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from .database import get_db
+from sqlalchemy import event, inspect, select
+from dataclasses import dataclass
+import os
+import time
+from .database import AsyncSessionLocal, is_replica, read_session
 from .models import User, ROLE_STUDENT, ROLE_TEACHER, ROLE_PARENT
-from .utils.security import decode_token
+from .utils.cache import TTLCache
+from .utils.security import decode_claims
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 ROLE_ALL = {ROLE_STUDENT, ROLE_TEACHER, ROLE_PARENT}
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
-    email = decode_token(token)
-    if not email:
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+
+# What endpoints get as `user`: the columns they read, detached from any session
+# so it can be cached across requests. Attribute names match models.User.
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    email: str
+    role: str
+    name: str
+
+# token -> decoded claims (skips signature checks for tokens seen recently)
+token_cache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+# token subject (email) -> Principal (skips the users lookup)
+principal_cache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+
+def _claims(token: str):
+    claims = token_cache.get(token)
+    if claims is None:
+        claims = decode_claims(token)
+        if not claims or not claims.get("sub"):
+            return None
+        # never cache a token past its own expiry
+        remaining = claims.get("exp", time.time() + AUTH_CACHE_TTL) - time.time()
+        token_cache.set(token, claims, ttl=min(AUTH_CACHE_TTL, max(remaining, 0)))
+    return claims
+
+async def _find_user(request: Request, email: str):
+    # Own short session, so auth adds no primary session to read endpoints: GET
+    # routes look the user up like get_read_db, on a replica when there is one.
+    # A user registered moments ago may not be there yet; the primary confirms.
+    query = select(User).where(User.email == email)
+    if request.method in ("GET", "HEAD"):
+        async with read_session(request) as db:
+            user = (await db.execute(query)).scalar_one_or_none()
+            if user is not None or not is_replica(db):
+                return user
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(query)).scalar_one_or_none()
+
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme)) -> Principal:
+    claims = _claims(token)
+    if not claims:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid authentication")
-    user = db.query(User).filter(User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
-    return user
+    email = claims["sub"]
+    if {"uid", "role", "name"} <= claims.keys():
+        # token issued with JWT_EMBED_CLAIMS: no database round trip at all
+        return Principal(id=claims["uid"], email=email, role=claims["role"], name=claims["name"])
+    principal = principal_cache.get(email)
+    if principal is None:
+        user = await _find_user(request, email)
+        if not user:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+        principal = Principal(id=user.id, email=user.email, role=user.role, name=user.name)
+        principal_cache.set(email, principal)
+    return principal
 
 def require_role(required: str):
-    def checker(user: User = Depends(get_current_user)):
+    def checker(user: Principal = Depends(get_current_user)):
         if user.role != required:
             raise HTTPException(status_code=403, detail="Insufficient role")
         return user
     return checker
 
+# Call whenever a user's email, role or name changes (or the user is deleted).
+# ORM updates/deletes of User rows trigger it automatically; caches are per
+# process, so other workers pick the change up within AUTH_CACHE_TTL.
+def invalidate_user(email: str) -> None:
+    principal_cache.pop(email)
+    token_cache.discard_where(lambda claims: claims.get("sub") == email)
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _user_changed(mapper, connection, target):
+    history = inspect(target).attrs.email.history
+    for email in {target.email, *(history.deleted or ())}:
+        invalidate_user(email)
+
+def auth_cache_stats() -> dict:
+    return {"tokens": token_cache.stats(), "principals": principal_cache.stats()}
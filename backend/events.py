@@ -0,0 +1,191 @@
+from typing import Iterable, Optional
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+import uuid
+
+# Pub/sub for the /events stream. Handlers publish after committing; each open
+# stream holds a Subscription to the channels its user may see:
+#
+#   course:{id}    assignment.created               (everyone in the course)
+#   student:{id}   submission.uploaded/graded,      (the student, their parents)
+#                  enrollment.added
+#   teacher:{id}   submission.uploaded/graded,      (the teacher)
+#                  course.created
+#
+# The default broker only reaches streams served by the same process. With
+# several uvicorn workers/replicas set EVENTS_BROKER_URL=redis://... so an event
+# published by one worker reaches subscribers on all of them.
+EVENTS_BROKER_URL = os.getenv("EVENTS_BROKER_URL")
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+
+# event ids are unique across processes; a stream skips one it already sent
+# (an event can reach a subscriber through two of its channels). The prefix is
+# drawn per process: workers forked from a preload master share its imports
+_prefix = (None, "")
+_ids = itertools.count(1)
+stats = {"published": 0, "delivered": 0, "dropped": 0}
+
+
+def course_channel(course_id: int) -> str:
+    return f"course:{course_id}"
+
+
+def student_channel(student_id: int) -> str:
+    return f"student:{student_id}"
+
+
+def teacher_channel(teacher_id: int) -> str:
+    return f"teacher:{teacher_id}"
+
+
+class Subscription:
+    def __init__(self, broker, channels: Iterable[str]):
+        self.broker = broker
+        self.channels = set(channels)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+        # set when events had to be dropped for a slow reader; the stream tells
+        # the client to refetch instead of silently skipping them
+        self.overflowed = False
+
+    def deliver(self, event: dict) -> None:
+        try:
+            self.queue.put_nowait(event)
+            stats["delivered"] += 1
+        except asyncio.QueueFull:
+            self.overflowed = True
+            stats["dropped"] += 1
+
+    async def get(self, timeout: float) -> Optional[dict]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def add(self, channel: str) -> None:
+        if channel not in self.channels:
+            self.channels.add(channel)
+            await self.broker._add(self, channel)
+
+    async def close(self) -> None:
+        await self.broker._remove(self)
+
+
+class LocalBroker:
+    def __init__(self):
+        self._channels: dict[str, set[Subscription]] = {}
+
+    async def subscribe(self, channels: Iterable[str]) -> Subscription:
+        sub = Subscription(self, channels)
+        for channel in sub.channels:
+            self._channels.setdefault(channel, set()).add(sub)
+        return sub
+
+    async def publish(self, channel: str, event: dict) -> None:
+        for sub in list(self._channels.get(channel, ())):
+            sub.deliver(event)
+
+    async def _add(self, sub: Subscription, channel: str) -> None:
+        self._channels.setdefault(channel, set()).add(sub)
+
+    async def _remove(self, sub: Subscription) -> None:
+        for channel in sub.channels:
+            subs = self._channels.get(channel)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._channels[channel]
+
+    def subscriber_count(self) -> int:
+        return len({s for subs in self._channels.values() for s in subs})
+
+
+# Multi-worker broker over Redis pub/sub (pip install redis). Each process keeps
+# one Redis subscription per channel in use and fans messages out to its local
+# streams through an embedded LocalBroker.
+class RedisBroker:
+    def __init__(self, url: str):
+        try:
+            from redis import asyncio as aioredis
+        except ImportError as e:
+            raise RuntimeError("EVENTS_BROKER_URL requires redis (pip install redis)") from e
+        self.client = aioredis.from_url(url)
+        self.local = LocalBroker()
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+
+    async def _ensure_reader(self):
+        if self._pubsub is None:
+            self._pubsub = self.client.pubsub()
+            # a pubsub needs one subscription before listen() returns messages
+            await self._pubsub.subscribe("events:keepalive")
+            self._reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        async for message in self._pubsub.listen():
+            if message["type"] != "message":
+                continue
+            channel = message["channel"].decode().removeprefix("events:")
+            try:
+                await self.local.publish(channel, json.loads(message["data"]))
+            except Exception:
+                logging.exception("Dropping malformed event on %s", channel)
+
+    async def subscribe(self, channels: Iterable[str]) -> Subscription:
+        await self._ensure_reader()
+        sub = await self.local.subscribe(channels)
+        sub.broker = self
+        await self._pubsub.subscribe(*(f"events:{c}" for c in sub.channels))
+        return sub
+
+    async def publish(self, channel: str, event: dict) -> None:
+        await self.client.publish(f"events:{channel}", json.dumps(event, default=str))
+
+    async def _add(self, sub: Subscription, channel: str) -> None:
+        await self.local._add(sub, channel)
+        await self._pubsub.subscribe(f"events:{channel}")
+
+    async def _remove(self, sub: Subscription) -> None:
+        await self.local._remove(sub)
+        unused = [f"events:{c}" for c in sub.channels if c not in self.local._channels]
+        if unused:
+            await self._pubsub.unsubscribe(*unused)
+
+    def subscriber_count(self) -> int:
+        return self.local.subscriber_count()
+
+
+broker = RedisBroker(EVENTS_BROKER_URL) if EVENTS_BROKER_URL else LocalBroker()
+
+
+def _process_prefix() -> str:
+    global _prefix
+    if _prefix[0] != os.getpid():
+        _prefix = (os.getpid(), uuid.uuid4().hex[:8])
+    return _prefix[1]
+
+
+# Called once per process at startup (main.lifespan) with the worker count.
+def configure(workers: int) -> None:
+    if workers > 1 and isinstance(broker, LocalBroker):
+        logging.error("EVENTS_BROKER_URL is not set with %d workers: events only reach streams held by the worker that "
+                      "published them", workers)
+
+
+# Fire-and-forget from the request handlers, after the commit: a broker problem
+# must not turn a saved upload or grade into an error response.
+async def publish(event_type: str, channels: Iterable[str], **data) -> None:
+    event = {"id": f"{_process_prefix()}-{next(_ids)}", "type": event_type, "ts": time.time(), **data}
+    stats["published"] += 1
+    for channel in dict.fromkeys(channels):
+        try:
+            await broker.publish(channel, event)
+        except Exception:
+            logging.exception("Failed to publish %s on %s", event_type, channel)
+
+
+def event_stats() -> dict:
+    return {"broker": type(broker).__name__, "subscribers": broker.subscriber_count(), **stats}
@@ -0,0 +1,40 @@
+# Preload mode: the master imports the app, applies migrations and loads the
+# lazily imported libraries once, then forks the workers from it.
+#   gunicorn -c backend/gunicorn_conf.py backend.main:app
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+# Response cache counters and the SSE broker live in-process unless
+# RESPONSE_CACHE_URL / EVENTS_BROKER_URL point at Redis, so one worker per CPU
+# is only the default once both are shared; otherwise a single worker.
+_UNSHARED = {
+    "RESPONSE_CACHE_URL": "the response cache is disabled",
+    "EVENTS_BROKER_URL": "SSE events only reach streams held by the worker that published them",
+}
+_missing = [name for name in _UNSHARED if not os.getenv(name)]
+workers = int(os.getenv("WEB_CONCURRENCY", "1" if _missing else str(max(2, multiprocessing.cpu_count()))))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+
+
+def on_starting(server):
+    if server.cfg.workers > 1:
+        for name in _missing:
+            server.log.error("%d workers without %s: %s", server.cfg.workers, name, _UNSHARED[name])
+    from backend.main import preload
+    preload()
+
+
+def post_fork(server, worker):
+    # the lifespan checks its in-process state against the real worker count
+    from backend import settings
+    settings.WORKERS = server.cfg.workers
+    # connections opened by the master must not be shared with the children
+    from backend.database import engine, async_engine, replicas
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+    for replica in replicas.replicas:
+        replica.engine.sync_engine.dispose(close=False)
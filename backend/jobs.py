@@ -0,0 +1,283 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, update, delete, func
+from typing import Awaitable, Callable, Optional
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+import time
+from .database import SessionLocal
+from .models import BackgroundJob
+
+# Background jobs run after the request that created them has committed and
+# answered. Handlers are registered by name with @handler and receive the job
+# payload; raising makes the job retry with exponential backoff (plus jitter)
+# until JOBS_MAX_ATTEMPTS, after which its on_failure hook runs.
+#
+#   JOBS_BACKEND=memory    asyncio queue inside the API process (default); jobs
+#                          pending at shutdown are lost, handlers recover them
+#                          from row state on the next start
+#   JOBS_BACKEND=database  `jobs` table polled by the workers; survives restarts
+#                          and lets `python -m backend.tools.run_jobs` process
+#                          jobs outside the API (set JOBS_WORKERS=0 there)
+JOBS_BACKEND = os.getenv("JOBS_BACKEND", "memory")
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "2"))
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "5"))
+JOBS_RETRY_BASE = float(os.getenv("JOBS_RETRY_BASE", "2"))
+JOBS_RETRY_MAX = float(os.getenv("JOBS_RETRY_MAX", "300"))
+JOBS_POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", "1"))
+# a `running` database job older than this is assumed lost with its worker
+JOBS_LEASE = float(os.getenv("JOBS_LEASE", "600"))
+
+
+@dataclass
+class Handler:
+    fn: Callable[..., Awaitable[None]]
+    on_failure: Optional[Callable[..., Awaitable[None]]] = None
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    payload: dict
+    attempts: int = 0
+
+
+@dataclass
+class KindStats:
+    succeeded: int = 0
+    retried: int = 0
+    failed: int = 0
+    seconds_total: float = 0.0
+    seconds_max: float = 0.0
+    errors: list = field(default_factory=list)
+
+
+handlers: dict[str, Handler] = {}
+
+
+def handler(kind: str, on_failure: Optional[Callable[..., Awaitable[None]]] = None):
+    def register(fn):
+        handlers[kind] = Handler(fn, on_failure)
+        return fn
+    return register
+
+
+def backoff(attempts: int) -> float:
+    delay = min(JOBS_RETRY_BASE * 2 ** (attempts - 1), JOBS_RETRY_MAX)
+    return delay * random.uniform(0.5, 1.0)
+
+
+class MemoryQueue:
+    durable = False
+
+    def __init__(self):
+        self._ready: Optional[asyncio.Queue] = None
+        self._delayed: list = []  # heap of (run_at, seq, job)
+        self._seq = itertools.count()
+        self._ids = itertools.count(1)
+
+    async def start(self) -> None:
+        # bound to the serving loop, not the importing one
+        if self._ready is None:
+            self._ready = asyncio.Queue()
+
+    async def put(self, kind: str, payload: dict) -> None:
+        await self.start()
+        self._ready.put_nowait(Job(id=str(next(self._ids)), kind=kind, payload=payload))
+
+    async def get(self, timeout: float) -> Optional[Job]:
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            self._ready.put_nowait(heapq.heappop(self._delayed)[2])
+        if self._delayed:
+            timeout = min(timeout, self._delayed[0][0] - now)
+        try:
+            job = await asyncio.wait_for(self._ready.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        job.attempts += 1
+        return job
+
+    async def done(self, job: Job) -> None:
+        pass
+
+    async def retry(self, job: Job, delay: float, error: str) -> None:
+        heapq.heappush(self._delayed, (time.monotonic() + delay, next(self._seq), job))
+
+    async def fail(self, job: Job, error: str) -> None:
+        pass
+
+    async def depth(self) -> dict:
+        return {"ready": self._ready.qsize() if self._ready else 0, "delayed": len(self._delayed)}
+
+
+class DatabaseQueue:
+    durable = True
+
+    async def start(self) -> None:
+        await run_in_threadpool(self._reclaim)
+
+    def _reclaim(self) -> None:
+        expired = datetime.utcnow() - timedelta(seconds=JOBS_LEASE)
+        with SessionLocal() as db:
+            count = db.execute(update(BackgroundJob).where(BackgroundJob.status == "running", BackgroundJob.locked_at < expired)
+                               .values(status="queued", run_at=datetime.utcnow())).rowcount
+            db.commit()
+        if count:
+            logging.warning("Re-queued %d background jobs whose worker stopped", count)
+
+    async def put(self, kind: str, payload: dict) -> None:
+        await run_in_threadpool(self.insert, kind, payload)
+
+    def insert(self, kind: str, payload: dict) -> None:
+        with SessionLocal() as db:
+            now = datetime.utcnow()
+            db.add(BackgroundJob(kind=kind, payload=json.dumps(payload), status="queued", attempts=0, run_at=now, created_at=now))
+            db.commit()
+
+    async def get(self, timeout: float) -> Optional[Job]:
+        job = await run_in_threadpool(self._claim)
+        if job is None:
+            await asyncio.sleep(timeout)
+        return job
+
+    def _claim(self) -> Optional[Job]:
+        with SessionLocal() as db:
+            now = datetime.utcnow()
+            row = db.execute(select(BackgroundJob.id, BackgroundJob.kind, BackgroundJob.payload, BackgroundJob.attempts)
+                             .where(BackgroundJob.status == "queued", BackgroundJob.run_at <= now)
+                             .order_by(BackgroundJob.run_at, BackgroundJob.id).limit(1)).first()
+            if row is None:
+                return None
+            # conditional update: of several workers polling the same row only one wins
+            claimed = db.execute(update(BackgroundJob).where(BackgroundJob.id == row.id, BackgroundJob.status == "queued")
+                                 .values(status="running", locked_at=now, attempts=BackgroundJob.attempts + 1)).rowcount
+            db.commit()
+            if not claimed:
+                return None
+            return Job(id=str(row.id), kind=row.kind, payload=json.loads(row.payload), attempts=row.attempts + 1)
+
+    async def done(self, job: Job) -> None:
+        await run_in_threadpool(self._finish, job, delete(BackgroundJob).where(BackgroundJob.id == int(job.id)))
+
+    async def retry(self, job: Job, delay: float, error: str) -> None:
+        stmt = update(BackgroundJob).where(BackgroundJob.id == int(job.id)).values(
+            status="queued", run_at=datetime.utcnow() + timedelta(seconds=delay), locked_at=None, last_error=error)
+        await run_in_threadpool(self._finish, job, stmt)
+
+    async def fail(self, job: Job, error: str) -> None:
+        # failed rows are kept for inspection
+        stmt = update(BackgroundJob).where(BackgroundJob.id == int(job.id)).values(status="failed", locked_at=None, last_error=error)
+        await run_in_threadpool(self._finish, job, stmt)
+
+    def _finish(self, job: Job, stmt) -> None:
+        with SessionLocal() as db:
+            db.execute(stmt)
+            db.commit()
+
+    async def depth(self) -> dict:
+        return await run_in_threadpool(self._depth)
+
+    def _depth(self) -> dict:
+        with SessionLocal() as db:
+            rows = db.execute(select(BackgroundJob.status, func.count()).group_by(BackgroundJob.status)).all()
+        return {status: count for status, count in rows}
+
+
+class JobRunner:
+    def __init__(self, queue, workers: int):
+        self.queue = queue
+        self.workers = workers
+        self.running = 0
+        self.enqueued = 0
+        self.kinds: dict[str, KindStats] = {}
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self) -> None:
+        await self.queue.start()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _work(self) -> None:
+        while True:
+            try:
+                job = await self.queue.get(JOBS_POLL_INTERVAL)
+            except Exception:
+                logging.exception("Background job queue unavailable")
+                await asyncio.sleep(JOBS_POLL_INTERVAL)
+                continue
+            if job is not None:
+                await self.run(job)
+
+    async def run(self, job: Job) -> None:
+        entry = handlers.get(job.kind)
+        stats = self.kinds.setdefault(job.kind, KindStats())
+        if entry is None:
+            logging.error("No handler for background job %s", job.kind)
+            stats.failed += 1
+            await self.queue.fail(job, "no handler")
+            return
+        self.running += 1
+        start = time.perf_counter()
+        try:
+            await entry.fn(**job.payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"[:500]
+            stats.errors = (stats.errors + [error])[-5:]
+            if job.attempts < JOBS_MAX_ATTEMPTS:
+                delay = backoff(job.attempts)
+                logging.warning("Job %s %s failed (attempt %d), retrying in %.1fs: %s", job.kind, job.payload, job.attempts, delay, error)
+                stats.retried += 1
+                await self.queue.retry(job, delay, error)
+            else:
+                logging.exception("Job %s %s failed after %d attempts", job.kind, job.payload, job.attempts)
+                stats.failed += 1
+                await self.queue.fail(job, error)
+                if entry.on_failure:
+                    await entry.on_failure(error=error, **job.payload)
+        else:
+            stats.succeeded += 1
+            await self.queue.done(job)
+        finally:
+            self.running -= 1
+            elapsed = time.perf_counter() - start
+            stats.seconds_total += elapsed
+            stats.seconds_max = max(stats.seconds_max, elapsed)
+
+
+runner = JobRunner(DatabaseQueue() if JOBS_BACKEND == "database" else MemoryQueue(), JOBS_WORKERS)
+
+
+# Call after the commit that makes the payload's rows visible.
+async def enqueue(kind: str, **payload) -> None:
+    try:
+        await runner.queue.put(kind, payload)
+        runner.enqueued += 1
+    except Exception:
+        # the row keeps its pending state; see the recovery hooks of the handler
+        logging.exception("Failed to enqueue %s %s", kind, payload)
+
+
+async def job_stats() -> dict:
+    kinds = {}
+    for kind, s in runner.kinds.items():
+        runs = s.succeeded + s.retried + s.failed
+        kinds[kind] = {"succeeded": s.succeeded, "retried": s.retried, "failed": s.failed,
+                       "avg_seconds": round(s.seconds_total / runs, 4) if runs else None,
+                       "max_seconds": round(s.seconds_max, 4), "recent_errors": s.errors}
+    return {"backend": type(runner.queue).__name__, "workers": runner.workers, "running": runner.running,
+            "enqueued": runner.enqueued, "queue": await runner.queue.depth(), "kinds": kinds}
@@ -0,0 +1,73 @@
+from sqlalchemy import bindparam, case, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+from .database import dialect_insert
+from .models import LatestSubmission, Submission
+
+# Statements maintaining latest_submissions. They run in the same transaction
+# as the submissions row they describe, so the projection never disagrees with
+# a committed upload or grade; rebuild() recomputes it from scratch.
+
+# `submission` must be flushed (id and uploaded_at assigned). Two uploads racing
+# for the same pair both count as versions; the newer one becomes the latest.
+def record_upload(dialect_name: str, submission: Submission):
+    values = {
+        "assignment_id": submission.assignment_id,
+        "student_id": submission.student_id,
+        "submission_id": submission.id,
+        "uploaded_at": submission.uploaded_at,
+        "grade": submission.grade,
+        "graded_at": submission.graded_at,
+        "versions": 1,
+    }
+    stmt = dialect_insert(dialect_name)(LatestSubmission).values(**values)
+    newer = stmt.excluded.uploaded_at >= LatestSubmission.uploaded_at
+    return stmt.on_conflict_do_update(
+        index_elements=[LatestSubmission.assignment_id, LatestSubmission.student_id],
+        set_={
+            "submission_id": case((newer, stmt.excluded.submission_id), else_=LatestSubmission.submission_id),
+            "uploaded_at": case((newer, stmt.excluded.uploaded_at), else_=LatestSubmission.uploaded_at),
+            "grade": case((newer, stmt.excluded.grade), else_=LatestSubmission.grade),
+            "graded_at": case((newer, stmt.excluded.graded_at), else_=LatestSubmission.graded_at),
+            "versions": LatestSubmission.versions + 1,
+        },
+    )
+
+
+# grading an older version leaves the projection alone
+def record_grade(submission: Submission):
+    return (
+        update(LatestSubmission)
+        .where(LatestSubmission.submission_id == submission.id)
+        .values(grade=submission.grade, graded_at=submission.graded_at)
+    )
+
+
+# executemany form of record_grade; parameters: b_submission_id, b_grade, b_graded_at
+def record_grades():
+    table = LatestSubmission.__table__
+    return (
+        update(table)
+        .where(table.c.submission_id == bindparam("b_submission_id"))
+        .values(grade=bindparam("b_grade"), graded_at=bindparam("b_graded_at"))
+    )
+
+
+def rebuild(db: Session) -> int:
+    partition = (Submission.assignment_id, Submission.student_id)
+    newest_first = (Submission.uploaded_at.desc(), Submission.id.desc())
+    ranked = select(
+        Submission.assignment_id,
+        Submission.student_id,
+        Submission.id,
+        Submission.uploaded_at,
+        Submission.grade,
+        Submission.graded_at,
+        func.row_number().over(partition_by=partition, order_by=newest_first).label("rn"),
+        func.count().over(partition_by=partition).label("versions"),
+    ).where(Submission.uploaded_at.is_not(None)).subquery()
+    columns = ["assignment_id", "student_id", "submission_id", "uploaded_at", "grade", "graded_at", "versions"]
+    source = select(ranked.c.assignment_id, ranked.c.student_id, ranked.c.id, ranked.c.uploaded_at, ranked.c.grade, ranked.c.graded_at, ranked.c.versions).where(ranked.c.rn == 1)
+    db.execute(delete(LatestSubmission))
+    db.execute(insert(LatestSubmission).from_select(columns, source))
+    db.commit()
+    return db.execute(select(func.count()).select_from(LatestSubmission)).scalar()
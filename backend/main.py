@@ -1,26 +1,83 @@
 from fastapi import FastAPI
-from .database import engine, Base
+from fastapi.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+import logging
+import time
+from . import settings, response_cache
+from .database import run_migrations, replicas
 from .routers import auth, courses, assignments, submissions, reports
 from .routers import debug as debug_router
-import os
+from .routers import events
+from .routers import metrics as metrics_router
+from .utils.files import BodySizeLimitMiddleware
+from .utils.serialization import FastJSONResponse
+from .metrics import MetricsMiddleware
+from .utils.security import shutdown_hash_pool
+from .jobs import runner as job_runner
+from .processing import recover as recover_processing
+from .events import configure as configure_events
 
-# create tables
-Base.metadata.create_all(bind=engine)
+# Importing this module only builds the app; schema, storage folders and
+# workers are set up by the lifespan, once per process, when serving starts.
 
-app = FastAPI(title="Education Tasks API", version="0.1.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start = time.perf_counter()
+    if settings.RUN_MIGRATIONS:
+        # blocking DDL (or, at head, a single SELECT): keep it off the loop
+        await run_in_threadpool(run_migrations)
+    settings.prepare_storage()
+    response_cache.configure(settings.WORKERS)
+    configure_events(settings.WORKERS)
+    await job_runner.start()
+    await recover_processing()
+    # first health check of the read replicas, then one every REPLICA_CHECK_INTERVAL
+    await replicas.start()
+    app.state.startup_seconds = time.perf_counter() - start
+    logging.info("Startup completed in %.0f ms", app.state.startup_seconds * 1000)
+    try:
+        yield
+    finally:
+        await replicas.stop()
+        await job_runner.stop()
+        shutdown_hash_pool()
 
-# include routers
-app.include_router(auth.router)
-app.include_router(courses.router)
-app.include_router(assignments.router)
-app.include_router(submissions.router)
-app.include_router(reports.router)
-app.include_router(debug_router.router)
 
-@app.get("/")
-def root():
-    return {"message": "API running"}
+def create_app() -> FastAPI:
+    app = FastAPI(title="Education Tasks API", version="0.1.0", lifespan=lifespan, default_response_class=FastJSONResponse)
+    app.add_middleware(BodySizeLimitMiddleware)
+    # outermost, so rejected uploads are counted too
+    app.add_middleware(MetricsMiddleware)
 
-# ensure storage subfolders
-for folder in ["backend/storage/assignments", "backend/storage/submissions"]:
-    os.makedirs(folder, exist_ok=True)
+    # include routers
+    app.include_router(auth.router)
+    app.include_router(courses.router)
+    app.include_router(assignments.router)
+    app.include_router(submissions.router)
+    app.include_router(reports.router)
+    app.include_router(events.router)
+    app.include_router(debug_router.router)
+    app.include_router(metrics_router.router)
+
+    @app.get("/")
+    def root():
+        return {"message": "API running"}
+
+    return app
+
+
+# Preload mode (gunicorn --preload, see gunicorn_conf.py): runs once in the
+# master before it forks the workers, so they inherit the loaded modules and
+# start without touching the schema.
+def preload() -> None:
+    if settings.RUN_MIGRATIONS:
+        run_migrations()
+        settings.RUN_MIGRATIONS = False
+    settings.prepare_storage()
+    # what the app would otherwise import on first use
+    from .utils.security import pwd_context
+    pwd_context()
+    import jose.jwt, pypdf  # noqa: F401
+
+
+app = create_app()
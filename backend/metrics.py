@@ -0,0 +1,247 @@
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+import bisect
+import logging
+import math
+import os
+import threading
+import time
+
+# Prometheus text-format metrics (served at GET /metrics) and per-request SQL
+# accounting. Values are per process: with several uvicorn workers each one
+# exposes its own numbers, scrape them per worker/replica.
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+SLOW_REQUEST_QUERIES = int(os.getenv("SLOW_REQUEST_QUERIES", "50"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+_registry: list = []
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: dict = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.extend(self._samples(labels, value))
+        return lines
+
+    def _samples(self, labels, value) -> list[str]:
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value: float) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+
+# Gauge whose samples are read at scrape time from `collect()`, which returns
+# {label values tuple: value}; for state other modules already keep.
+class CallbackGauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str], collect: Callable[[], dict]):
+        super().__init__(name, help, labelnames)
+        self.collect = collect
+
+    def render(self) -> list[str]:
+        try:
+            self._values = self.collect()
+        except Exception:
+            logging.exception("Metrics: collecting %s failed", self.name)
+            self._values = {}
+        return super().render()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, *labels, value: float) -> None:
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # per-bucket (non-cumulative) counts, sum, count
+                state = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self, labels, state) -> list[str]:
+        counts, total, count = state
+        names = self.labelnames + ("le",)
+        lines, cumulative = [], 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            lines.append(f"{self.name}_bucket{_labels(names, labels + (_number(bound),))} {cumulative}")
+        lines.append(f"{self.name}_bucket{_labels(names, labels + ('+Inf',))} {count}")
+        lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+        lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+def render() -> str:
+    return "\n".join(line for metric in _registry for line in metric.render()) + "\n"
+
+
+REQUESTS = Counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+LATENCY = Histogram("http_request_duration_seconds", "Time until the last response byte was sent", ("method", "route"))
+IN_FLIGHT = Gauge("http_requests_in_flight", "Requests being served (including open event streams)")
+RESPONSE_SIZE = Histogram("http_response_size_bytes", "Response body size", ("method", "route"), SIZE_BUCKETS)
+BYTES_RECEIVED = Counter("http_request_bytes_total", "Request body bytes received (uploads)", ("route",))
+BYTES_SENT = Counter("http_response_bytes_total", "Response body bytes sent (downloads)", ("route",))
+REQUEST_QUERIES = Histogram("http_request_db_queries", "SQL statements executed per request", ("route",), COUNT_BUCKETS)
+REQUEST_DB_TIME = Histogram("http_request_db_seconds", "Time spent in SQL per request", ("route",))
+DB_QUERIES = Counter("db_queries_total", "SQL statements executed, in and outside requests")
+DB_TIME = Counter("db_query_seconds_total", "Time spent executing SQL statements")
+PASSWORD_HASH_TIME = Histogram("password_hash_seconds", "bcrypt hash/verify time, queueing included", ("operation",), (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+SLOW_REQUESTS = Counter("http_slow_requests_total", "Requests over SLOW_REQUEST_MS or SLOW_REQUEST_QUERIES", ("route",))
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    db_seconds: float = 0.0
+    slowest_seconds: float = 0.0
+    slowest_statement: Optional[str] = None
+
+
+# Set by the middleware for the duration of a request. Worker threads started
+# with run_in_threadpool copy the context, so statements run there (sync
+# sessions, run_sync) count towards the request as well.
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["metrics_start"].pop()
+    DB_QUERIES.inc()
+    DB_TIME.inc(amount=elapsed)
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+        if elapsed >= stats.slowest_seconds:
+            stats.slowest_seconds = elapsed
+            stats.slowest_statement = statement
+
+
+def instrument_engine(engine) -> None:
+    from sqlalchemy import event
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _route(scope) -> str:
+    route = scope.get("route")
+    # unmatched paths share one label so scanners cannot blow up cardinality
+    return getattr(route, "path", None) or "<unmatched>"
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = RequestStats()
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        status, sent, received, streaming = 500, 0, 0, False
+
+        async def counting_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            nonlocal status, sent, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                streaming = any(k == b"content-type" and v.startswith(b"text/event-stream") for k, v in message.get("headers", ()))
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        IN_FLIGHT.inc()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            IN_FLIGHT.dec()
+            current_request.reset(token)
+            self._record(scope, stats, time.perf_counter() - start, status, sent, received, streaming)
+
+    def _record(self, scope, stats: RequestStats, elapsed: float, status: int, sent: int, received: int, streaming: bool):
+        method, route = scope["method"], _route(scope)
+        REQUESTS.inc(method, route, str(status))
+        BYTES_RECEIVED.inc(route, amount=received)
+        BYTES_SENT.inc(route, amount=sent)
+        REQUEST_QUERIES.observe(route, value=stats.queries)
+        REQUEST_DB_TIME.observe(route, value=stats.db_seconds)
+        if streaming:
+            # an event stream lasts as long as the client stays: not latency
+            return
+        LATENCY.observe(method, route, value=elapsed)
+        RESPONSE_SIZE.observe(method, route, value=sent)
+        if elapsed * 1000 >= SLOW_REQUEST_MS or stats.queries >= SLOW_REQUEST_QUERIES:
+            SLOW_REQUESTS.inc(route)
+            slowest = " ".join((stats.slowest_statement or "").split())[:300]
+            logging.warning("Slow request %s %s: %.0f ms, %d queries (%.0f ms in SQL), slowest %.1f ms: %s",
+                            method, route, elapsed * 1000, stats.queries, stats.db_seconds * 1000, stats.slowest_seconds * 1000, slowest)
@@ -0,0 +1,37 @@
+from logging.config import fileConfig
+from alembic import context
+from backend.database import engine, Base
+from backend import models  # noqa: F401  (registers the tables on Base.metadata)
+
+config = context.config
+
+# The app runs migrations in-process (database.run_migrations) and keeps its own
+# logging setup; only the alembic CLI configures logging from alembic.ini.
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def _configure(**kwargs):
+    # SQLite cannot ALTER constraints in place; batch mode rebuilds the table
+    context.configure(target_metadata=target_metadata, render_as_batch=engine.dialect.name == "sqlite", **kwargs)
+
+
+def run_migrations_offline():
+    _configure(url=engine.url.render_as_string(hide_password=False), literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    with engine.connect() as connection:
+        _configure(connection=connection)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
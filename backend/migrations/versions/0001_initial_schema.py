@@ -0,0 +1,109 @@
+"""initial schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+
+Databases created before migrations existed were built by
+Base.metadata.create_all; tables that are already there are left alone and
+only the blob columns added later are filled in.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _tables():
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def _columns(table):
+    return {c["name"] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade():
+    existing = _tables()
+    if "users" not in existing:
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("name", sa.String(100), nullable=False),
+            sa.Column("email", sa.String(200), nullable=False),
+            sa.Column("hashed_password", sa.String(255), nullable=False),
+            sa.Column("role", sa.String(20), nullable=False),
+        )
+        op.create_index("ix_users_id", "users", ["id"])
+        op.create_index("ix_users_email", "users", ["email"], unique=True)
+    if "courses" not in existing:
+        op.create_table(
+            "courses",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("name", sa.String(150), nullable=False),
+            sa.Column("teacher_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        )
+        op.create_index("ix_courses_id", "courses", ["id"])
+    if "course_students" not in existing:
+        op.create_table(
+            "course_students",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("course_id", sa.Integer(), sa.ForeignKey("courses.id"), nullable=False),
+            sa.Column("student_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        )
+    if "parent_child" not in existing:
+        op.create_table(
+            "parent_child",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("parent_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("child_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        )
+    if "blobs" not in existing:
+        op.create_table(
+            "blobs",
+            sa.Column("sha256", sa.String(64), primary_key=True),
+            sa.Column("size", sa.Integer(), nullable=False),
+            sa.Column("refcount", sa.Integer(), nullable=False),
+            sa.Column("created_at", sa.DateTime()),
+        )
+    if "assignments" not in existing:
+        op.create_table(
+            "assignments",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("course_id", sa.Integer(), sa.ForeignKey("courses.id"), nullable=False),
+            sa.Column("teacher_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("title", sa.String(200), nullable=False),
+            sa.Column("description", sa.Text()),
+            sa.Column("due_date", sa.DateTime(), nullable=False),
+            sa.Column("attachment_filename", sa.String(255)),
+            sa.Column("attachment_sha256", sa.String(64), sa.ForeignKey("blobs.sha256")),
+            sa.Column("created_at", sa.DateTime()),
+        )
+        op.create_index("ix_assignments_id", "assignments", ["id"])
+    elif "attachment_sha256" not in _columns("assignments"):
+        with op.batch_alter_table("assignments") as batch:
+            batch.add_column(sa.Column("attachment_sha256", sa.String(64), sa.ForeignKey("blobs.sha256", name="fk_assignments_attachment_sha256")))
+    if "submissions" not in existing:
+        op.create_table(
+            "submissions",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("assignment_id", sa.Integer(), sa.ForeignKey("assignments.id"), nullable=False),
+            sa.Column("student_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("uploaded_at", sa.DateTime()),
+            sa.Column("file_name", sa.String(255), nullable=False),
+            sa.Column("blob_sha256", sa.String(64), sa.ForeignKey("blobs.sha256")),
+            sa.Column("grade", sa.Integer()),
+            sa.Column("comment", sa.Text()),
+            sa.Column("graded_at", sa.DateTime()),
+        )
+        op.create_index("ix_submissions_id", "submissions", ["id"])
+    elif "blob_sha256" not in _columns("submissions"):
+        with op.batch_alter_table("submissions") as batch:
+            batch.add_column(sa.Column("blob_sha256", sa.String(64), sa.ForeignKey("blobs.sha256", name="fk_submissions_blob_sha256")))
+
+
+def downgrade():
+    for table in ("submissions", "assignments", "blobs", "parent_child", "course_students", "courses", "users"):
+        op.drop_table(table)
@@ -0,0 +1,50 @@
+"""indexes for the hot filter paths
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+
+Every router filters submissions by (assignment_id, student_id) ordered by
+uploaded_at, enrollment by (course_id, student_id), parent links by
+(parent_id, child_id) and assignments by course/teacher. Enrollment and
+parent links also become unique; existing duplicates are removed first,
+keeping the oldest row.
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_submissions_assignment_student_uploaded", "submissions", ["assignment_id", "student_id", "uploaded_at"], False),
+    ("ix_submissions_student_assignment_uploaded", "submissions", ["student_id", "assignment_id", "uploaded_at"], False),
+    ("ix_submissions_blob_sha256", "submissions", ["blob_sha256"], False),
+    ("uq_course_students_course_student", "course_students", ["course_id", "student_id"], True),
+    ("ix_course_students_student_course", "course_students", ["student_id", "course_id"], False),
+    ("uq_parent_child_parent_child", "parent_child", ["parent_id", "child_id"], True),
+    ("ix_parent_child_child", "parent_child", ["child_id"], False),
+    ("ix_assignments_course_teacher", "assignments", ["course_id", "teacher_id"], False),
+    ("ix_assignments_teacher_course", "assignments", ["teacher_id", "course_id"], False),
+    ("ix_assignments_attachment_sha256", "assignments", ["attachment_sha256"], False),
+    ("ix_courses_teacher_id", "courses", ["teacher_id"], False),
+]
+
+
+def upgrade():
+    op.execute(
+        "DELETE FROM course_students WHERE id NOT IN "
+        "(SELECT MIN(id) FROM course_students GROUP BY course_id, student_id)"
+    )
+    op.execute(
+        "DELETE FROM parent_child WHERE id NOT IN "
+        "(SELECT MIN(id) FROM parent_child GROUP BY parent_id, child_id)"
+    )
+    for name, table, columns, unique in INDEXES:
+        op.create_index(name, table, columns, unique=unique)
+
+
+def downgrade():
+    for name, table, _, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
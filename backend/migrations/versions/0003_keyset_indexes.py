@@ -0,0 +1,31 @@
+"""indexes matching the keyset pagination order
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+
+Paginated listings walk assignments of a course by (due_date, id) and the
+submissions of an assignment by (uploaded_at, id); with these indexes each
+page is a range scan instead of a sort of the whole course/assignment.
+"""
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_assignments_course_due", "assignments", ["course_id", "due_date", "id"]),
+    ("ix_submissions_assignment_uploaded", "submissions", ["assignment_id", "uploaded_at", "id"]),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,45 @@
+"""latest_submissions projection
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+
+One row per (assignment, student) holding the newest submission, its grade
+and the number of versions. Filled here from the existing submissions; the
+API keeps it current afterwards (backend/latest_submissions.py).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "latest_submissions",
+        sa.Column("assignment_id", sa.Integer(), sa.ForeignKey("assignments.id"), primary_key=True),
+        sa.Column("student_id", sa.Integer(), sa.ForeignKey("users.id"), primary_key=True),
+        sa.Column("submission_id", sa.Integer(), sa.ForeignKey("submissions.id"), nullable=False),
+        sa.Column("uploaded_at", sa.DateTime(), nullable=False),
+        sa.Column("grade", sa.Integer(), nullable=True),
+        sa.Column("graded_at", sa.DateTime(), nullable=True),
+        sa.Column("versions", sa.Integer(), nullable=False),
+    )
+    op.create_index("ix_latest_submissions_student_assignment", "latest_submissions", ["student_id", "assignment_id"])
+    op.execute(
+        "INSERT INTO latest_submissions (assignment_id, student_id, submission_id, uploaded_at, grade, graded_at, versions) "
+        "SELECT assignment_id, student_id, id, uploaded_at, grade, graded_at, versions FROM ("
+        " SELECT id, assignment_id, student_id, uploaded_at, grade, graded_at,"
+        "  ROW_NUMBER() OVER (PARTITION BY assignment_id, student_id ORDER BY uploaded_at DESC, id DESC) AS rn,"
+        "  COUNT(*) OVER (PARTITION BY assignment_id, student_id) AS versions"
+        " FROM submissions WHERE uploaded_at IS NOT NULL"
+        ") ranked WHERE rn = 1"
+    )
+
+
+def downgrade():
+    op.drop_index("ix_latest_submissions_student_assignment", table_name="latest_submissions")
+    op.drop_table("latest_submissions")
@@ -0,0 +1,55 @@
+"""background processing of uploads
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+
+Processing state on submissions/assignments, what processing learned about
+each blob, and the `jobs` table used by JOBS_BACKEND=database. Rows uploaded
+before this revision keep processing_status NULL (not processed).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ("submissions", "assignments"):
+        op.add_column(table, sa.Column("processing_status", sa.String(20), nullable=True))
+        op.add_column(table, sa.Column("processing_error", sa.String(500), nullable=True))
+        op.add_column(table, sa.Column("page_count", sa.Integer(), nullable=True))
+    op.add_column("blobs", sa.Column("content_type", sa.String(100), nullable=True))
+    op.add_column("blobs", sa.Column("page_count", sa.Integer(), nullable=True))
+    op.add_column("blobs", sa.Column("text", sa.Text(), nullable=True))
+    op.add_column("blobs", sa.Column("thumbnail", sa.LargeBinary(), nullable=True))
+    op.add_column("blobs", sa.Column("processed_at", sa.DateTime(), nullable=True))
+    op.create_table(
+        "jobs",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("kind", sa.String(50), nullable=False),
+        sa.Column("payload", sa.Text(), nullable=False),
+        sa.Column("status", sa.String(20), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("run_at", sa.DateTime(), nullable=False),
+        sa.Column("locked_at", sa.DateTime(), nullable=True),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_jobs_status_run_at", "jobs", ["status", "run_at"])
+
+
+def downgrade():
+    op.drop_index("ix_jobs_status_run_at", table_name="jobs")
+    op.drop_table("jobs")
+    # batch mode: SQLite cannot drop columns in place
+    with op.batch_alter_table("blobs") as batch:
+        for column in ("processed_at", "thumbnail", "text", "page_count", "content_type"):
+            batch.drop_column(column)
+    for table in ("assignments", "submissions"):
+        with op.batch_alter_table(table) as batch:
+            for column in ("page_count", "processing_error", "processing_status"):
+                batch.drop_column(column)
@@ -0,0 +1,33 @@
+"""storage lifecycle: compressed blobs and purged versions
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+
+Bookkeeping for the storage lifecycle job: how each blob is stored at rest
+(encoding, stored_size, compacted_at) and which submission versions had their
+file removed by the retention policy (purged_at).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("blobs", sa.Column("encoding", sa.String(8), nullable=True))
+    op.add_column("blobs", sa.Column("stored_size", sa.Integer(), nullable=True))
+    op.add_column("blobs", sa.Column("compacted_at", sa.DateTime(), nullable=True))
+    op.add_column("submissions", sa.Column("purged_at", sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    # batch mode: SQLite cannot drop columns in place
+    with op.batch_alter_table("submissions") as batch:
+        batch.drop_column("purged_at")
+    with op.batch_alter_table("blobs") as batch:
+        for column in ("compacted_at", "stored_size", "encoding"):
+            batch.drop_column(column)
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Index, LargeBinary
+from sqlalchemy.orm import relationship, deferred
 from datetime import datetime
 from .database import Base
 
@@ -7,6 +7,15 @@ ROLE_STUDENT = "student"
 ROLE_TEACHER = "teacher"
 ROLE_PARENT = "parent"
 
+# processing_status of uploaded files (see processing.py); NULL for rows without
+# a file or written before background processing existed
+PROCESSING_PENDING = "pending"
+PROCESSING_RUNNING = "processing"
+PROCESSING_READY = "ready"
+PROCESSING_INVALID = "invalid"
+PROCESSING_CORRUPT = "corrupt"
+PROCESSING_FAILED = "failed"
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
@@ -25,14 +34,20 @@ class Course(Base):
     __tablename__ = "courses"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(150), nullable=False)
-    teacher_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    teacher_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
 
     teacher = relationship("User", back_populates="courses_taught")
     students = relationship("CourseStudent", back_populates="course", cascade="all, delete-orphan")
     assignments = relationship("Assignment", back_populates="course", cascade="all, delete-orphan")
 
+# Indexes below mirror the filters used by the routers; they are created by the
+# Alembic migrations in backend/migrations, keep both in sync.
 class CourseStudent(Base):
     __tablename__ = "course_students"
+    __table_args__ = (
+        Index("uq_course_students_course_student", "course_id", "student_id", unique=True),
+        Index("ix_course_students_student_course", "student_id", "course_id"),
+    )
     id = Column(Integer, primary_key=True)
     course_id = Column(Integer, ForeignKey("courses.id"), nullable=False)
     student_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -42,6 +57,10 @@ class CourseStudent(Base):
 
 class ParentChild(Base):
     __tablename__ = "parent_child"
+    __table_args__ = (
+        Index("uq_parent_child_parent_child", "parent_id", "child_id", unique=True),
+        Index("ix_parent_child_child", "child_id"),
+    )
     id = Column(Integer, primary_key=True)
     parent_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     child_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -51,6 +70,11 @@ class ParentChild(Base):
 
 class Assignment(Base):
     __tablename__ = "assignments"
+    __table_args__ = (
+        Index("ix_assignments_course_teacher", "course_id", "teacher_id"),
+        Index("ix_assignments_teacher_course", "teacher_id", "course_id"),
+        Index("ix_assignments_course_due", "course_id", "due_date", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     course_id = Column(Integer, ForeignKey("courses.id"), nullable=False)
     teacher_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -58,7 +82,11 @@ class Assignment(Base):
     description = Column(Text, nullable=True)
     due_date = Column(DateTime, nullable=False)
     attachment_filename = Column(String(255), nullable=True)
+    attachment_sha256 = Column(String(64), ForeignKey("blobs.sha256"), nullable=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    processing_status = Column(String(20), nullable=True)
+    processing_error = Column(String(500), nullable=True)
+    page_count = Column(Integer, nullable=True)
 
     course = relationship("Course", back_populates="assignments")
     teacher = relationship("User")
@@ -66,14 +94,80 @@ class Assignment(Base):
 
 class Submission(Base):
     __tablename__ = "submissions"
+    __table_args__ = (
+        Index("ix_submissions_assignment_student_uploaded", "assignment_id", "student_id", "uploaded_at"),
+        Index("ix_submissions_student_assignment_uploaded", "student_id", "assignment_id", "uploaded_at"),
+        Index("ix_submissions_assignment_uploaded", "assignment_id", "uploaded_at", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     assignment_id = Column(Integer, ForeignKey("assignments.id"), nullable=False)
     student_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     uploaded_at = Column(DateTime, default=datetime.utcnow)
     file_name = Column(String(255), nullable=False)
+    blob_sha256 = Column(String(64), ForeignKey("blobs.sha256"), nullable=True, index=True)
     grade = Column(Integer, nullable=True)
     comment = Column(Text, nullable=True)
     graded_at = Column(DateTime, nullable=True)
+    processing_status = Column(String(20), nullable=True)
+    processing_error = Column(String(500), nullable=True)
+    page_count = Column(Integer, nullable=True)
+    # file removed by the retention policy; the row (grade, history) stays
+    purged_at = Column(DateTime, nullable=True)
 
     assignment = relationship("Assignment", back_populates="submissions")
     student = relationship("User", back_populates="submissions")
+
+# Newest version of every (assignment, student) pair with its grade, kept in
+# step with `submissions` by the upload and grade endpoints (see
+# latest_submissions.py), so reports read one row per pair instead of every
+# historical version.
+class LatestSubmission(Base):
+    __tablename__ = "latest_submissions"
+    __table_args__ = (
+        Index("ix_latest_submissions_student_assignment", "student_id", "assignment_id"),
+    )
+    assignment_id = Column(Integer, ForeignKey("assignments.id"), primary_key=True)
+    student_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    submission_id = Column(Integer, ForeignKey("submissions.id"), nullable=False)
+    uploaded_at = Column(DateTime, nullable=False)
+    grade = Column(Integer, nullable=True)
+    graded_at = Column(DateTime, nullable=True)
+    versions = Column(Integer, nullable=False, default=1)
+
+# Content-addressed file storage: identical bytes are stored once and shared by
+# every submission/assignment row pointing at the same hash (see blobstore.py).
+class Blob(Base):
+    __tablename__ = "blobs"
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(Integer, nullable=False)
+    refcount = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # what background processing learned about the content, shared by every
+    # row pointing at it; text and thumbnail are only loaded when asked for
+    content_type = Column(String(100), nullable=True)
+    page_count = Column(Integer, nullable=True)
+    text = deferred(Column(Text, nullable=True))
+    thumbnail = deferred(Column(LargeBinary, nullable=True))
+    processed_at = Column(DateTime, nullable=True)
+    # set by the storage lifecycle job (storage_lifecycle.py): compacted_at once
+    # it has looked at the blob, encoding/stored_size if it kept it compressed
+    encoding = Column(String(8), nullable=True)
+    stored_size = Column(Integer, nullable=True)
+    compacted_at = Column(DateTime, nullable=True)
+
+# Durable queue for JOBS_BACKEND=database (see jobs.py). Finished jobs are
+# deleted; failed ones stay with their last error.
+class BackgroundJob(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_status_run_at", "status", "run_at"),
+    )
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(50), nullable=False)
+    payload = Column(Text, nullable=False)
+    status = Column(String(20), nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    run_at = Column(DateTime, nullable=False)
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,176 @@
+from fastapi import HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+import logging
+import tempfile
+from .blobstore import get_blobstore, _hash_file
+from .database import SessionLocal
+from .events import publish, course_channel, student_channel, teacher_channel
+from .jobs import handler, enqueue, runner
+from .models import (Assignment, Blob, Submission, PROCESSING_PENDING, PROCESSING_RUNNING, PROCESSING_READY,
+                     PROCESSING_INVALID, PROCESSING_CORRUPT, PROCESSING_FAILED)
+from .response_cache import bump, course_scope, student_scope
+from .utils.pdf import InvalidPdf, looks_like_pdf, read_head, inspect_pdf, render_thumbnail
+
+# Work done on an uploaded file after the upload has been answered: checksum
+# verification of the stored bytes, PDF validation, page count, text extraction
+# and a first-page thumbnail. Results that only depend on the content are kept
+# on the blob, so a file uploaded again is verified but not parsed again; the
+# outcome is copied to the submission/assignment row (processing_status,
+# processing_error, page_count), which also bumps its cached responses and
+# publishes `submission.processed` / `assignment.processed`.
+PROCESS_UPLOAD = "process_upload"
+PDF = "application/pdf"
+
+_models = {"submission": Submission, "assignment": Assignment}
+
+
+async def enqueue_processing(table: str, row_id: int) -> None:
+    await enqueue(PROCESS_UPLOAD, table=table, id=row_id)
+
+
+def _sha256(row) -> Optional[str]:
+    return row.blob_sha256 if isinstance(row, Submission) else row.attachment_sha256
+
+
+@contextmanager
+def _local_copy(sha256: str):
+    store = get_blobstore()
+    path = store.local_path(sha256)
+    if path is not None:
+        yield path
+        return
+    with tempfile.NamedTemporaryFile(suffix=".blob") as tmp:
+        for chunk in store.open_range(sha256):
+            tmp.write(chunk)
+        tmp.flush()
+        yield tmp.name
+
+
+def _inspect(blob: Blob, path: str) -> None:
+    blob.content_type = "application/octet-stream"
+    if looks_like_pdf(read_head(path)):
+        try:
+            info = inspect_pdf(path)
+            blob.thumbnail = render_thumbnail(path)
+            blob.content_type = PDF
+            blob.page_count = info.page_count
+            blob.text = info.text
+        except InvalidPdf as e:
+            logging.info("Blob %s has a PDF header but cannot be read: %s", blob.sha256, e)
+    blob.processed_at = datetime.utcnow()
+
+
+def _outcome(row, blob: Blob, path: str) -> tuple[str, Optional[str]]:
+    if blob.content_type == PDF:
+        return PROCESSING_READY, None
+    # assignment attachments must be PDFs; submissions may be any file, but one
+    # claiming to be a PDF has to open as one
+    if isinstance(row, Assignment) or looks_like_pdf(read_head(path)):
+        return PROCESSING_INVALID, "File is not a readable PDF"
+    return PROCESSING_READY, None
+
+
+def _process(table: str, row_id: int) -> Optional[dict]:
+    model = _models[table]
+    with SessionLocal() as db:
+        row = db.get(model, row_id)
+        # deleted meanwhile, or already handled by an earlier copy of this job
+        if row is None or row.processing_status not in (PROCESSING_PENDING, PROCESSING_RUNNING):
+            return None
+        sha256 = _sha256(row)
+        row.processing_status = PROCESSING_RUNNING
+        db.commit()
+        blob = db.get(Blob, sha256)
+        with _local_copy(sha256) as path:
+            if _hash_file(path) != sha256:
+                status, error = PROCESSING_CORRUPT, "Stored file does not match its checksum"
+            else:
+                if blob.processed_at is None:
+                    _inspect(blob, path)
+                status, error = _outcome(row, blob, path)
+        row.processing_status = status
+        row.processing_error = error
+        row.page_count = blob.page_count if status == PROCESSING_READY else None
+        db.commit()
+        return _summary(table, row)
+
+
+def _mark_failed(table: str, row_id: int, error: str) -> Optional[dict]:
+    model = _models[table]
+    with SessionLocal() as db:
+        db.execute(update(model).where(model.id == row_id).values(processing_status=PROCESSING_FAILED, processing_error=error[:500]))
+        db.commit()
+        row = db.get(model, row_id)
+        return _summary(table, row) if row else None
+
+
+def _summary(table: str, row) -> dict:
+    if isinstance(row, Submission):
+        assignment = row.assignment
+        ids = {"submission_id": row.id, "assignment_id": assignment.id, "course_id": assignment.course_id,
+               "student_id": row.student_id, "teacher_id": assignment.teacher_id}
+    else:
+        ids = {"assignment_id": row.id, "course_id": row.course_id, "teacher_id": row.teacher_id}
+    return {"table": table, "status": row.processing_status, "page_count": row.page_count, **ids}
+
+
+async def _announce(summary: dict) -> None:
+    if summary["table"] == "submission":
+        await bump(course_scope(summary["course_id"]), student_scope(summary["student_id"]))
+        channels = [student_channel(summary["student_id"]), teacher_channel(summary["teacher_id"])]
+    else:
+        await bump(course_scope(summary["course_id"]))
+        channels = [course_channel(summary["course_id"])]
+    data = {k: v for k, v in summary.items() if k not in ("table", "teacher_id")}
+    await publish(f"{summary['table']}.processed", channels, **data)
+
+
+async def _failed(table: str, id: int, error: str) -> None:
+    summary = await run_in_threadpool(_mark_failed, table, id, error)
+    if summary:
+        await _announce(summary)
+
+
+@handler(PROCESS_UPLOAD, on_failure=_failed)
+async def process_upload(table: str, id: int) -> None:
+    summary = await run_in_threadpool(_process, table, id)
+    if summary:
+        await _announce(summary)
+
+
+def _unfinished() -> list[tuple[str, int]]:
+    pending = (PROCESSING_PENDING, PROCESSING_RUNNING)
+    with SessionLocal() as db:
+        return [(table, row_id) for table, model in _models.items()
+                for row_id in db.execute(select(model.id).where(model.processing_status.in_(pending)).order_by(model.id)).scalars()]
+
+
+# Re-enqueue rows left pending or half-processed. Run at startup for the
+# in-memory queue, whose jobs die with the process; a durable queue still holds
+# them, unless `force` (rows whose enqueue failed; duplicates are harmless).
+async def recover(force: bool = False) -> int:
+    if runner.queue.durable and not force:
+        return 0
+    rows = await run_in_threadpool(_unfinished)
+    for table, row_id in rows:
+        await enqueue_processing(table, row_id)
+    if rows:
+        logging.info("Re-enqueued processing for %d uploads", len(rows))
+    return len(rows)
+
+
+async def thumbnail_response(request: Request, db: AsyncSession, sha256: Optional[str]) -> Response:
+    thumbnail = (await db.execute(select(Blob.thumbnail).where(Blob.sha256 == sha256))).scalar() if sha256 else None
+    if thumbnail is None:
+        raise HTTPException(status_code=404, detail="Thumbnail not available")
+    # derived from content-addressed bytes: never changes for a given hash
+    etag = f'"{sha256}-thumb"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=86400"}
+    if etag in [t.strip().removeprefix("W/") for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=thumbnail, media_type="image/png", headers=headers)
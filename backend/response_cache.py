@@ -0,0 +1,225 @@
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from typing import Any, Awaitable, Callable, Optional
+import functools
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from .utils.cache import TTLCache
+
+# Cache for the read endpoints the client polls. Every cacheable response is
+# tied to version counters ("scopes") that writers bump after committing:
+#
+#   courses          course created, enrollment changed (course lists)
+#   course:{id}      assignment created, submission uploaded or graded, enrollment
+#   student:{id}     that student's submissions, grades or enrollments
+#
+# The ETag is a hash of the cache key (route + user) and the current versions,
+# so a poll is answered from the counters alone: 304 when the client already
+# has that ETag, the stored body when this process rendered it before, and
+# only otherwise the handler runs. The counters live in-process by default,
+# which is only correct with a single API process; with several uvicorn
+# workers/replicas set RESPONSE_CACHE_URL=redis://... so they share counters
+# (and rendered bodies). Without it the cache switches itself off when more
+# than one worker is configured (configure(), settings.WORKERS), and local
+# ETags still expire after RESPONSE_CACHE_LOCAL_MAX_AGE seconds in case other
+# processes write that this one does not know about.
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE", "1").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL")
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2000"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "300"))
+RESPONSE_CACHE_LOCAL_MAX_AGE = float(os.getenv("RESPONSE_CACHE_LOCAL_MAX_AGE", "60"))
+# A body rendered from a read replica may predate the bump that produced its
+# versions (replication lag), so it is only reused within a window of this many
+# seconds instead of until the next bump.
+REPLICA_CACHE_SECONDS = float(os.getenv("REPLICA_CACHE_SECONDS", "10"))
+
+COURSES = "courses"
+
+
+def course_scope(course_id: int) -> str:
+    return f"course:{course_id}"
+
+
+def student_scope(student_id: int) -> str:
+    return f"student:{student_id}"
+
+
+class LocalVersionStore:
+    def __init__(self):
+        self._versions: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._pid = None
+
+    # Counters restart at 0 with the process: a fresh epoch keeps ETags issued
+    # before a restart from matching again. It is drawn per process (not at
+    # import, which a preload master does once for all its workers), and the
+    # time window caps how long a 304 can rest on these counters alone.
+    @property
+    def epoch(self) -> str:
+        if self._pid != os.getpid():
+            self._pid, self._id = os.getpid(), uuid.uuid4().hex
+        return f"{self._id}:{int(time.time() // max(RESPONSE_CACHE_LOCAL_MAX_AGE, 1))}"
+
+    async def get(self, scopes) -> list[int]:
+        return [self._versions.get(s, 0) for s in scopes]
+
+    async def bump(self, scopes) -> None:
+        with self._lock:
+            for s in scopes:
+                self._versions[s] = self._versions.get(s, 0) + 1
+
+    async def get_body(self, key: str):
+        return None
+
+    async def set_body(self, key: str, value: bytes) -> None:
+        pass
+
+
+# Shared backend; needs `pip install redis`. Rendered bodies are kept there too
+# so one worker's render serves the others.
+class RedisVersionStore:
+    def __init__(self, url: str):
+        try:
+            from redis import asyncio as aioredis
+        except ImportError as e:
+            raise RuntimeError("RESPONSE_CACHE_URL requires redis (pip install redis)") from e
+        self.client = aioredis.from_url(url)
+        self.epoch = ""  # counters outlive API restarts; see _epoch()
+
+    async def _epoch(self) -> str:
+        if not self.epoch:
+            await self.client.set("rc:epoch", uuid.uuid4().hex, nx=True)
+            self.epoch = (await self.client.get("rc:epoch")).decode()
+        return self.epoch
+
+    async def get(self, scopes) -> list[int]:
+        await self._epoch()
+        values = await self.client.mget([f"rc:v:{s}" for s in scopes])
+        return [int(v) if v else 0 for v in values]
+
+    async def bump(self, scopes) -> None:
+        async with self.client.pipeline(transaction=False) as pipe:
+            for s in scopes:
+                pipe.incr(f"rc:v:{s}")
+            await pipe.execute()
+
+    async def get_body(self, key: str):
+        return await self.client.get(f"rc:b:{key}")
+
+    async def set_body(self, key: str, value: bytes) -> None:
+        await self.client.set(f"rc:b:{key}", value, ex=int(RESPONSE_CACHE_TTL))
+
+
+store = RedisVersionStore(RESPONSE_CACHE_URL) if RESPONSE_CACHE_URL else LocalVersionStore()
+bodies = TTLCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+_adapter = functools.lru_cache(maxsize=None)(TypeAdapter)
+stats = {"not_modified": 0, "hits": 0, "renders": 0, "bumps": 0}
+enabled = RESPONSE_CACHE_ENABLED
+
+
+# Called once per process at startup (main.lifespan) with the worker count.
+def configure(workers: int) -> None:
+    global enabled
+    enabled = RESPONSE_CACHE_ENABLED
+    if enabled and workers > 1 and isinstance(store, LocalVersionStore):
+        logging.warning("Response cache disabled: %d workers without RESPONSE_CACHE_URL would serve stale data", workers)
+        enabled = False
+
+
+async def bump(*scopes: str) -> None:
+    # call after the commit; a failing shared backend must not fail the write,
+    # but stale ETags could then be served until the bodies expire
+    scopes = [s for s in dict.fromkeys(scopes) if s]
+    if not scopes:
+        return
+    stats["bumps"] += 1
+    try:
+        await store.bump(scopes)
+    except Exception:
+        logging.exception("Response cache: failed to bump %s", scopes)
+        bodies.clear()
+
+
+def _etag(key: str, scopes, versions) -> str:
+    raw = "|".join([store.epoch, key, *(f"{s}={v}" for s, v in zip(scopes, versions))])
+    return f'W/"{hashlib.sha1(raw.encode()).hexdigest()[:20]}"'
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    return bool(header) and etag in [t.strip() for t in header.split(",")]
+
+
+def _split(stored: bytes):
+    # stored as <headers>\n<body> so cursors of paginated lists are kept
+    head, _, body = stored.partition(b"\n")
+    headers = dict(h.split("=", 1) for h in head.decode().split("\t") if h)
+    return headers, body
+
+
+def _join(headers: dict, body: bytes) -> bytes:
+    return "\t".join(f"{k}={v}" for k, v in headers.items()).encode() + b"\n" + body
+
+
+# Serve `render(response)` for `key` with ETag/304 handling. `render` receives a
+# Response whose headers are stored with the body (X-Next-Cursor, Link) and
+# returns the content, serialized with `model` like a response_model would.
+# `replica`: render reads from a replica session (database.is_replica).
+async def cached_response(request: Request, key: str, scopes: list[str], model: Any, render: Callable[[Response], Awaitable[Any]], replica: bool = False) -> Response:
+    holder = Response()
+    if replica:
+        key = f"{key}|replica:{int(time.time() // max(REPLICA_CACHE_SECONDS, 1))}"
+    if not enabled:
+        content = await render(holder)
+        return _response(_serialize(model, content), _passthrough(holder), None)
+    versions = await store.get(scopes)
+    etag = _etag(key, scopes, versions)
+    if _not_modified(request, etag):
+        stats["not_modified"] += 1
+        return Response(status_code=304, headers={"ETag": etag})
+    stored = bodies.get(etag)
+    if stored is None:
+        stored = await store.get_body(etag)
+        if stored is not None:
+            bodies.set(etag, stored)
+    if stored is not None:
+        stats["hits"] += 1
+        headers, body = _split(stored)
+        return _response(body, headers, etag)
+    stats["renders"] += 1
+    content = await render(holder)
+    body = _serialize(model, content)
+    headers = _passthrough(holder)
+    stored = _join(headers, body)
+    bodies.set(etag, stored)
+    await store.set_body(etag, stored)
+    return _response(body, headers, etag)
+
+
+def _serialize(model, content) -> bytes:
+    if isinstance(content, bytes):
+        # already encoded by the route (columns-only fast path)
+        return content
+    adapter = _adapter(model)
+    return adapter.dump_json(adapter.validate_python(content, from_attributes=True))
+
+
+def _passthrough(holder: Response) -> dict:
+    return {k: v for k, v in holder.headers.items() if k in ("x-next-cursor", "link")}
+
+
+def _response(body: bytes, headers: dict, etag: Optional[str]) -> Response:
+    headers = dict(headers)
+    if etag:
+        headers["ETag"] = etag
+        # clients may keep the body but must revalidate before using it
+        headers["Cache-Control"] = "private, no-cache"
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def cache_stats() -> dict:
+    return {"enabled": enabled, "backend": type(store).__name__, **stats, "bodies": bodies.stats()}
@@ -1,84 +1,115 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 import os
-from ..database import get_db
-from ..models import Assignment, Course, CourseStudent, Submission, User, ROLE_TEACHER, ROLE_STUDENT
+from ..database import get_db, get_read_db, is_replica, mark_write
+from ..models import Assignment, Course, CourseStudent, Submission, User, ROLE_TEACHER, ROLE_STUDENT, PROCESSING_PENDING
 from ..schemas import AssignmentCreate, AssignmentRead
 from ..deps import get_current_user, require_role
-import tempfile
+from ..blobstore import store_upload, acquire, blob_response
+from ..utils.pagination import Page, page_params, paginate
+from ..utils.serialization import schema_columns, row_dicts, dumps
+from ..utils.cache import TTLCache
+from ..response_cache import cached_response, bump, course_scope
+from ..events import publish, course_channel
+from ..processing import enqueue_processing, thumbnail_response
+from ..utils.pdf import PDF_HEADER_WINDOW, looks_like_pdf
+from .. import settings
 import logging
 
-# Primary attachments directory inside the project
-DEFAULT_ATTACH_DIR = os.path.join("backend", "storage", "assignments")
-
-# Try to create the primary directory. If permissions prevent that (e.g. a mounted
-# volume owned by root), fall back to a writable temp location so the API remains
-# functional instead of failing at import-time.
-try:
-    os.makedirs(DEFAULT_ATTACH_DIR, exist_ok=True)
-    ATTACH_DIR = DEFAULT_ATTACH_DIR
-except PermissionError:
-    fallback = os.path.join(tempfile.gettempdir(), "plataforma_storage", "assignments")
-    try:
-        os.makedirs(fallback, exist_ok=True)
-        ATTACH_DIR = fallback
-        logging.warning("Permission denied creating %s; using fallback %s", DEFAULT_ATTACH_DIR, ATTACH_DIR)
-    except Exception as e:
-        # As a last resort, set ATTACH_DIR to system temp and log the error. The
-        # application will still attempt writes and reads but they may fail later
-        # with clearer errors at runtime.
-        ATTACH_DIR = tempfile.gettempdir()
-        logging.exception("Failed to create fallback attachments dir: %s", e)
-
 router = APIRouter(prefix="/assignments", tags=["assignments"])
 
 @router.post("/course/{course_id}", response_model=AssignmentRead)
-def create_assignment(course_id: int, data: AssignmentCreate, db: Session = Depends(get_db), teacher: User = Depends(require_role(ROLE_TEACHER)), attachment: UploadFile | None = File(None)):
-    course = db.query(Course).filter(Course.id == course_id, Course.teacher_id == teacher.id).first()
+async def create_assignment(course_id: int, request: Request, response: Response, title: str = Form(...), description: str | None = Form(None), due_date: datetime = Form(...), db: AsyncSession = Depends(get_db), teacher: User = Depends(require_role(ROLE_TEACHER)), attachment: UploadFile | None = File(None)):
+    # fields arrive as form data: a JSON body cannot be combined with a file part
+    data = AssignmentCreate(title=title, description=description, due_date=due_date)
+    course = (await db.execute(select(Course).where(Course.id == course_id, Course.teacher_id == teacher.id))).scalar_one_or_none()
     if not course:
         raise HTTPException(status_code=404, detail="Course not found or not owned")
     filename = None
+    saved = None
     if attachment:
-        if not attachment.filename.lower().endswith('.pdf'):
+        # cheap header check up front; the full parse runs in the background
+        head = await attachment.read(PDF_HEADER_WINDOW)
+        await attachment.seek(0)
+        if not looks_like_pdf(head):
             raise HTTPException(status_code=400, detail="Attachment must be PDF")
         filename = f"assignment_{course_id}_{int(datetime.utcnow().timestamp())}_{attachment.filename}"
-        with open(os.path.join(ATTACH_DIR, filename), 'wb') as f:
-            f.write(attachment.file.read())
-    assignment = Assignment(course_id=course.id, teacher_id=teacher.id, title=data.title, description=data.description, due_date=data.due_date, attachment_filename=filename)
-    db.add(assignment)
-    db.commit()
-    db.refresh(assignment)
+        saved = await store_upload(attachment)
+        logging.info("Stored attachment %s (%d bytes, sha256=%s)", filename, saved.size, saved.sha256)
+    assignment = Assignment(course_id=course.id, teacher_id=teacher.id, title=data.title, description=data.description, due_date=data.due_date, attachment_filename=filename, attachment_sha256=saved.sha256 if saved else None, processing_status=PROCESSING_PENDING if saved else None)
+    await _persist(db, assignment, saved)
+    if saved:
+        await enqueue_processing("assignment", assignment.id)
+    await bump(course_scope(course.id))
+    mark_write(request, response)
+    await publish("assignment.created", [course_channel(course.id)], course_id=course.id, assignment_id=assignment.id, title=assignment.title, due_date=assignment.due_date.isoformat())
     return assignment
 
+async def _persist(db: AsyncSession, obj, saved):
+    if saved:
+        await db.run_sync(acquire, saved.sha256, saved.size, saved.path)
+    db.add(obj)
+    await db.commit()
+    await db.refresh(obj)
+
 @router.get("/course/{course_id}", response_model=list[AssignmentRead])
-def list_assignments(course_id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+async def list_assignments(course_id: int, request: Request, since: datetime | None = None, page: Page = Depends(page_params), db: AsyncSession = Depends(get_read_db), user: User = Depends(get_current_user)):
     # Authorization: teachers see their assignments; students/parents see assignments without enforced enrollment checks
-    q = db.query(Assignment).filter(Assignment.course_id == course_id)
+    # ordered by due date; `since` keeps assignments created at or after that instant
+    q = select(*schema_columns(AssignmentRead, Assignment)).where(Assignment.course_id == course_id)
     if user.role == ROLE_TEACHER:
-        q = q.filter(Assignment.teacher_id == user.id)
-    return q.all()
+        q = q.where(Assignment.teacher_id == user.id)
+    if since is not None:
+        q = q.where(Assignment.created_at >= since)
+
+    async def render(holder):
+        rows = await paginate(db, q, [(Assignment.due_date, False), (Assignment.id, False)], page, request, holder, columns=True)
+        return dumps(row_dicts(AssignmentRead, rows))
+
+    key = f"assignments:{course_id}:{user.id}:{user.role}:{request.url.query}"
+    return await cached_response(request, key, [course_scope(course_id)], list[AssignmentRead], render, replica=is_replica(db))
+
+# assignment -> course never changes, so the mapping can be kept for long
+_assignment_course = TTLCache(maxsize=10000, ttl=3600)
 
 @router.get("/{assignment_id}", response_model=AssignmentRead)
-def get_assignment(assignment_id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
-    a = db.query(Assignment).filter(Assignment.id == assignment_id).first()
-    if not a:
-        raise HTTPException(status_code=404, detail="Not found")
-    # simple visibility checks: teachers must own the assignment; students/parents may view without enforced enrollment
-    if user.role == ROLE_TEACHER and a.teacher_id != user.id:
-        raise HTTPException(status_code=403, detail="Not your assignment")
-    return a
+async def get_assignment(assignment_id: int, request: Request, db: AsyncSession = Depends(get_read_db), user: User = Depends(get_current_user)):
+    course_id = _assignment_course.get(assignment_id)
+    if course_id is None:
+        course_id = (await db.execute(select(Assignment.course_id).where(Assignment.id == assignment_id))).scalar()
+        if course_id is None:
+            raise HTTPException(status_code=404, detail="Not found")
+        _assignment_course.set(assignment_id, course_id)
+
+    async def render(holder):
+        a = await db.get(Assignment, assignment_id)
+        if not a:
+            raise HTTPException(status_code=404, detail="Not found")
+        # simple visibility checks: teachers must own the assignment; students/parents may view without enforced enrollment
+        if user.role == ROLE_TEACHER and a.teacher_id != user.id:
+            raise HTTPException(status_code=403, detail="Not your assignment")
+        return a
+
+    return await cached_response(request, f"assignment:{assignment_id}:{user.id}:{user.role}", [course_scope(course_id)], AssignmentRead, render, replica=is_replica(db))
 
 @router.get("/{assignment_id}/attachment")
-def download_attachment(assignment_id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
-    a = db.query(Assignment).filter(Assignment.id == assignment_id).first()
+async def download_attachment(assignment_id: int, request: Request, db: AsyncSession = Depends(get_read_db), user: User = Depends(get_current_user)):
+    a = await db.get(Assignment, assignment_id)
     if not a or not a.attachment_filename:
         raise HTTPException(status_code=404, detail="Attachment not found")
     # reuse visibility checks: teachers must own the assignment; students may download without enforced enrollment
     if user.role == ROLE_TEACHER and a.teacher_id != user.id:
         raise HTTPException(status_code=403, detail="Not your assignment")
-    path = os.path.join(ATTACH_DIR, a.attachment_filename)
-    if not os.path.exists(path):
-        raise HTTPException(status_code=404, detail="File missing")
-    with open(path, 'rb') as f:
-        return {"filename": a.attachment_filename, "content": f.read().decode('latin-1')}  # simplistic; real impl should stream bytes
+    return await run_in_threadpool(blob_response, request, a.attachment_sha256, a.attachment_filename, media_type="application/pdf", legacy_path=os.path.join(settings.ATTACH_DIR, a.attachment_filename))
+
+@router.get("/{assignment_id}/thumbnail")
+async def attachment_thumbnail(assignment_id: int, request: Request, db: AsyncSession = Depends(get_read_db), user: User = Depends(get_current_user)):
+    a = await db.get(Assignment, assignment_id)
+    if not a or not a.attachment_filename:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    if user.role == ROLE_TEACHER and a.teacher_id != user.id:
+        raise HTTPException(status_code=403, detail="Not your assignment")
+    return await thumbnail_response(request, db, a.attachment_sha256)
@@ -1,30 +1,46 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.security import OAuth2PasswordRequestForm
-from ..database import get_db, engine
+from ..database import get_db
 from .. import models
 from ..schemas import UserCreate, UserRead
-from ..utils.security import hash_password, verify_password, create_access_token
+from ..utils.security import hash_password_async, verify_password_async, create_access_token, JWT_EMBED_CLAIMS
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
+# bcrypt runs in the password-hash process pool. The read transaction is closed
+# before hashing so a login waiting on bcrypt does not hold a pooled connection.
+
+async def _find_user(db: AsyncSession, email: str):
+    row = (await db.execute(select(models.User.id, models.User.name, models.User.role, models.User.hashed_password).where(models.User.email == email))).first()
+    await db.rollback()
+    return row
+
 @router.post("/register", response_model=UserRead)
-def register(data: UserCreate, db: Session = Depends(get_db)):
+async def register(data: UserCreate, db: AsyncSession = Depends(get_db)):
     if data.role not in {models.ROLE_STUDENT, models.ROLE_TEACHER, models.ROLE_PARENT}:
         raise HTTPException(status_code=400, detail="Invalid role")
-    existing = db.query(models.User).filter(models.User.email == data.email).first()
+    existing = await _find_user(db, data.email)
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
-    user = models.User(name=data.name, email=data.email, hashed_password=hash_password(data.password), role=data.role)
+    hashed = await hash_password_async(data.password)
+    user = models.User(name=data.name, email=data.email, hashed_password=hashed, role=data.role)
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
 
 @router.post("/login")
-def login(form: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == form.username).first()
-    if not user or not verify_password(form.password, user.hashed_password):
+async def login(form: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = await _find_user(db, form.username)
+    valid, new_hash = await verify_password_async(form.password, user.hashed_password) if user else (False, None)
+    if not valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
-    token = create_access_token(user.email)
+    if new_hash:
+        # stored hash used another bcrypt cost (BCRYPT_ROUNDS changed): upgrade it
+        await db.execute(update(models.User).where(models.User.id == user.id).values(hashed_password=new_hash))
+        await db.commit()
+    claims = {"uid": user.id, "role": user.role, "name": user.name} if JWT_EMBED_CLAIMS else None
+    token = create_access_token(form.username, claims=claims)
     return {"access_token": token, "token_type": "bearer", "user": {"id": user.id, "role": user.role, "name": user.name}}
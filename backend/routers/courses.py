@@ -1,41 +1,122 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from ..database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import select, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_db, get_read_db, is_replica, dialect_insert
 from ..models import Course, User, CourseStudent, ROLE_TEACHER, ROLE_STUDENT
-from ..schemas import CourseCreate, CourseRead, CourseStudentAdd
+from ..schemas import CourseCreate, CourseRead, CourseStudentAdd, CourseStudentBatch, BatchResult
 from ..deps import get_current_user, require_role
+from ..utils.pagination import Page, page_params, paginate
+from ..utils.serialization import schema_columns, row_dicts, dumps
+from ..utils.batch import read_json_or_csv, check_batch_size, summarize
+from ..response_cache import cached_response, bump, COURSES, course_scope, student_scope
+from ..events import publish, student_channel, teacher_channel
 
 router = APIRouter(prefix="/courses", tags=["courses"])
 
 @router.post("/", response_model=CourseRead)
-def create_course(data: CourseCreate, db: Session = Depends(get_db), teacher: User = Depends(require_role(ROLE_TEACHER))):
+async def create_course(data: CourseCreate, db: AsyncSession = Depends(get_db), teacher: User = Depends(require_role(ROLE_TEACHER))):
     course = Course(name=data.name, teacher_id=teacher.id)
     db.add(course)
-    db.commit()
-    db.refresh(course)
+    await db.commit()
+    await db.refresh(course)
+    await bump(COURSES)
+    await publish("course.created", [teacher_channel(teacher.id)], course_id=course.id, name=course.name)
     return course
 
 @router.get("/", response_model=list[CourseRead])
-def list_courses(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+async def list_courses(request: Request, page: Page = Depends(page_params), db: AsyncSession = Depends(get_read_db), user: User = Depends(get_current_user)):
+    q = select(*schema_columns(CourseRead, Course))
     if user.role == ROLE_TEACHER:
-        return db.query(Course).filter(Course.teacher_id == user.id).all()
+        q = q.where(Course.teacher_id == user.id)
     elif user.role == ROLE_STUDENT:
-        return [cs.course for cs in db.query(CourseStudent).filter(CourseStudent.student_id == user.id).all()]
-    else:
-        return db.query(Course).all()
+        q = q.join(CourseStudent, CourseStudent.course_id == Course.id).where(CourseStudent.student_id == user.id)
+
+    async def render(holder):
+        rows = await paginate(db, q, [(Course.id, False)], page, request, holder, columns=True)
+        return dumps(row_dicts(CourseRead, rows))
+
+    return await cached_response(request, f"courses:{user.id}:{user.role}:{request.url.query}", [COURSES], list[CourseRead], render, replica=is_replica(db))
 
 @router.post("/{course_id}/students")
-def add_student(course_id: int, payload: CourseStudentAdd, db: Session = Depends(get_db), teacher: User = Depends(require_role(ROLE_TEACHER))):
-    course = db.query(Course).filter(Course.id == course_id, Course.teacher_id == teacher.id).first()
+async def add_student(course_id: int, payload: CourseStudentAdd, db: AsyncSession = Depends(get_db), teacher: User = Depends(require_role(ROLE_TEACHER))):
+    course = (await db.execute(select(Course).where(Course.id == course_id, Course.teacher_id == teacher.id))).scalar_one_or_none()
     if not course:
         raise HTTPException(status_code=404, detail="Course not found or not owned")
-    student = db.query(User).filter(User.id == payload.student_id, User.role == ROLE_STUDENT).first()
+    student = (await db.execute(select(User).where(User.id == payload.student_id, User.role == ROLE_STUDENT))).scalar_one_or_none()
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
-    existing = db.query(CourseStudent).filter(CourseStudent.course_id == course.id, CourseStudent.student_id == student.id).first()
+    existing = (await db.execute(select(CourseStudent).where(CourseStudent.course_id == course.id, CourseStudent.student_id == student.id))).first()
     if existing:
         raise HTTPException(status_code=400, detail="Student already enrolled")
     link = CourseStudent(course_id=course.id, student_id=student.id)
     db.add(link)
-    db.commit()
+    await db.commit()
+    await bump(COURSES, course_scope(course.id), student_scope(student.id))
+    await publish("enrollment.added", [student_channel(student.id)], course_id=course.id, student_id=student.id)
     return {"message": "Student added"}
+
+@router.post("/{course_id}/students:batch", response_model=BatchResult)
+async def add_students_batch(course_id: int, request: Request, db: AsyncSession = Depends(get_db), teacher: User = Depends(require_role(ROLE_TEACHER))):
+    # JSON {"student_ids": [...], "emails": [...]} or a roster CSV with a
+    # `student_id` and/or `email` column. One ownership check, one lookup, one
+    # INSERT ... ON CONFLICT DO NOTHING and one commit for the whole batch.
+    course = (await db.execute(select(Course.id).where(Course.id == course_id, Course.teacher_id == teacher.id))).first()
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found or not owned")
+    payload = await read_json_or_csv(request, CourseStudentBatch)
+    items = _roster_items(payload)
+    check_batch_size(len(items))
+
+    ids = {i["id"] for i in items if i.get("id") is not None}
+    emails = {i["email"] for i in items if i.get("email")}
+    found = (await db.execute(
+        select(User.id, User.email).where(User.role == ROLE_STUDENT, or_(User.id.in_(ids), User.email.in_(emails)))
+    )).all()
+    by_id = {r.id for r in found}
+    by_email = {r.email: r.id for r in found}
+
+    seen, rows = set(), []
+    for item in items:
+        if item.get("status"):
+            continue
+        student_id = item["id"] if item.get("id") is not None else by_email.get(item["email"])
+        if student_id is None or (item.get("id") is not None and student_id not in by_id):
+            item["status"] = "not_found"
+        elif student_id in seen:
+            item["status"] = "duplicate"
+        else:
+            item["id"] = student_id
+            seen.add(student_id)
+            rows.append({"course_id": course_id, "student_id": student_id})
+
+    inserted = set()
+    if rows:
+        table = CourseStudent.__table__
+        stmt = dialect_insert(db.bind.dialect.name)(table).on_conflict_do_nothing(index_elements=["course_id", "student_id"]).returning(table.c.student_id)
+        inserted = set((await db.execute(stmt, rows)).scalars())
+        await db.commit()
+        if inserted:
+            await bump(COURSES, course_scope(course_id), *map(student_scope, inserted))
+        for student_id in inserted:
+            await publish("enrollment.added", [student_channel(student_id)], course_id=course_id, student_id=student_id)
+    for item in items:
+        if not item.get("status"):
+            item["status"] = "added" if item["id"] in inserted else "already_enrolled"
+    return summarize(items, {"added", "already_enrolled"})
+
+def _roster_items(payload) -> list[dict]:
+    if isinstance(payload, CourseStudentBatch):
+        values = [{"id": i} for i in payload.student_ids] + [{"email": e.strip()} for e in payload.emails]
+    else:
+        if payload and not {"student_id", "email"} & payload[0].keys():
+            raise HTTPException(status_code=400, detail="CSV needs a student_id or email column")
+        values = []
+        for row in payload:
+            raw_id, email = row.get("student_id", ""), row.get("email", "")
+            if raw_id:
+                values.append({"id": int(raw_id)} if raw_id.isdigit() else {"email": email or None, "status": "invalid"})
+            elif email:
+                values.append({"email": email})
+            else:
+                values.append({"status": "invalid"})
+    return [{"index": n, "id": None, "email": None, **v} for n, v in enumerate(values)]
@@ -1,36 +1,66 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..database import get_db
-from ..models import CourseStudent, Course, User
-from ..deps import get_current_user
+from ..models import CourseStudent, Course, User, Submission, Assignment
+from ..deps import get_current_user, auth_cache_stats
 import os
-from ..database import DATABASE_URL
+from ..database import DATABASE_URL, IS_SQLITE, engine, async_engine, pool_stats, replicas
+from ..utils.security import hash_pool_stats
+from ..utils.pagination import Page, page_params, paginate
+from ..response_cache import cache_stats as response_cache_stats
+from ..events import event_stats
+from ..jobs import job_stats
 
 router = APIRouter(prefix="/debug", tags=["debug"])
 
 
 @router.get("/me")
-def whoami(user: User = Depends(get_current_user)):
+async def whoami(user: User = Depends(get_current_user)):
     return {"id": user.id, "email": user.email, "role": user.role, "name": user.name}
 
 
 @router.get("/course/{course_id}/students")
-def list_course_students(course_id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+async def list_course_students(course_id: int, request: Request, response: Response, page: Page = Depends(page_params), db: AsyncSession = Depends(get_db), user: User = Depends(get_current_user)):
     # allow teachers and students to inspect for debugging
-    rows = db.query(CourseStudent).filter(CourseStudent.course_id == course_id).all()
+    rows = await paginate(db, select(CourseStudent).where(CourseStudent.course_id == course_id), [(CourseStudent.id, False)], page, request, response)
     return [{"id": r.id, "course_id": r.course_id, "student_id": r.student_id} for r in rows]
 
 
 @router.get("/student/{student_id}/courses")
-def list_student_courses(student_id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
-    rows = db.query(CourseStudent).filter(CourseStudent.student_id == student_id).all()
-    course_ids = [r.course_id for r in rows]
-    courses = db.query(Course).filter(Course.id.in_(course_ids)).all() if course_ids else []
+async def list_student_courses(student_id: int, request: Request, response: Response, page: Page = Depends(page_params), db: AsyncSession = Depends(get_db), user: User = Depends(get_current_user)):
+    q = select(Course).join(CourseStudent, CourseStudent.course_id == Course.id).where(CourseStudent.student_id == student_id)
+    courses = await paginate(db, q, [(Course.id, False)], page, request, response)
     return [{"id": c.id, "name": c.name, "teacher_id": c.teacher_id} for c in courses]
 
 
+@router.get("/cache")
+async def cache_stats(user: User = Depends(get_current_user)):
+    return {"auth": auth_cache_stats(), "responses": response_cache_stats()}
+
+
+@router.get("/events")
+async def events_stats(user: User = Depends(get_current_user)):
+    return event_stats()
+
+
+@router.get("/jobs")
+async def jobs_stats(db: AsyncSession = Depends(get_db), user: User = Depends(get_current_user)):
+    # queue/worker counters plus where uploads stand in their processing
+    rows = {}
+    for name, model in (("submissions", Submission), ("assignments", Assignment)):
+        counts = (await db.execute(select(model.processing_status, func.count()).where(model.processing_status.is_not(None)).group_by(model.processing_status))).all()
+        rows[name] = {status: count for status, count in counts}
+    return {**await job_stats(), "processing_status": rows}
+
+
+@router.get("/hashing")
+async def hashing_stats(user: User = Depends(get_current_user)):
+    return hash_pool_stats()
+
+
 @router.get("/dbinfo")
-def db_info():
+async def db_info():
     info = {"DATABASE_URL": DATABASE_URL}
     # if using sqlite, try to resolve path
     if DATABASE_URL.startswith("sqlite"):
@@ -40,3 +70,22 @@ def db_info():
         path = path.lstrip('/')
         info["sqlite_path"] = os.path.abspath(path)
     return info
+
+
+@router.get("/pool")
+async def db_pool(user: User = Depends(get_current_user)):
+    info = {"requests": pool_stats(async_engine), "sync": pool_stats(engine)}
+    if IS_SQLITE:
+        async with async_engine.connect() as conn:
+            info["sqlite"] = {
+                "journal_mode": (await conn.exec_driver_sql("PRAGMA journal_mode")).scalar(),
+                "busy_timeout_ms": (await conn.exec_driver_sql("PRAGMA busy_timeout")).scalar(),
+                "synchronous": (await conn.exec_driver_sql("PRAGMA synchronous")).scalar(),
+            }
+    return info
+
+
+@router.get("/replicas")
+async def db_replicas(user: User = Depends(get_current_user)):
+    # rotation state, lag and pool of each read replica (DATABASE_REPLICA_URLS)
+    return replicas.stats()
@@ -0,0 +1,80 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from collections import deque
+from typing import Optional
+import json
+import os
+from ..database import get_db
+from ..models import Course, CourseStudent, ParentChild, User, ROLE_STUDENT, ROLE_TEACHER, ROLE_PARENT
+from ..deps import get_current_user
+from ..events import broker, course_channel, student_channel, teacher_channel
+
+EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", "15"))
+
+router = APIRouter(prefix="/events", tags=["events"])
+
+# Server-Sent Events: one long-lived response per client replaces polling the
+# list endpoints. Each event names what changed (ids plus a few fields); clients
+# refetch the affected resource, which the response cache answers cheaply.
+# A `resync` event means events were lost (slow reader) and everything shown
+# should be refetched; a fresh connection starts with `ready`.
+
+@router.get("/stream")
+async def stream(course: Optional[list[int]] = Query(None), child: Optional[list[int]] = Query(None), db: AsyncSession = Depends(get_db), user: User = Depends(get_current_user)):
+    channels = await _allowed_channels(db, user, course, child)
+    # the stream can stay open for hours: don't keep a pooled connection
+    await db.close()
+    sub = await broker.subscribe(channels)
+    follow = course is None  # without an explicit course filter, follow new enrollments
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(_events(sub, follow), media_type="text/event-stream", headers=headers)
+
+async def _allowed_channels(db: AsyncSession, user: User, courses: Optional[list[int]], children: Optional[list[int]]) -> set:
+    if user.role == ROLE_TEACHER:
+        allowed_courses = set((await db.execute(select(Course.id).where(Course.teacher_id == user.id))).scalars())
+        students, base = set(), {teacher_channel(user.id)}
+    elif user.role == ROLE_STUDENT:
+        allowed_courses = set((await db.execute(select(CourseStudent.course_id).where(CourseStudent.student_id == user.id))).scalars())
+        students, base = {user.id}, set()
+    elif user.role == ROLE_PARENT:
+        students = set((await db.execute(select(ParentChild.child_id).where(ParentChild.parent_id == user.id))).scalars())
+        if children is not None:
+            if not set(children) <= students:
+                raise HTTPException(status_code=403, detail="Not linked to this student")
+            students = set(children)
+        allowed_courses = set((await db.execute(select(CourseStudent.course_id).where(CourseStudent.student_id.in_(students)))).scalars()) if students else set()
+        base = set()
+    else:
+        raise HTTPException(status_code=403, detail="Not allowed")
+    if courses is not None:
+        if not set(courses) <= allowed_courses:
+            raise HTTPException(status_code=403, detail="Not allowed to follow this course")
+        allowed_courses = set(courses)
+    return base | {student_channel(s) for s in students} | {course_channel(c) for c in allowed_courses}
+
+def _sse(event: dict) -> str:
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+async def _events(sub, follow: bool):
+    sent = deque(maxlen=256)
+    try:
+        yield _sse({"id": "0", "type": "ready", "channels": sorted(sub.channels)})
+        # runs until the client disconnects, which cancels this generator
+        while True:
+            event = await sub.get(timeout=EVENTS_HEARTBEAT)
+            if sub.overflowed:
+                sub.overflowed = False
+                yield _sse({"id": "0", "type": "resync"})
+            if event is None:
+                yield ": ping\n\n"
+                continue
+            if event["id"] in sent:
+                continue
+            sent.append(event["id"])
+            if follow and event["type"] in ("enrollment.added", "course.created"):
+                await sub.add(course_channel(event["course_id"]))
+            yield _sse(event)
+    finally:
+        await sub.close()
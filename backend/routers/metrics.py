@@ -0,0 +1,58 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+import hmac
+from ..database import engine, async_engine, pool_stats, replicas
+from ..events import broker
+from ..jobs import runner
+from ..metrics import CallbackGauge, METRICS_TOKEN, render
+from ..utils.security import hash_pool_stats
+
+# Unauthenticated like any Prometheus target, unless METRICS_TOKEN is set
+# (then scrape with `authorization: Bearer <token>`).
+router = APIRouter(tags=["metrics"])
+
+
+def _engines():
+    yield "sync", engine
+    yield "async", async_engine.sync_engine
+    for replica in replicas.replicas:
+        yield f"replica:{replica.name}", replica.engine.sync_engine
+
+
+def _pool_connections() -> dict:
+    values = {}
+    for name, eng in _engines():
+        stats = pool_stats(eng)
+        for state in ("checked_out", "checked_in", "overflow"):
+            if state in stats:
+                values[(name, state)] = stats[state]
+    return values
+
+
+def _pool_timeouts() -> dict:
+    return {(name,): pool_stats(eng).get("checkout_timeouts", 0) for name, eng in _engines()}
+
+
+def _read_sessions() -> dict:
+    values = {("primary",): replicas.primary_reads, ("sticky",): replicas.sticky_reads}
+    values.update({(r.name,): r.reads for r in replicas.replicas})
+    return values
+
+
+CallbackGauge("db_pool_connections", "Pooled connections by state", ("engine", "state"), _pool_connections)
+CallbackGauge("db_pool_checkout_timeouts", "Connection checkouts that timed out", ("engine",), _pool_timeouts)
+CallbackGauge("db_replica_healthy", "1 while a read replica is in rotation", ("replica",), lambda: {(r.name,): int(r.healthy) for r in replicas.replicas})
+CallbackGauge("db_replica_lag_seconds", "Replication lag at the last health check", ("replica",), lambda: {(r.name,): r.lag for r in replicas.replicas if r.lag is not None})
+CallbackGauge("db_read_sessions", "get_read_db sessions by target since start (sticky: read-your-writes)", ("target",), _read_sessions)
+CallbackGauge("password_hash_in_flight", "bcrypt operations running or queued", (), lambda: {(): hash_pool_stats()["in_flight"]})
+CallbackGauge("jobs_running", "Background jobs being executed", (), lambda: {(): runner.running})
+CallbackGauge("event_stream_subscribers", "Open /events/stream connections", (), lambda: {(): broker.subscriber_count()})
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    if METRICS_TOKEN:
+        supplied = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+        if not hmac.compare_digest(supplied, METRICS_TOKEN):
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
@@ -1,59 +1,266 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from ..database import get_db
-from ..models import User, Submission, Assignment, CourseStudent, ParentChild, ROLE_STUDENT, ROLE_TEACHER, ROLE_PARENT
-from ..schemas import StudentReport, AssignmentReportItem
-from ..deps import get_current_user
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, or_, union
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta
+import csv
+import io
+import statistics
+from ..database import get_read_db, is_replica
+from ..models import User, Course, Assignment, CourseStudent, LatestSubmission, ParentChild, ROLE_STUDENT, ROLE_TEACHER, ROLE_PARENT
+from ..schemas import StudentReport, AssignmentReportItem, FamilyReport
+from ..deps import get_current_user, require_role
+from ..utils.cache import TTLCache
+from ..utils.serialization import row_dicts, dumps, json_response
+from ..utils.csv_export import csv_row
+from .. import response_cache
+from ..response_cache import cached_response, course_scope, student_scope
 
 router = APIRouter(prefix="/reports", tags=["reports"])
 
 @router.get("/me", response_model=StudentReport)
-def my_report(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+async def my_report(request: Request, db: AsyncSession = Depends(get_read_db), user: User = Depends(get_current_user)):
     if user.role == ROLE_STUDENT:
-        return _build_student_report(db, user)
+        student_id = user.id
     elif user.role == ROLE_PARENT:
         # choose first child for simplicity
-        link = db.query(ParentChild).filter(ParentChild.parent_id == user.id).first()
-        if not link:
-            raise HTTPException(status_code=404, detail="No child linked")
-        student = db.query(User).filter(User.id == link.child_id).first()
-        return _build_student_report(db, student)
+        student_id = _first_child.get(user.id)
+        if student_id is None:
+            student_id = (await db.execute(select(ParentChild.child_id).where(ParentChild.parent_id == user.id).order_by(ParentChild.id).limit(1))).scalar()
+            if student_id is None:
+                raise HTTPException(status_code=404, detail="No child linked")
+            _first_child.set(user.id, student_id)
     else:  # teacher - aggregate own students maybe out of scope -> return empty
         raise HTTPException(status_code=400, detail="Use /reports/student/{id} for student reports")
 
+    async def render(holder):
+        student = user if user.role == ROLE_STUDENT else await db.get(User, student_id)
+        return dumps(await _build_student_report(db, student))
+
+    # only needed for the ETag; skipped (with its enrolled-courses cache) when the
+    # response cache is off
+    scopes = await _report_scopes(db, student_id) if response_cache.enabled else []
+    return await cached_response(request, f"report:{student_id}", scopes, StudentReport, render, replica=is_replica(db))
+
+# parent links have no API to change them; enrolled courses are keyed by the
+# student's version, which every enrollment bumps
+_first_child = TTLCache(maxsize=10000, ttl=60)
+_enrolled_courses = TTLCache(maxsize=10000, ttl=3600)
+
+async def _report_scopes(db: AsyncSession, student_id: int) -> list[str]:
+    # the report changes with the student's own submissions/grades and with new
+    # assignments in any course they are enrolled in
+    scope = student_scope(student_id)
+    (version,) = await response_cache.store.get([scope])
+    courses = _enrolled_courses.get((student_id, version))
+    if courses is None:
+        courses = (await db.execute(select(CourseStudent.course_id).where(CourseStudent.student_id == student_id).order_by(CourseStudent.course_id))).scalars().all()
+        # a lagging replica may not have the enrollment behind `version` yet
+        if not is_replica(db):
+            _enrolled_courses.set((student_id, version), courses)
+    return [scope, *map(course_scope, courses)]
+
 @router.get("/student/{student_id}", response_model=StudentReport)
-def student_report(student_id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
-    target = db.query(User).filter(User.id == student_id, User.role == ROLE_STUDENT).first()
+async def student_report(student_id: int, db: AsyncSession = Depends(get_read_db), user: User = Depends(get_current_user)):
+    target = (await db.execute(select(User).where(User.id == student_id, User.role == ROLE_STUDENT))).scalar_one_or_none()
     if not target:
         raise HTTPException(status_code=404, detail="Student not found")
     # authorization: teacher of any course of student or parent of student or the student themselves
     if user.role == ROLE_STUDENT and user.id != target.id:
         raise HTTPException(status_code=403, detail="Not allowed")
     if user.role == ROLE_PARENT:
-        link = db.query(ParentChild).filter(ParentChild.parent_id == user.id, ParentChild.child_id == target.id).first()
+        link = (await db.execute(select(ParentChild).where(ParentChild.parent_id == user.id, ParentChild.child_id == target.id))).first()
         if not link:
             raise HTTPException(status_code=403, detail="Not linked to this student")
     if user.role == ROLE_TEACHER:
-        course_link = db.query(CourseStudent).join(Assignment, Assignment.course_id == CourseStudent.course_id).filter(CourseStudent.student_id == target.id, Assignment.teacher_id == user.id).first()
+        course_link = (await db.execute(select(CourseStudent.id).join(Assignment, Assignment.course_id == CourseStudent.course_id).where(CourseStudent.student_id == target.id, Assignment.teacher_id == user.id).limit(1))).first()
         if not course_link:
             raise HTTPException(status_code=403, detail="Not teacher of this student")
-    return _build_student_report(db, target)
-
-def _build_student_report(db: Session, student: User) -> StudentReport:
-    submissions = db.query(Submission).filter(Submission.student_id == student.id).all()
-    latest_by_assignment = {}
-    for s in sorted(submissions, key=lambda x: x.uploaded_at):
-        latest_by_assignment[s.assignment_id] = s
-    items: list[AssignmentReportItem] = []
-    for assignment_id, sub in latest_by_assignment.items():
-        assignment = db.query(Assignment).filter(Assignment.id == assignment_id).first()
-        if not assignment:
+    return json_response(await _build_student_report(db, target))
+
+def _student_report_query(student_id: int):
+    # One statement over the latest_submissions projection: every assignment of
+    # the courses the student is enrolled in (plus any assignment they submitted
+    # to), outer-joined onto their newest version so missing work shows up too.
+    latest = LatestSubmission
+    enrolled = select(CourseStudent.course_id).where(CourseStudent.student_id == student_id)
+    submitted = select(latest.assignment_id).where(latest.student_id == student_id)
+    # columns in AssignmentReportItem field order (see _report_from_rows)
+    return (
+        select(Assignment.id.label("assignment_id"), Assignment.title, latest.grade.label("latest_grade"), Assignment.due_date, latest.uploaded_at.label("last_submission_at"))
+        .outerjoin(latest, (latest.assignment_id == Assignment.id) & (latest.student_id == student_id))
+        .where(or_(Assignment.course_id.in_(enrolled), Assignment.id.in_(submitted)))
+        .order_by(Assignment.due_date, Assignment.id)
+    )
+
+# StudentReport as plain data, ready for dumps(): rows are our own, so they
+# skip pydantic validation
+def _report_from_rows(student: User, rows) -> dict:
+    return {"student_id": student.id, "student_name": student.name, "assignments": row_dicts(AssignmentReportItem, rows)}
+
+async def _build_student_report(db: AsyncSession, student: User) -> dict:
+    rows = (await db.execute(_student_report_query(student.id))).all()
+    return _report_from_rows(student, rows)
+
+@router.get("/family", response_model=FamilyReport)
+async def family_report(upcoming_days: int = Query(30, ge=0, le=365), db: AsyncSession = Depends(get_read_db), parent: User = Depends(require_role(ROLE_PARENT))):
+    # the parent_child filter is the authorization: only linked children come back
+    rows = (await db.execute(_family_report_query(parent.id))).all()
+    if not rows:
+        raise HTTPException(status_code=404, detail="No child linked")
+    return json_response(_family_from_rows(rows, datetime.utcnow(), upcoming_days))
+
+def _family_report_query(parent_id: int):
+    # Same shape as _student_report_query, for every child of the parent in one
+    # statement: the (child, assignment) pairs from enrolled courses and past
+    # submissions, outer-joined onto the latest version. A child without any
+    # assignment still yields one row with NULL assignment columns.
+    latest = LatestSubmission
+    children = select(ParentChild.child_id).where(ParentChild.parent_id == parent_id)
+    pairs = union(
+        select(CourseStudent.student_id.label("student_id"), Assignment.id.label("assignment_id"))
+        .join(Assignment, Assignment.course_id == CourseStudent.course_id)
+        .where(CourseStudent.student_id.in_(children)),
+        select(latest.student_id, latest.assignment_id).where(latest.student_id.in_(children)),
+    ).subquery()
+    return (
+        select(
+            User.id.label("student_id"), User.name.label("student_name"),
+            Assignment.id, Assignment.title, Assignment.due_date, Assignment.course_id, Course.name.label("course_name"),
+            latest.grade, latest.uploaded_at,
+        )
+        .select_from(ParentChild)
+        .join(User, User.id == ParentChild.child_id)
+        .outerjoin(pairs, pairs.c.student_id == ParentChild.child_id)
+        .outerjoin(Assignment, Assignment.id == pairs.c.assignment_id)
+        .outerjoin(Course, Course.id == Assignment.course_id)
+        .outerjoin(latest, (latest.assignment_id == Assignment.id) & (latest.student_id == ParentChild.child_id))
+        .where(ParentChild.parent_id == parent_id)
+        .order_by(User.name, User.id, Assignment.due_date, Assignment.id)
+    )
+
+# FamilyReport as plain data (keys in schema field order), like _report_from_rows
+def _family_from_rows(rows, now: datetime, upcoming_days: int) -> dict:
+    horizon = now + timedelta(days=upcoming_days)
+    children: dict[int, dict] = {}
+    for r in rows:
+        child = children.get(r.student_id)
+        if child is None:
+            child = children[r.student_id] = {"student_id": r.student_id, "student_name": r.student_name, "average_grade": None, "graded": [], "submitted": [], "upcoming": [], "missing": []}
+        if r.id is None:
             continue
-        items.append(AssignmentReportItem(
-            assignment_id=assignment.id,
-            title=assignment.title,
-            latest_grade=sub.grade,
-            due_date=assignment.due_date,
-            last_submission_at=sub.uploaded_at
-        ))
-    return StudentReport(student_id=student.id, student_name=student.name, assignments=items)
+        item = {"assignment_id": r.id, "title": r.title, "latest_grade": r.grade, "due_date": r.due_date, "last_submission_at": r.uploaded_at, "course_id": r.course_id, "course_name": r.course_name}
+        if r.grade is not None:
+            child["graded"].append(item)
+        elif r.uploaded_at is not None:
+            child["submitted"].append(item)
+        elif r.due_date < now:
+            child["missing"].append(item)
+        elif r.due_date <= horizon:
+            child["upcoming"].append(item)
+    for child in children.values():
+        grades = [i["latest_grade"] for i in child["graded"]]
+        child["average_grade"] = round(statistics.fmean(grades), 2) if grades else None
+    return {"generated_at": now, "children": list(children.values())}
+
+@router.get("/course/{course_id}/gradebook")
+async def course_gradebook(course_id: int, format: str = Query("json", pattern="^(json|csv)$"), db: AsyncSession = Depends(get_read_db), teacher: User = Depends(require_role(ROLE_TEACHER))):
+    course = (await db.execute(select(Course.id, Course.name).where(Course.id == course_id, Course.teacher_id == teacher.id))).first()
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found or not owned")
+    assignments_stmt, roster_stmt, cells_stmt = _gradebook_queries(course_id)
+    assignments = (await db.execute(assignments_stmt)).all()
+    roster = (await db.execute(roster_stmt)).all()
+    cells = (await db.execute(cells_stmt)).all()
+    # everything is read before the body is sent: the connection goes back to
+    # the pool instead of waiting on a slow client
+    book = _build_gradebook(course, assignments, roster, cells)
+    if format == "csv":
+        headers = {"Content-Disposition": f'attachment; filename="gradebook_course_{course_id}.csv"'}
+        return StreamingResponse(_gradebook_csv(book), media_type="text/csv", headers=headers)
+    return StreamingResponse(_gradebook_json(book), media_type="application/json")
+
+def _gradebook_queries(course_id: int):
+    # one latest_submissions row per (assignment, student) of the course
+    cells = (
+        select(LatestSubmission.assignment_id, LatestSubmission.student_id, LatestSubmission.uploaded_at.label("last_at"), LatestSubmission.versions, LatestSubmission.grade)
+        .join(Assignment, Assignment.id == LatestSubmission.assignment_id)
+        .where(Assignment.course_id == course_id)
+    )
+    assignments = select(Assignment.id, Assignment.title, Assignment.due_date).where(Assignment.course_id == course_id).order_by(Assignment.due_date, Assignment.id)
+    roster = (
+        select(User.id, User.name)
+        .join(CourseStudent, CourseStudent.student_id == User.id)
+        .where(CourseStudent.course_id == course_id)
+        .order_by(User.name, User.id)
+    )
+    return assignments, roster, cells
+
+def _build_gradebook(course, assignment_rows, roster_rows, cell_rows) -> dict:
+    found = {(r.student_id, r.assignment_id): r for r in cell_rows}
+    assignments = []
+    for a in assignment_rows:
+        latest = [found[(s.id, a.id)] for s in roster_rows if (s.id, a.id) in found]
+        grades = [f.grade for f in latest if f.grade is not None]
+        assignments.append({
+            "id": a.id,
+            "title": a.title,
+            "due_date": a.due_date,
+            "submitted": len(latest),
+            "missing": len(roster_rows) - len(latest),
+            "graded": len(grades),
+            "mean": round(statistics.fmean(grades), 2) if grades else None,
+            "median": statistics.median(grades) if grades else None,
+        })
+    students = []
+    for s in roster_rows:
+        cells = []
+        for a in assignment_rows:
+            f = found.get((s.id, a.id))
+            cells.append({
+                "assignment_id": a.id,
+                "latest_grade": f.grade if f else None,
+                "submissions": f.versions if f else 0,
+                "last_submission_at": f.last_at if f else None,
+                "late": bool(f and f.last_at > a.due_date),
+            })
+        students.append({"id": s.id, "name": s.name, "cells": cells})
+    return {"course_id": course.id, "course_name": course.name, "assignments": assignments, "students": students}
+
+def _gradebook_json(book: dict):
+    # one chunk per student keeps memory flat for large rosters
+    yield b'{"course_id":%d,"course_name":%s,"assignments":%s,"students":[' % (book["course_id"], dumps(book["course_name"]), dumps(book["assignments"]))
+    for i, student in enumerate(book["students"]):
+        yield (b"," if i else b"") + dumps(student)
+    yield b"]}"
+
+def _gradebook_csv(book: dict):
+    # wide layout: one row per student, three columns per assignment, and the
+    # per-assignment aggregates as trailing rows under the grade columns
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+
+    def flush():
+        data = buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+        return data
+
+    header = ["student_id", "student_name"]
+    for a in book["assignments"]:
+        header += [f"{a['title']} [{a['id']}] grade", f"{a['title']} [{a['id']}] submissions", f"{a['title']} [{a['id']}] late"]
+    writer.writerow(csv_row(header))
+    yield flush()
+    for student in book["students"]:
+        row = [student["id"], student["name"]]
+        for c in student["cells"]:
+            # yes/no like the archive manifest; empty when nothing was submitted
+            row += [c["latest_grade"], c["submissions"], ("yes" if c["late"] else "no") if c["submissions"] else ""]
+        writer.writerow(csv_row(row))
+        yield flush()
+    for key in ("mean", "median", "missing"):
+        row = ["", key]
+        for a in book["assignments"]:
+            row += [a[key], "", ""]
+        writer.writerow(row)
+    yield flush()
@@ -1,71 +1,219 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, update, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 import os
-from ..database import get_db
-from ..models import Submission, Assignment, CourseStudent, User, ROLE_STUDENT, ROLE_TEACHER
-from ..schemas import SubmissionRead, GradeSubmission
+from ..database import get_db, get_read_db, mark_write
+from ..models import Submission, Assignment, CourseStudent, LatestSubmission, User, ROLE_STUDENT, ROLE_TEACHER, PROCESSING_PENDING
+from ..schemas import SubmissionRead, GradeSubmission, GradeBatch, BatchResult
 from ..deps import get_current_user, require_role
+from ..blobstore import store_upload, acquire, blob_response, open_stored
+from ..latest_submissions import record_upload, record_grade, record_grades
+from ..utils.batch import check_batch_size, summarize
+from ..response_cache import bump, course_scope, student_scope
+from ..events import publish, student_channel, teacher_channel
+from ..processing import enqueue_processing, thumbnail_response
+from ..utils.pagination import Page, page_params, paginate
+from ..utils.archive import ZipEntry, zip_stream, safe_name
+from ..utils.files import content_disposition
+from ..utils.csv_export import csv_row
+from ..utils.serialization import schema_columns, row_dicts, json_response
+from .. import settings
+import csv
+import io
 import logging
 
-SUBMIT_DIR = os.path.join("backend", "storage", "submissions")
-os.makedirs(SUBMIT_DIR, exist_ok=True)
-
 router = APIRouter(prefix="/submissions", tags=["submissions"])
 
 @router.post("/assignment/{assignment_id}", response_model=SubmissionRead)
-def upload_submission(assignment_id: int, file: UploadFile = File(...), db: Session = Depends(get_db), student: User = Depends(require_role(ROLE_STUDENT))):
-    assignment = db.query(Assignment).filter(Assignment.id == assignment_id).first()
+async def upload_submission(assignment_id: int, request: Request, response: Response, file: UploadFile = File(...), db: AsyncSession = Depends(get_db), student: User = Depends(require_role(ROLE_STUDENT))):
+    # the copy is streamed chunk by chunk, so a burst of large uploads does not
+    # hold the threadpool; checking and parsing the file happens afterwards in a
+    # background job (processing.py)
+    assignment = await db.get(Assignment, assignment_id)
     if not assignment:
         raise HTTPException(status_code=404, detail="Assignment not found")
     # NOTE: Enrollment checks removed — allow uploads regardless of CourseStudent links.
     # Keep a light audit log of upload attempts for debugging/monitoring.
     logging.info("Upload attempt (no-enrollment-check): assignment_id=%s, assignment.course_id=%s, student.id=%s", assignment_id, assignment.course_id, getattr(student, 'id', None))
     filename = f"submission_{assignment_id}_{student.id}_{int(datetime.utcnow().timestamp())}_{file.filename}"
-    with open(os.path.join(SUBMIT_DIR, filename), 'wb') as f:
-        f.write(file.file.read())
-    submission = Submission(assignment_id=assignment.id, student_id=student.id, file_name=filename)
-    db.add(submission)
-    db.commit()
-    db.refresh(submission)
+    saved = await store_upload(file)
+    logging.info("Stored submission %s (%d bytes, sha256=%s)", filename, saved.size, saved.sha256)
+    submission = Submission(assignment_id=assignment.id, student_id=student.id, file_name=filename, blob_sha256=saved.sha256, processing_status=PROCESSING_PENDING)
+    await _persist(db, submission, saved)
+    await enqueue_processing("submission", submission.id)
+    await bump(course_scope(assignment.course_id), student_scope(student.id))
+    mark_write(request, response)
+    await publish("submission.uploaded", [student_channel(student.id), teacher_channel(assignment.teacher_id)],
+                  course_id=assignment.course_id, assignment_id=assignment.id, submission_id=submission.id, student_id=student.id)
     return submission
 
+async def _persist(db: AsyncSession, obj, saved):
+    await db.run_sync(acquire, saved.sha256, saved.size, saved.path)
+    db.add(obj)
+    await db.flush()
+    await db.execute(record_upload(db.bind.dialect.name, obj))
+    await db.commit()
+    await db.refresh(obj)
+
 @router.get("/assignment/{assignment_id}", response_model=list[SubmissionRead])
-def list_my_submissions(assignment_id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
-    q = db.query(Submission).filter(Submission.assignment_id == assignment_id)
+async def list_my_submissions(assignment_id: int, request: Request, response: Response, since: datetime | None = None, graded: bool | None = None, latest: bool = False, page: Page = Depends(page_params), db: AsyncSession = Depends(get_read_db), user: User = Depends(get_current_user)):
+    # newest first; `since` keeps uploads at or after that instant, `graded`
+    # selects graded (true) or pending (false) submissions, `latest` keeps only
+    # each student's newest version. Rows go straight from the columns-only
+    # select to JSON: no ORM objects, no re-validation of our own data
+    q = select(*schema_columns(SubmissionRead, Submission)).where(Submission.assignment_id == assignment_id)
+    if latest:
+        q = q.join(LatestSubmission, LatestSubmission.submission_id == Submission.id)
+    if since is not None:
+        q = q.where(Submission.uploaded_at >= since)
+    if graded is not None:
+        q = q.where(Submission.grade.is_not(None) if graded else Submission.grade.is_(None))
     if user.role == ROLE_STUDENT:
-        q = q.filter(Submission.student_id == user.id)
+        q = q.where(Submission.student_id == user.id)
     elif user.role == ROLE_TEACHER:
-        assignment = db.query(Assignment).filter(Assignment.id == assignment_id, Assignment.teacher_id == user.id).first()
+        assignment = await _owned_assignment(db, assignment_id, user.id)
         if not assignment:
             raise HTTPException(status_code=403, detail="Not your assignment")
-    return q.order_by(Submission.uploaded_at.desc()).all()
+    rows = await paginate(db, q, [(Submission.uploaded_at, True), (Submission.id, True)], page, request, response, columns=True)
+    return json_response(row_dicts(SubmissionRead, rows), headers=dict(response.headers))
+
+async def _owned_assignment(db: AsyncSession, assignment_id: int, teacher_id: int):
+    return (await db.execute(select(Assignment).where(Assignment.id == assignment_id, Assignment.teacher_id == teacher_id))).scalar_one_or_none()
 
 @router.get("/{submission_id}/download")
-def download_submission(submission_id: int, db: Session = Depends(get_db), teacher: User = Depends(require_role(ROLE_TEACHER))):
-    submission = db.query(Submission).filter(Submission.id == submission_id).first()
+async def download_submission(submission_id: int, request: Request, db: AsyncSession = Depends(get_read_db), teacher: User = Depends(require_role(ROLE_TEACHER))):
+    submission = await db.get(Submission, submission_id)
     if not submission:
         raise HTTPException(status_code=404, detail="Not found")
-    assignment = db.query(Assignment).filter(Assignment.id == submission.assignment_id, Assignment.teacher_id == teacher.id).first()
+    assignment = await _owned_assignment(db, submission.assignment_id, teacher.id)
     if not assignment:
         raise HTTPException(status_code=403, detail="Not your assignment")
-    path = os.path.join(SUBMIT_DIR, submission.file_name)
-    if not os.path.exists(path):
-        raise HTTPException(status_code=404, detail="File missing")
-    with open(path, 'rb') as f:
-        return {"filename": submission.file_name, "content": f.read().decode('latin-1')}  # naive representation
+    if submission.purged_at:
+        raise HTTPException(status_code=410, detail="File removed by the retention policy")
+    # stat()/HEAD calls are blocking
+    return await run_in_threadpool(blob_response, request, submission.blob_sha256, submission.file_name, legacy_path=os.path.join(settings.SUBMIT_DIR, submission.file_name))
+
+@router.get("/assignment/{assignment_id}/archive")
+async def download_archive(assignment_id: int, versions: str = Query("latest", pattern="^(latest|all)$"), manifest: bool = True, db: AsyncSession = Depends(get_read_db), teacher: User = Depends(require_role(ROLE_TEACHER))):
+    # every submission in one streamed ZIP, a folder per student, instead of one
+    # download per file; manifest.csv lists grades and where each file went
+    assignment = await _owned_assignment(db, assignment_id, teacher.id)
+    if not assignment:
+        raise HTTPException(status_code=403, detail="Not your assignment")
+    q = select(Submission.id, Submission.student_id, Submission.file_name, Submission.blob_sha256, Submission.uploaded_at, Submission.grade,
+               Submission.comment, Submission.graded_at, Submission.processing_status, Submission.purged_at, User.name, User.email)
+    q = q.join(User, User.id == Submission.student_id).where(Submission.assignment_id == assignment_id)
+    if versions == "latest":
+        q = q.join(LatestSubmission, LatestSubmission.submission_id == Submission.id).add_columns(LatestSubmission.versions)
+    rows = (await db.execute(q.order_by(User.name, Submission.student_id, Submission.uploaded_at, Submission.id))).all()
+    # rows are read up front: the session is closed once streaming starts
+    entries = _archive_entries(rows, assignment.due_date, versions == "all", manifest)
+    headers = {"Content-Disposition": content_disposition(f"assignment_{assignment_id}_submissions.zip")}
+    return StreamingResponse(zip_stream(entries), media_type="application/zip", headers=headers)
+
+_MANIFEST_HEADER = ["student_id", "student_name", "email", "submission_id", "version", "uploaded_at", "late", "grade", "comment", "graded_at", "processing_status", "file"]
+
+def _archive_entries(rows, due_date, all_versions: bool, with_manifest: bool):
+    # sync generator: StreamingResponse runs it (and the blob reads) in the threadpool
+    manifest, used, counts = [], set(), {}
+    for r in rows:
+        counts[r.student_id] = version = counts.get(r.student_id, 0) + 1
+        if not all_versions:
+            version = r.versions
+        # stored names are submission_<assignment>_<student>_<ts>_<original>
+        original = r.file_name.split("_", 4)[-1] if r.file_name.startswith("submission_") else r.file_name
+        name = f"{safe_name(f'{r.name}_{r.student_id}')}/{f'v{version}_' if all_versions else ''}{safe_name(original)}"
+        stem, dot, ext = name.rpartition(".") if "." in name.rsplit("/", 1)[-1] else (name, "", "")
+        n = 1
+        while name in used:
+            n += 1
+            name = f"{stem}_{n}{dot}{ext}"
+        stored = None if r.purged_at else open_stored(r.blob_sha256, os.path.join(settings.SUBMIT_DIR, r.file_name))
+        if stored:
+            used.add(name)
+            size, reader = stored
+            yield ZipEntry(name, reader, size, r.uploaded_at)
+        elif not r.purged_at:
+            logging.warning("Archive of assignment: file of submission %s is missing", r.id)
+        manifest.append([r.student_id, r.name, r.email, r.id, version, r.uploaded_at.isoformat() if r.uploaded_at else "",
+                         "yes" if r.uploaded_at and r.uploaded_at > due_date else "no", "" if r.grade is None else r.grade,
+                         r.comment or "", r.graded_at.isoformat() if r.graded_at else "", r.processing_status or "", name if stored else "(purged)" if r.purged_at else "(missing)"])
+    if with_manifest:
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(_MANIFEST_HEADER)
+        # names, emails, comments and file names are user-typed
+        writer.writerows(map(csv_row, manifest))
+        body = buf.getvalue().encode()
+        yield ZipEntry("manifest.csv", lambda: [body], len(body))
+
+@router.get("/{submission_id}/thumbnail")
+async def submission_thumbnail(submission_id: int, request: Request, db: AsyncSession = Depends(get_read_db), teacher: User = Depends(require_role(ROLE_TEACHER))):
+    submission = await db.get(Submission, submission_id)
+    if not submission:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not await _owned_assignment(db, submission.assignment_id, teacher.id):
+        raise HTTPException(status_code=403, detail="Not your assignment")
+    return await thumbnail_response(request, db, submission.blob_sha256)
 
 @router.post("/{submission_id}/grade", response_model=SubmissionRead)
-def grade_submission(submission_id: int, payload: GradeSubmission, db: Session = Depends(get_db), teacher: User = Depends(require_role(ROLE_TEACHER))):
-    submission = db.query(Submission).filter(Submission.id == submission_id).first()
+async def grade_submission(submission_id: int, payload: GradeSubmission, request: Request, response: Response, db: AsyncSession = Depends(get_db), teacher: User = Depends(require_role(ROLE_TEACHER))):
+    submission = await db.get(Submission, submission_id)
     if not submission:
         raise HTTPException(status_code=404, detail="Not found")
-    assignment = db.query(Assignment).filter(Assignment.id == submission.assignment_id, Assignment.teacher_id == teacher.id).first()
+    assignment = await _owned_assignment(db, submission.assignment_id, teacher.id)
     if not assignment:
         raise HTTPException(status_code=403, detail="Not your assignment")
     submission.grade = payload.grade
     submission.comment = payload.comment
     submission.graded_at = datetime.utcnow()
-    db.commit()
-    db.refresh(submission)
+    await db.execute(record_grade(submission))
+    await db.commit()
+    await db.refresh(submission)
+    await bump(course_scope(assignment.course_id), student_scope(submission.student_id))
+    mark_write(request, response)
+    await publish("submission.graded", [student_channel(submission.student_id), teacher_channel(teacher.id)],
+                  course_id=assignment.course_id, assignment_id=assignment.id, submission_id=submission.id, student_id=submission.student_id, grade=submission.grade)
     return submission
+
+@router.post("/grades:batch", response_model=BatchResult)
+async def grade_submissions_batch(payload: GradeBatch, request: Request, response: Response, db: AsyncSession = Depends(get_db), teacher: User = Depends(require_role(ROLE_TEACHER))):
+    # one ownership query for every submission, one executemany UPDATE (plus the
+    # latest_submissions one) and a single commit
+    check_batch_size(len(payload.grades))
+    ids = {g.submission_id for g in payload.grades}
+    found = (await db.execute(
+        select(Submission.id, Submission.student_id, Submission.assignment_id, Assignment.teacher_id, Assignment.course_id).join(Assignment, Assignment.id == Submission.assignment_id).where(Submission.id.in_(ids))
+    )).all()
+    owners = {r.id: r.teacher_id for r in found}
+    now = datetime.utcnow()
+    results, params, seen = [], [], set()
+    for n, g in enumerate(payload.grades):
+        if g.submission_id not in owners:
+            status = "not_found"
+        elif owners[g.submission_id] != teacher.id:
+            status = "forbidden"
+        elif g.submission_id in seen:
+            status = "duplicate"
+        else:
+            status = "graded"
+            seen.add(g.submission_id)
+            params.append({"b_submission_id": g.submission_id, "b_grade": g.grade, "b_comment": g.comment, "b_graded_at": now})
+        results.append({"index": n, "id": g.submission_id, "status": status})
+    if params:
+        table = Submission.__table__
+        stmt = update(table).where(table.c.id == bindparam("b_submission_id")).values(grade=bindparam("b_grade"), comment=bindparam("b_comment"), graded_at=bindparam("b_graded_at"))
+        await db.execute(stmt, params)
+        await db.execute(record_grades(), params)
+        await db.commit()
+        graded = [r for r in found if r.id in seen]
+        await bump(*{course_scope(r.course_id) for r in graded}, *{student_scope(r.student_id) for r in graded})
+        mark_write(request, response)
+        grades = {p["b_submission_id"]: p["b_grade"] for p in params}
+        for r in graded:
+            await publish("submission.graded", [student_channel(r.student_id), teacher_channel(teacher.id)],
+                          course_id=r.course_id, assignment_id=r.assignment_id, submission_id=r.id, student_id=r.student_id, grade=grades[r.id])
+    return summarize(results, {"graded"})
@@ -35,6 +35,10 @@ class CourseRead(CourseBase):
 class CourseStudentAdd(BaseModel):
     student_id: int
 
+class CourseStudentBatch(BaseModel):
+    student_ids: List[int] = []
+    emails: List[str] = []
+
 # Parent-child link
 class ParentChildCreate(BaseModel):
     parent_id: int
@@ -55,6 +59,8 @@ class AssignmentRead(AssignmentBase):
     teacher_id: int
     attachment_filename: Optional[str]
     created_at: datetime
+    processing_status: Optional[str] = None
+    page_count: Optional[int] = None
     class Config:
         from_attributes = True
 
@@ -68,6 +74,9 @@ class SubmissionRead(BaseModel):
     grade: Optional[int]
     comment: Optional[str]
     graded_at: Optional[datetime]
+    processing_status: Optional[str] = None
+    page_count: Optional[int] = None
+    purged_at: Optional[datetime] = None
     class Config:
         from_attributes = True
 
@@ -75,6 +84,24 @@ class GradeSubmission(BaseModel):
     grade: int
     comment: Optional[str] = None
 
+class SubmissionGradeItem(GradeSubmission):
+    submission_id: int
+
+class GradeBatch(BaseModel):
+    grades: List[SubmissionGradeItem]
+
+# Batch results: one entry per request item, in request order
+class BatchItemResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    email: Optional[str] = None
+    status: str
+
+class BatchResult(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[BatchItemResult]
+
 # Report schemas
 class AssignmentReportItem(BaseModel):
     assignment_id: int
@@ -87,3 +114,22 @@ class StudentReport(BaseModel):
     student_id: int
     student_name: str
     assignments: List[AssignmentReportItem]
+
+# Parent home screen: every linked child at once, each assignment listed in
+# exactly one of graded/submitted/upcoming/missing
+class FamilyAssignmentItem(AssignmentReportItem):
+    course_id: int
+    course_name: str
+
+class ChildSummary(BaseModel):
+    student_id: int
+    student_name: str
+    average_grade: Optional[float]
+    graded: List[FamilyAssignmentItem]
+    submitted: List[FamilyAssignmentItem]
+    upcoming: List[FamilyAssignmentItem]
+    missing: List[FamilyAssignmentItem]
+
+class FamilyReport(BaseModel):
+    generated_at: datetime
+    children: List[ChildSummary]
@@ -0,0 +1,53 @@
+import logging
+import os
+import tempfile
+
+# Process-wide settings read once at import. Importing this module has no side
+# effects: directories are created by prepare_storage() from the app lifespan.
+#
+#   STORAGE_ROOT    base folder for uploaded files (blobs and legacy per-file
+#                   folders); relative paths resolve against the working dir
+#   RUN_MIGRATIONS  1 (default): every process brings the schema to head at
+#                   startup, serialized by a lock, and skips Alembic entirely
+#                   when it is already there; 0: never (migrations run by the
+#                   deploy, `alembic upgrade head` or the preload master)
+#   WEB_CONCURRENCY API processes serving this database (uvicorn --workers
+#                   reads it too; gunicorn_conf.py sets WORKERS in each worker).
+#                   In-process state (response cache counters, SSE broker)
+#                   needs its shared backend when there is more than one
+STORAGE_ROOT = os.getenv("STORAGE_ROOT", os.path.join("backend", "storage"))
+RUN_MIGRATIONS = os.getenv("RUN_MIGRATIONS", "1").lower() in ("1", "true", "yes")
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# files written before the blob store existed; still read for old rows
+SUBMIT_DIR = os.path.join(STORAGE_ROOT, "submissions")
+ATTACH_DIR = os.path.join(STORAGE_ROOT, "assignments")
+
+_prepared = False
+
+
+def prepare_storage() -> None:
+    global ATTACH_DIR, SUBMIT_DIR, _prepared
+    if _prepared:
+        return
+    _prepared = True
+    SUBMIT_DIR = _writable_dir(SUBMIT_DIR, "submissions")
+    ATTACH_DIR = _writable_dir(ATTACH_DIR, "assignments")
+
+
+# A mounted volume owned by root may refuse the folder; fall back to a temp
+# location so the API stays up instead of failing at startup.
+def _writable_dir(path: str, name: str) -> str:
+    try:
+        os.makedirs(path, exist_ok=True)
+        return path
+    except PermissionError:
+        fallback = os.path.join(tempfile.gettempdir(), "plataforma_storage", name)
+        try:
+            os.makedirs(fallback, exist_ok=True)
+            logging.warning("Permission denied creating %s; using fallback %s", path, fallback)
+            return fallback
+        except Exception as e:
+            # last resort: reads/writes may still fail later, with clearer errors
+            logging.exception("Failed to create fallback %s dir: %s", name, e)
+            return tempfile.gettempdir()
@@ -0,0 +1,182 @@
+from sqlalchemy import select, update, func, or_
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from typing import Optional
+import logging
+import os
+from . import settings
+from .blobstore import get_blobstore, release, collect_garbage
+from .models import Assignment, Blob, LatestSubmission, Submission, PROCESSING_PENDING, PROCESSING_RUNNING
+from .utils.compression import choose_codec
+
+# Storage lifecycle for submission files, run periodically with
+# tools/storage_lifecycle.py:
+#   retention    with RETENTION_KEEP_VERSIONS=N, each student keeps the files of
+#                their N newest versions per assignment plus every graded one;
+#                older files are removed (the rows, grades and comments stay,
+#                with purged_at set) and collected by the blob GC
+#   compression  blobs only referenced by superseded versions, last uploaded
+#                more than COMPRESS_AFTER_DAYS ago, are stored compressed
+#                (codec per file type, see utils/compression.py); downloads
+#                decompress them transparently
+# The latest version of every pair and assignment attachments are never
+# touched, so the API serves them exactly as before.
+COMPRESS_AFTER_DAYS = float(os.getenv("COMPRESS_AFTER_DAYS", "30"))
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "4096"))
+# keep the compressed copy only if it saves at least this fraction
+COMPRESS_MIN_SAVING = float(os.getenv("COMPRESS_MIN_SAVING", "0.1"))
+RETENTION_KEEP_VERSIONS = int(os.getenv("RETENTION_KEEP_VERSIONS", "0"))  # 0: keep every version
+
+BATCH_SIZE = 500
+
+
+def _current_blobs():
+    latest = select(Submission.blob_sha256).join(LatestSubmission, LatestSubmission.submission_id == Submission.id).where(Submission.blob_sha256.is_not(None))
+    attachments = select(Assignment.attachment_sha256).where(Assignment.attachment_sha256.is_not(None))
+    return latest, attachments
+
+
+def _compressible_query(cutoff: datetime):
+    latest, attachments = _current_blobs()
+    refs = (
+        select(Submission.blob_sha256.label("sha256"), func.max(Submission.uploaded_at).label("last_upload"), func.min(Submission.file_name).label("file_name"))
+        .where(Submission.blob_sha256.is_not(None))
+        .group_by(Submission.blob_sha256)
+        .subquery()
+    )
+    return (
+        select(Blob.sha256, Blob.size, Blob.content_type, refs.c.file_name)
+        .join(refs, refs.c.sha256 == Blob.sha256)
+        .where(Blob.refcount > 0, Blob.compacted_at.is_(None), Blob.size >= COMPRESS_MIN_BYTES, refs.c.last_upload < cutoff,
+               Blob.sha256.not_in(latest), Blob.sha256.not_in(attachments))
+        .order_by(Blob.size.desc())
+    )
+
+
+def _still_superseded(db: Session, sha256: str, cutoff: datetime) -> bool:
+    # a student may have uploaded the same file again while it was compressing
+    latest, attachments = _current_blobs()
+    recent = select(Submission.id).where(Submission.blob_sha256 == sha256, Submission.uploaded_at >= cutoff)
+    clash = select(Blob.sha256).where(Blob.sha256 == sha256, or_(Blob.sha256.in_(latest), Blob.sha256.in_(attachments), recent.exists()))
+    return db.execute(clash).first() is None
+
+
+def compress_superseded(db: Session, older_than: timedelta, dry_run: bool = False, limit: Optional[int] = None) -> dict:
+    store = get_blobstore()
+    cutoff = datetime.utcnow() - older_than
+    stats = {"candidates": 0, "compressed": 0, "skipped": 0, "bytes_before": 0, "bytes_after": 0, "by_encoding": {}}
+    query = _compressible_query(cutoff)
+    if limit:
+        query = query.limit(limit)
+    rows = db.execute(query).all()
+    stats["candidates"] = len(rows)
+    for r in rows:
+        codec = choose_codec(r.file_name, r.content_type)
+        if dry_run:
+            stats["skipped" if codec is None else "compressed"] += 1
+            stats["bytes_before"] += 0 if codec is None else r.size
+            continue
+        stored = None
+        if codec is not None:
+            encoding, level = codec
+            try:
+                stored = store.compress(r.sha256, encoding, level, max_size=int(r.size * (1 - COMPRESS_MIN_SAVING)))
+            except FileNotFoundError:
+                logging.warning("Storage lifecycle: blob %s is missing, not compressed", r.sha256)
+                continue
+        now = datetime.utcnow()
+        if stored is None:
+            # incompressible type or not worth it: remember, do not try again
+            db.execute(update(Blob).where(Blob.sha256 == r.sha256).values(compacted_at=now))
+            db.commit()
+            stats["skipped"] += 1
+            continue
+        if not _still_superseded(db, r.sha256, cutoff):
+            store.discard(r.sha256, encoding)
+            continue
+        db.execute(update(Blob).where(Blob.sha256 == r.sha256).values(encoding=encoding, stored_size=stored, compacted_at=now))
+        db.commit()
+        # recorded first: a crash in between leaves both copies, never neither
+        store.discard(r.sha256, None)
+        stats["compressed"] += 1
+        stats["bytes_before"] += r.size
+        stats["bytes_after"] += stored
+        stats["by_encoding"][encoding] = stats["by_encoding"].get(encoding, 0) + 1
+    stats["bytes_reclaimed"] = 0 if dry_run else stats["bytes_before"] - stats["bytes_after"]
+    logging.info("Storage lifecycle compression%s: %s", " (dry run)" if dry_run else "", stats)
+    return stats
+
+
+def _retention_query(keep: int):
+    # rank over every version, purged or not, so the kept set never shifts
+    rank = func.row_number().over(
+        partition_by=(Submission.assignment_id, Submission.student_id),
+        order_by=(Submission.uploaded_at.desc(), Submission.id.desc()),
+    ).label("rank")
+    ranked = select(Submission.id, Submission.blob_sha256, Submission.file_name, Submission.grade, Submission.purged_at, Submission.processing_status, rank).subquery()
+    return (
+        select(ranked.c.id, ranked.c.blob_sha256, ranked.c.file_name)
+        .where(ranked.c.rank > keep, ranked.c.grade.is_(None), ranked.c.purged_at.is_(None),
+               or_(ranked.c.processing_status.is_(None), ranked.c.processing_status.not_in((PROCESSING_PENDING, PROCESSING_RUNNING))))
+        .order_by(ranked.c.id)
+    )
+
+
+def apply_retention(db: Session, keep: int, dry_run: bool = False) -> dict:
+    stats = {"keep_versions": keep, "versions_purged": 0, "legacy_files_deleted": 0, "legacy_bytes_freed": 0}
+    if keep <= 0:
+        return stats
+    rows = db.execute(_retention_query(keep)).all()
+    if dry_run:
+        stats["versions_purged"] = len(rows)
+        return stats
+    settings.prepare_storage()
+    for i in range(0, len(rows), BATCH_SIZE):
+        batch, legacy = rows[i:i + BATCH_SIZE], []
+        now = datetime.utcnow()
+        for r in batch:
+            if r.blob_sha256:
+                release(db, r.blob_sha256)
+            else:
+                legacy.append(os.path.join(settings.SUBMIT_DIR, r.file_name))
+        # purged_at IS NULL: a concurrent run must not release the same blob twice
+        purged = db.execute(
+            update(Submission)
+            .where(Submission.id.in_([r.id for r in batch]), Submission.purged_at.is_(None))
+            .values(blob_sha256=None, purged_at=now)
+        ).rowcount
+        if purged != len(batch):
+            db.rollback()
+            raise RuntimeError("Another storage lifecycle run is purging the same versions")
+        db.commit()
+        stats["versions_purged"] += purged
+        for path in legacy:
+            try:
+                size = os.path.getsize(path)
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            stats["legacy_files_deleted"] += 1
+            stats["legacy_bytes_freed"] += size
+    logging.info("Storage lifecycle retention: %s", stats)
+    return stats
+
+
+def run_lifecycle(db: Session, compress_after: timedelta, keep: int, dry_run: bool = False, limit: Optional[int] = None) -> dict:
+    # retention first, so files about to be removed are not compressed
+    report = {"retention": apply_retention(db, keep, dry_run)}
+    if report["retention"]["versions_purged"] and not dry_run:
+        report["gc"] = collect_garbage(db)
+    report["compression"] = compress_superseded(db, compress_after, dry_run, limit)
+    report["bytes_reclaimed"] = (report["compression"]["bytes_reclaimed"] + report["retention"]["legacy_bytes_freed"]
+                                 + report.get("gc", {}).get("bytes_freed", 0))
+    report["stored"] = storage_totals(db)
+    return report
+
+
+def storage_totals(db: Session) -> dict:
+    row = db.execute(select(
+        func.count(), func.coalesce(func.sum(Blob.size), 0), func.coalesce(func.sum(func.coalesce(Blob.stored_size, Blob.size)), 0),
+        func.count(Blob.encoding),
+    ).where(Blob.refcount > 0)).one()
+    return {"blobs": row[0], "original_bytes": row[1], "stored_bytes": row[2], "compressed_blobs": row[3]}
@@ -0,0 +1,114 @@
+# Benchmark /reports/course/{id}/gradebook against the per-student loop it replaces.
+#   python -m backend.tools.bench_gradebook --students 40 --assignments 60 --versions 3
+# Seeds a throwaway SQLite database (plus `--other-courses` courses of the same
+# shape so the tables hold unrelated rows) and prints JSON with the median DB
+# time, total build time and SQL statement count of the gradebook next to
+# calling the student report once per enrolled student.
+import argparse, json, os, statistics, tempfile, time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, event, func, insert, select
+from sqlalchemy.orm import sessionmaker
+from backend.database import Base
+from backend.models import User, Course, CourseStudent, Assignment, Submission, ROLE_STUDENT, ROLE_TEACHER
+from backend.latest_submissions import rebuild
+from backend.routers.reports import _gradebook_queries, _build_gradebook, _gradebook_json, _student_report_query
+
+
+def seed(db, students: int, assignments: int, versions: int, courses: int) -> int:
+    teacher = User(name="t", email="t@bench", hashed_password="x", role=ROLE_TEACHER)
+    db.add(teacher)
+    db.flush()
+    base = datetime(2024, 1, 1)
+    first = None
+    for c in range(courses):
+        course = Course(name=f"c{c}", teacher_id=teacher.id)
+        db.add(course)
+        db.flush()
+        first = first or course.id
+        people = [User(name=f"s{c}_{i}", email=f"s{c}_{i}@bench", hashed_password="x", role=ROLE_STUDENT) for i in range(students)]
+        db.add_all(people)
+        db.flush()
+        db.execute(insert(CourseStudent), [{"course_id": course.id, "student_id": s.id} for s in people])
+        tasks = [Assignment(course_id=course.id, teacher_id=teacher.id, title=f"a{i}", due_date=base + timedelta(days=i)) for i in range(assignments)]
+        db.add_all(tasks)
+        db.flush()
+        rows = []
+        for a_idx, a in enumerate(tasks):
+            for s_idx, s in enumerate(people):
+                if (a_idx + s_idx) % 7 == 0:
+                    continue  # some missing work
+                for v in range(versions):
+                    rows.append({"assignment_id": a.id, "student_id": s.id, "file_name": f"f{a.id}_{s.id}_{v}",
+                                 "uploaded_at": a.due_date - timedelta(hours=12) + timedelta(hours=8 * v), "grade": (a_idx + v) % 10})
+        db.execute(insert(Submission), rows)
+    db.commit()
+    rebuild(db)
+    return first
+
+
+def gradebook(db, course_id):
+    course = db.execute(select(Course.id, Course.name).where(Course.id == course_id)).first()
+    start = time.perf_counter()
+    assignments, roster, cells = (db.execute(stmt).all() for stmt in _gradebook_queries(course_id))
+    db_ms = (time.perf_counter() - start) * 1000
+    body = "".join(_gradebook_json(_build_gradebook(course, assignments, roster, cells)))
+    return db_ms, len(body)
+
+
+def per_student(db, course_id):
+    # what a client had to do before: one report request per enrolled student
+    start = time.perf_counter()
+    ids = db.execute(select(CourseStudent.student_id).where(CourseStudent.course_id == course_id)).scalars().all()
+    for sid in ids:
+        db.execute(_student_report_query(sid)).all()
+    return (time.perf_counter() - start) * 1000, None
+
+
+def measure(fn, db, course_id, repeat: int):
+    statements = []
+    listener = lambda *a: statements.append(1)
+    event.listen(db.get_bind(), "before_cursor_execute", listener)
+    db_times, totals = [], []
+    try:
+        for _ in range(repeat):
+            statements.clear()
+            start = time.perf_counter()
+            db_ms, size = fn(db, course_id)
+            totals.append((time.perf_counter() - start) * 1000)
+            db_times.append(db_ms)
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", listener)
+    result = {"db_ms": round(statistics.median(db_times), 3), "total_ms": round(statistics.median(totals), 3), "statements": len(statements)}
+    if size is not None:
+        result["json_bytes"] = size
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, default=40)
+    parser.add_argument("--assignments", type=int, default=60)
+    parser.add_argument("--versions", type=int, default=3)
+    parser.add_argument("--other-courses", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}", future=True)
+        Base.metadata.create_all(engine)
+        db = sessionmaker(bind=engine, future=True)()
+        course_id = seed(db, args.students, args.assignments, args.versions, args.other_courses + 1)
+        result = {
+            "students": args.students,
+            "assignments": args.assignments,
+            "versions_per_submission": args.versions,
+            "submission_rows": db.execute(select(func.count()).select_from(Submission)).scalar(),
+            "gradebook": measure(gradebook, db, course_id, args.repeat),
+            "report_per_student": measure(per_student, db, course_id, args.repeat),
+        }
+        db.close()
+        engine.dispose()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
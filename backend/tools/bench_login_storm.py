@@ -0,0 +1,117 @@
+# Load test: does a burst of logins slow down unrelated endpoints?
+#   python -m backend.tools.bench_login_storm --logins 500
+# Starts uvicorn on a scratch SQLite database, seeds users, measures GET /courses/
+# latency at rest and again while N logins hit /auth/login concurrently, and
+# prints JSON. Needs httpx (pip install httpx).
+import argparse, asyncio, json, os, socket, subprocess, sys, tempfile, time
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"n": len(samples), "p50_ms": round(pick(0.50), 2), "p95_ms": round(pick(0.95), 2), "p99_ms": round(pick(0.99), 2), "max_ms": round(ordered[-1], 2)}
+
+
+def seed(users: int, rounds: int):
+    from sqlalchemy import insert
+    from backend.database import SessionLocal, run_migrations
+    from backend.models import User, Course, ROLE_STUDENT, ROLE_TEACHER
+    from passlib.context import CryptContext
+    run_migrations()
+    hashed = CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds).hash("password")
+    db = SessionLocal()
+    db.execute(insert(User), [{"name": f"u{i}", "email": f"u{i}@load.test", "hashed_password": hashed, "role": ROLE_STUDENT} for i in range(users)])
+    teacher = User(name="teacher", email="teacher@load.test", hashed_password=hashed, role=ROLE_TEACHER)
+    db.add(teacher)
+    db.flush()
+    db.add_all([Course(name=f"c{i}", teacher_id=teacher.id) for i in range(20)])
+    db.commit()
+    db.close()
+
+
+async def poll(client, headers, stop: asyncio.Event, interval: float, out: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        r = await client.get("/courses/", headers=headers)
+        r.raise_for_status()
+        out.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(interval)
+
+
+async def run(base_url: str, logins: int, interval: float) -> dict:
+    import httpx
+    limits = httpx.Limits(max_connections=logins + 10)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        r = await client.post("/auth/login", data={"username": "teacher@load.test", "password": "password"})
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+        idle: list = []
+        stop = asyncio.Event()
+        poller = asyncio.create_task(poll(client, headers, stop, interval, idle))
+        await asyncio.sleep(3)
+        stop.set()
+        await poller
+
+        during: list = []
+        stop = asyncio.Event()
+        poller = asyncio.create_task(poll(client, headers, stop, interval, during))
+        login_ms: list = []
+        statuses: dict = {}
+
+        async def one_login(i):
+            start = time.perf_counter()
+            r = await client.post("/auth/login", data={"username": f"u{i}@load.test", "password": "password"})
+            login_ms.append((time.perf_counter() - start) * 1000)
+            statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one_login(i) for i in range(logins)))
+        storm_s = time.perf_counter() - started
+        stop.set()
+        await poller
+    return {
+        "logins": logins,
+        "storm_seconds": round(storm_s, 2),
+        "login_status_counts": statuses,
+        "login_latency": percentiles(login_ms),
+        "courses_latency_idle": percentiles(idle),
+        "courses_latency_during_storm": percentiles(during),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=int(os.getenv("BCRYPT_ROUNDS", "12")))
+    parser.add_argument("--poll-interval", type=float, default=0.02)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**os.environ, "DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'load.db')}", "BCRYPT_ROUNDS": str(args.rounds)}
+        os.environ.update(env)
+        seed(args.logins, args.rounds)
+        port = free_port()
+        server = subprocess.Popen([sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"], env=env)
+        try:
+            for _ in range(100):
+                try:
+                    socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            result = asyncio.run(run(f"http://127.0.0.1:{port}", args.logins, args.poll_interval))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
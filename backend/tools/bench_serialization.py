@@ -0,0 +1,113 @@
+# Benchmark list serialization: ORM + response_model validation + stdlib JSON
+# (how FastAPI encodes a returned list of entities) against the columns-only
+# select + direct encoding used by the list and report endpoints.
+#   python -m backend.tools.bench_serialization --rows 10000 --repeat 5
+# Seeds a throwaway SQLite database with --rows submissions of one assignment
+# and prints JSON with the median time and the cost per row of each stage:
+#   fetch      run the select and build rows (ORM entities / plain rows)
+#   serialize  turn them into the response body
+import argparse, asyncio, json, os, statistics, tempfile, time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import sessionmaker
+from starlette.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from backend.database import Base
+from backend.models import User, Course, Assignment, Submission, ROLE_STUDENT, ROLE_TEACHER
+from backend.schemas import SubmissionRead
+from backend.utils.serialization import schema_columns, row_dicts, dumps
+
+
+def seed(db, rows: int, students: int) -> int:
+    teacher = User(name="t", email="t@bench", hashed_password="x", role=ROLE_TEACHER)
+    db.add(teacher)
+    db.flush()
+    course = Course(name="bench", teacher_id=teacher.id)
+    db.add(course)
+    db.flush()
+    assignment = Assignment(course_id=course.id, teacher_id=teacher.id, title="a", due_date=datetime(2030, 1, 1))
+    db.add(assignment)
+    db.flush()
+    db.execute(insert(User), [{"name": f"s{i}", "email": f"s{i}@bench", "hashed_password": "x", "role": ROLE_STUDENT} for i in range(students)])
+    base = datetime(2024, 1, 1)
+    db.execute(insert(Submission), [
+        {"assignment_id": assignment.id, "student_id": 2 + i % students, "file_name": f"submission_{assignment.id}_{i}_tarea final ñ.pdf",
+         "uploaded_at": base + timedelta(seconds=i, microseconds=i % 1000), "grade": i % 10 if i % 3 else None,
+         "comment": "Bien hecho" if i % 3 else None, "graded_at": base + timedelta(days=1) if i % 3 else None,
+         "processing_status": "ready", "page_count": 1 + i % 5}
+        for i in range(rows)
+    ])
+    db.commit()
+    return assignment.id
+
+
+def orm_fetch(db, assignment_id: int):
+    return db.execute(select(Submission).where(Submission.assignment_id == assignment_id).order_by(Submission.uploaded_at.desc(), Submission.id.desc())).scalars().all()
+
+
+def columns_fetch(db, assignment_id: int):
+    q = select(*schema_columns(SubmissionRead, Submission)).where(Submission.assignment_id == assignment_id)
+    return db.execute(q.order_by(Submission.uploaded_at.desc(), Submission.id.desc())).all()
+
+
+_field = create_model_field(name="Response_list_my_submissions", type_=list[SubmissionRead], mode="serialization")
+
+
+def fastapi_serialize(rows) -> bytes:
+    # what a route with response_model=list[SubmissionRead] does with the return value
+    content = asyncio.run(serialize_response(field=_field, response_content=rows))
+    return JSONResponse(content).body
+
+
+def fast_serialize(rows) -> bytes:
+    return dumps(row_dicts(SubmissionRead, rows))
+
+
+def measure(fn, repeat: int, before=None):
+    timings = []
+    for _ in range(repeat):
+        if before:
+            before()
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--students", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}", future=True)
+        Base.metadata.create_all(engine)
+        db = sessionmaker(bind=engine, future=True)()
+        assignment_id = seed(db, args.rows, args.students)
+        # fresh identity map each time, as in a request
+        fetch_orm, entities = measure(lambda: orm_fetch(db, assignment_id), args.repeat, before=db.expunge_all)
+        fetch_cols, rows = measure(lambda: columns_fetch(db, assignment_id), args.repeat)
+        ser_before, body_before = measure(lambda: fastapi_serialize(entities), args.repeat)
+        ser_after, body_after = measure(lambda: fast_serialize(rows), args.repeat)
+        db.close()
+        engine.dispose()
+    if json.loads(body_before) != json.loads(body_after):
+        raise SystemExit("bodies differ: the fast path must return the same JSON")
+
+    def stage(seconds: float) -> dict:
+        return {"ms": round(seconds * 1000, 2), "us_per_row": round(seconds * 1e6 / args.rows, 3)}
+
+    before, after = fetch_orm + ser_before, fetch_cols + ser_after
+    print(json.dumps({
+        "rows": args.rows,
+        "body_bytes": len(body_after),
+        "before": {"fetch": stage(fetch_orm), "serialize": stage(ser_before), "total": stage(before)},
+        "after": {"fetch": stage(fetch_cols), "serialize": stage(ser_after), "total": stage(after)},
+        "speedup": {"serialize": round(ser_before / ser_after, 1), "total": round(before / after, 1)},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# Benchmark /reports/me report building against the number of submission versions.
+#   python -m backend.tools.bench_student_report --assignments 50 --versions 1 10 50 200 --classmates 20
+# Seeds a throwaway SQLite database per run and prints JSON with the median time
+# and SQL statement count of the report query next to the old per-assignment
+# loop, so the single-query version can be seen to stay flat.
+import argparse, json, os, statistics, tempfile, time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import sessionmaker
+from backend.database import Base
+from backend.models import User, Course, CourseStudent, Assignment, Submission, ROLE_STUDENT, ROLE_TEACHER
+from backend.latest_submissions import rebuild
+from backend.routers.reports import _student_report_query, _report_from_rows
+
+
+# same statement the async endpoint runs, executed on a sync session
+def report(db, student):
+    return _report_from_rows(student, db.execute(_student_report_query(student.id)).all())
+
+
+def legacy_report(db, student):
+    # the pre-rewrite implementation, kept here only as a baseline
+    submissions = db.query(Submission).filter(Submission.student_id == student.id).all()
+    latest = {}
+    for s in sorted(submissions, key=lambda x: x.uploaded_at):
+        latest[s.assignment_id] = s
+    return [(db.query(Assignment).filter(Assignment.id == aid).first(), s.grade) for aid, s in latest.items()]
+
+
+# The measured student plus `classmates` others with the same history, so the
+# submissions table holds other people's rows as it would in production.
+def seed(db, assignments: int, versions: int, classmates: int = 0) -> User:
+    teacher = User(name="t", email="t@bench", hashed_password="x", role=ROLE_TEACHER)
+    students = [User(name=f"s{i}", email=f"s{i}@bench", hashed_password="x", role=ROLE_STUDENT) for i in range(classmates + 1)]
+    db.add_all([teacher, *students])
+    db.flush()
+    course = Course(name="bench", teacher_id=teacher.id)
+    db.add(course)
+    db.flush()
+    db.add_all([CourseStudent(course_id=course.id, student_id=s.id) for s in students])
+    base = datetime(2024, 1, 1)
+    rows = []
+    for i in range(assignments):
+        a = Assignment(course_id=course.id, teacher_id=teacher.id, title=f"a{i}", due_date=base + timedelta(days=i))
+        db.add(a)
+        db.flush()
+        for s in students:
+            for v in range(versions):
+                rows.append({"assignment_id": a.id, "student_id": s.id, "file_name": f"f{i}_{v}", "uploaded_at": base + timedelta(minutes=v), "grade": v % 10})
+    db.execute(insert(Submission), rows)
+    db.commit()
+    rebuild(db)
+    return students[0]
+
+
+def measure(fn, db, student, repeat: int):
+    statements = []
+    listener = lambda *a: statements.append(1)
+    event.listen(db.get_bind(), "before_cursor_execute", listener)
+    timings = []
+    try:
+        for _ in range(repeat):
+            student.name  # reload the expired principal outside the measured window
+            statements.clear()
+            start = time.perf_counter()
+            fn(db, student)
+            timings.append((time.perf_counter() - start) * 1000)
+            db.expire_all()
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", listener)
+    return {"ms": round(statistics.median(timings), 3), "statements": len(statements)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--assignments", type=int, default=50)
+    parser.add_argument("--versions", type=int, nargs="+", default=[1, 10, 50, 200])
+    parser.add_argument("--classmates", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    results = []
+    for versions in args.versions:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}", future=True)
+            Base.metadata.create_all(engine)
+            db = sessionmaker(bind=engine, future=True)()
+            student = seed(db, args.assignments, versions, args.classmates)
+            results.append({
+                "assignments": args.assignments,
+                "versions_per_assignment": versions,
+                "student_submissions": args.assignments * versions,
+                "table_rows": args.assignments * versions * (args.classmates + 1),
+                "report": measure(report, db, student, args.repeat),
+                "legacy": measure(legacy_report, db, student, args.repeat),
+            })
+            db.close()
+            engine.dispose()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
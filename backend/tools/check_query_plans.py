@@ -0,0 +1,89 @@
+# Assert that the hot router queries are served by indexes, not full table scans.
+#   python -m backend.tools.check_query_plans                       # fresh SQLite db
+#   python -m backend.tools.check_query_plans --url postgresql+psycopg://u:p@localhost/db
+# The schema is created through the Alembic migrations, so this also checks that
+# the migrations ship the indexes the models declare. Exits 1 on any full scan.
+import argparse, os, re, sys, tempfile
+from datetime import datetime
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--url", help="database to check (default: a throwaway SQLite file)")
+args = parser.parse_args()
+tmpdir = None
+if args.url:
+    os.environ["DATABASE_URL"] = args.url
+else:
+    tmpdir = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmpdir.name, 'plans.db')}"
+
+from sqlalchemy import select, text  # noqa: E402
+from backend.database import engine, run_migrations  # noqa: E402
+from backend.models import Assignment, Course, CourseStudent, ParentChild, Submission, User  # noqa: E402
+from backend.routers.reports import _student_report_query, _family_report_query, _gradebook_queries  # noqa: E402
+
+TABLES = ("users", "courses", "course_students", "parent_child", "assignments", "submissions", "blobs")
+
+# (name, statement) pairs mirroring the filters in routers/
+QUERIES = [
+    ("list_my_submissions (student)", select(Submission).where(Submission.assignment_id == 1, Submission.student_id == 2).order_by(Submission.uploaded_at.desc())),
+    ("list_my_submissions (teacher)", select(Submission).where(Submission.assignment_id == 1).order_by(Submission.uploaded_at.desc())),
+    ("list_my_submissions next page", select(Submission).where(Submission.assignment_id == 1, Submission.uploaded_at < datetime(2030, 1, 1)).order_by(Submission.uploaded_at.desc(), Submission.id.desc()).limit(51)),
+    ("list_assignments next page", select(Assignment).where(Assignment.course_id == 1, Assignment.due_date > datetime(2030, 1, 1)).order_by(Assignment.due_date, Assignment.id).limit(51)),
+    ("add_student enrollment check", select(CourseStudent).where(CourseStudent.course_id == 1, CourseStudent.student_id == 2)),
+    ("list_courses (student)", select(Course).join(CourseStudent, CourseStudent.course_id == Course.id).where(CourseStudent.student_id == 2)),
+    ("list_courses (teacher)", select(Course).where(Course.teacher_id == 1)),
+    ("list_assignments", select(Assignment).where(Assignment.course_id == 1, Assignment.teacher_id == 1)),
+    ("teacher owns assignment", select(Assignment).where(Assignment.id == 1, Assignment.teacher_id == 1)),
+    ("parent link", select(ParentChild).where(ParentChild.parent_id == 3, ParentChild.child_id == 2)),
+    ("parent children", select(ParentChild).where(ParentChild.parent_id == 3)),
+    ("teacher of student", select(CourseStudent).join(Assignment, Assignment.course_id == CourseStudent.course_id).where(CourseStudent.student_id == 2, Assignment.teacher_id == 1)),
+    ("login lookup", select(User).where(User.email == "a@b.c")),
+    ("student report", _student_report_query(2)),
+    ("family report", _family_report_query(3)),
+    ("gradebook assignments", _gradebook_queries(1)[0]),
+    ("gradebook roster", _gradebook_queries(1)[1]),
+    ("gradebook cells", _gradebook_queries(1)[2]),
+]
+
+
+def sqlite_plan(conn, sql):
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql).all()
+    plan = [r[3] for r in rows]
+    # "SCAN <table>" without an index is a full table scan; scans of subqueries/CTEs are fine
+    bad = [p for p in plan if re.match(rf"SCAN ({'|'.join(TABLES)})\b", p) and "INDEX" not in p]
+    return plan, bad
+
+
+def postgres_plan(conn, sql):
+    # tiny test tables are always cheaper to seq-scan, so disable it to see
+    # whether an index path exists at all
+    conn.execute(text("SET enable_seqscan = off"))
+    plan = [r[0] for r in conn.exec_driver_sql("EXPLAIN " + sql).all()]
+    bad = [p for p in plan if "Seq Scan" in p]
+    return plan, bad
+
+
+def main() -> int:
+    run_migrations()
+    explain = sqlite_plan if engine.dialect.name == "sqlite" else postgres_plan
+    failures = 0
+    with engine.connect() as conn:
+        for name, stmt in QUERIES:
+            sql = str(stmt.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+            plan, bad = explain(conn, sql)
+            status = "FULL SCAN" if bad else "ok"
+            print(f"[{status}] {name}")
+            if bad:
+                failures += 1
+                for line in plan:
+                    print("    " + line)
+    print(f"{len(QUERIES) - failures}/{len(QUERIES)} queries use indexes ({engine.dialect.name})")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    code = main()
+    engine.dispose()
+    if tmpdir:
+        tmpdir.cleanup()
+    sys.exit(code)
@@ -0,0 +1,26 @@
+# Garbage-collect unreferenced blobs from the blob store.
+#   python -m backend.tools.gc_blobs --dry-run
+#   python -m backend.tools.gc_blobs --grace-hours 24 --recount
+#   python -m backend.tools.gc_blobs --adopt-legacy   # move pre-blobstore files in first
+import argparse, json
+from datetime import timedelta
+from backend.database import SessionLocal
+from backend.blobstore import collect_garbage, adopt_legacy_files
+from backend import settings
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--grace-hours", type=float, default=24, help="keep unreferenced blobs younger than this")
+parser.add_argument("--dry-run", action="store_true")
+parser.add_argument("--recount", action="store_true", help="recompute refcounts from submissions/assignments first")
+parser.add_argument("--adopt-legacy", action="store_true", help="import files stored under the old per-upload names")
+args = parser.parse_args()
+
+db = SessionLocal()
+try:
+    if args.adopt_legacy and not args.dry_run:
+        settings.prepare_storage()
+        print(json.dumps({"adopted": adopt_legacy_files(db, settings.SUBMIT_DIR, settings.ATTACH_DIR)}))
+    stats = collect_garbage(db, grace=timedelta(hours=args.grace_hours), dry_run=args.dry_run, recount_refs=args.recount)
+    print(json.dumps(stats))
+finally:
+    db.close()
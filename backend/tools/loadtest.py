@@ -0,0 +1,303 @@
+# Load-test harness for the whole API.
+#   python -m backend.tools.loadtest --students 200 --duration 15 --output run.json
+#   python -m backend.tools.loadtest --baseline run.json            # exit 1 on regression
+#   python -m backend.tools.loadtest --database-url postgresql://u:p@localhost/bench --scenarios reads,downloads
+# Seeds a scratch database (SQLite by default; with --database-url an existing,
+# empty PostgreSQL database) and blob store, starts uvicorn on backend.main:app
+# and runs each scenario against it over HTTP:
+#   login      every student logs in at once (bcrypt at --rounds)
+#   uploads    deadline night: --concurrency students uploading --upload-kb files
+#   reads      reports, gradebooks, assignment and course lists
+#   downloads  teachers fetching --download-mb submissions
+#   mixed      reads, uploads and downloads together
+# Prints JSON with p50/p95/p99 latency, throughput and errors per scenario (and
+# per endpoint) plus the server's peak RSS. Needs httpx (pip install httpx).
+import argparse, asyncio, hashlib, json, os, random, socket, subprocess, sys, tempfile, time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from backend.tools.bench_login_storm import free_port, percentiles
+
+SCENARIOS = ("login", "uploads", "reads", "downloads", "mixed")
+
+
+def seed(args) -> dict:
+    # imported here: DATABASE_URL/BLOB_ROOT must be set first
+    from sqlalchemy import insert, select
+    from passlib.context import CryptContext
+    from backend.database import SessionLocal, run_migrations
+    from backend.models import User, Course, CourseStudent, Assignment, Submission, Blob, ROLE_STUDENT, ROLE_TEACHER
+    from backend.blobstore import get_blobstore
+    from backend.latest_submissions import rebuild
+    run_migrations()
+    store = get_blobstore()
+
+    def put_blob(data: bytes) -> str:
+        sha256 = hashlib.sha256(data).hexdigest()
+        staged = store.staging_path()
+        with open(staged, "wb") as f:
+            f.write(data)
+        store.put(staged, sha256)
+        db.add(Blob(sha256=sha256, size=len(data), refcount=0))
+        return sha256
+
+    hashed = CryptContext(schemes=["bcrypt"], bcrypt__rounds=args.rounds).hash("password")
+    db = SessionLocal()
+    small = put_blob(b"%PDF-1.4\n" + os.urandom(32 * 1024))
+    large = put_blob(os.urandom(args.download_mb * 1024 * 1024))
+    db.flush()
+    rng = random.Random(42)
+    teachers = [User(name=f"teacher{i}", email=f"teacher{i}@load.test", hashed_password=hashed, role=ROLE_TEACHER) for i in range(args.teachers)]
+    db.add_all(teachers)
+    db.flush()
+    courses = [Course(name=f"course{t.id}_{i}", teacher_id=t.id) for t in teachers for i in range(args.courses)]
+    db.add_all(courses)
+    db.flush()
+    db.execute(insert(User), [{"name": f"student{i}", "email": f"student{i}@load.test", "hashed_password": hashed, "role": ROLE_STUDENT} for i in range(args.students)])
+    students = db.execute(select(User.id, User.email).where(User.role == ROLE_STUDENT).order_by(User.id)).all()
+    enrolled = {s.id: courses[i % len(courses)] for i, s in enumerate(students)}
+    db.execute(insert(CourseStudent), [{"course_id": c.id, "student_id": sid} for sid, c in enrolled.items()])
+    base = datetime.utcnow() - timedelta(days=args.assignments)
+    tasks = [Assignment(course_id=c.id, teacher_id=c.teacher_id, title=f"a{i}", due_date=base + timedelta(days=i)) for c in courses for i in range(args.assignments)]
+    db.add_all(tasks)
+    db.flush()
+    by_course = defaultdict(list)
+    for a in tasks:
+        by_course[a.course_id].append(a)
+    rows = []
+    for sid, course in enrolled.items():
+        for a in by_course[course.id]:
+            for v in range(args.versions):
+                # one submission in 20 is a large file, for the download scenario
+                sha256 = large if rng.random() < 0.05 else small
+                rows.append({"assignment_id": a.id, "student_id": sid, "file_name": f"submission_{a.id}_{sid}_{v}_work.pdf", "blob_sha256": sha256,
+                             "uploaded_at": a.due_date - timedelta(hours=args.versions - v), "grade": rng.randint(0, 10) if v == args.versions - 1 else None})
+    for i in range(0, len(rows), 5000):
+        db.execute(insert(Submission), rows[i:i + 5000])
+    db.commit()
+    from backend.blobstore import recount
+    recount(db)
+    rebuild(db)
+    large_ids = db.execute(select(Submission.id, Assignment.teacher_id).join(Assignment, Assignment.id == Submission.assignment_id)
+                           .where(Submission.blob_sha256 == large).limit(200)).all()
+    result = {
+        "teachers": [(t.id, t.email) for t in teachers],
+        "courses": [(c.id, c.teacher_id) for c in courses],
+        "students": [(s.id, s.email, enrolled[s.id].id) for s in students],
+        "assignments": {cid: [a.id for a in items] for cid, items in by_course.items()},
+        "large_submissions": [(r.id, r.teacher_id) for r in large_ids],
+        "submission_rows": len(rows),
+    }
+    db.close()
+    return result
+
+
+def tokens(data: dict) -> dict:
+    # minted directly so scenarios other than `login` do not pay for bcrypt
+    from backend.utils.security import create_access_token
+    return {user_id: {"Authorization": f"Bearer {create_access_token(email)}"}
+            for user_id, email in [(t[0], t[1]) for t in data["teachers"]] + [(s[0], s[1]) for s in data["students"]]}
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.statuses = defaultdict(int)
+        self.errors = 0
+        self.bytes = 0
+
+    async def call(self, label: str, request):
+        start = time.perf_counter()
+        try:
+            r = await request()
+            self.statuses[r.status_code] += 1
+            self.bytes += len(r.content)
+            if r.status_code >= 400:
+                self.errors += 1
+        except Exception:
+            self.statuses["exception"] += 1
+            self.errors += 1
+        self.samples[label].append((time.perf_counter() - start) * 1000)
+
+    def summary(self, seconds: float) -> dict:
+        everything = [ms for samples in self.samples.values() for ms in samples]
+        return {
+            "seconds": round(seconds, 2),
+            "requests": len(everything),
+            "throughput_rps": round(len(everything) / seconds, 2) if seconds else None,
+            "errors": self.errors,
+            "status_counts": {str(k): v for k, v in sorted(self.statuses.items(), key=str)},
+            "mb_received": round(self.bytes / 2**20, 2),
+            "latency": percentiles(everything),
+            "endpoints": {label: percentiles(samples) for label, samples in sorted(self.samples.items())},
+        }
+
+
+async def drive(pick, concurrency: int, duration: float, rec: Recorder):
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            label, request = pick()
+            await rec.call(label, request)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+def read_request(client, data, auth, rng):
+    kind = rng.choices(["report", "gradebook", "assignments", "courses"], weights=[4, 1, 4, 2])[0]
+    if kind == "gradebook":
+        course_id, teacher_id = rng.choice(data["courses"])
+        return "GET /reports/course/{id}/gradebook", lambda: client.get(f"/reports/course/{course_id}/gradebook", headers=auth[teacher_id])
+    student_id, _, course_id = rng.choice(data["students"])
+    if kind == "report":
+        return "GET /reports/me", lambda: client.get("/reports/me", headers=auth[student_id])
+    if kind == "assignments":
+        return "GET /assignments/course/{id}", lambda: client.get(f"/assignments/course/{course_id}", headers=auth[student_id])
+    return "GET /courses/", lambda: client.get("/courses/", headers=auth[student_id])
+
+
+def upload_request(client, data, auth, rng, payload: bytes):
+    student_id, _, course_id = rng.choice(data["students"])
+    assignment_id = rng.choice(data["assignments"][course_id])
+    files = {"file": ("deadline.pdf", payload, "application/pdf")}
+    return "POST /submissions/assignment/{id}", lambda: client.post(f"/submissions/assignment/{assignment_id}", files=files, headers=auth[student_id])
+
+
+def download_request(client, data, auth, rng):
+    submission_id, teacher_id = rng.choice(data["large_submissions"])
+    return "GET /submissions/{id}/download", lambda: client.get(f"/submissions/{submission_id}/download", headers=auth[teacher_id])
+
+
+async def run(base_url: str, data: dict, args) -> dict:
+    import httpx
+    auth = tokens(data)
+    rng = random.Random(7)
+    payload = b"%PDF-1.4\n" + os.urandom(args.upload_kb * 1024)
+    limits = httpx.Limits(max_connections=max(args.concurrency, args.students) + 10)
+    results = {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+        for scenario in args.scenarios:
+            rec = Recorder()
+            start = time.perf_counter()
+            if scenario == "login":
+                await asyncio.gather(*(rec.call("POST /auth/login", lambda email=email: client.post("/auth/login", data={"username": email, "password": "password"}))
+                                       for _, email, _ in data["students"]))
+            elif scenario == "uploads":
+                await drive(lambda: upload_request(client, data, auth, rng, payload), args.concurrency, args.duration, rec)
+            elif scenario == "reads":
+                await drive(lambda: read_request(client, data, auth, rng), args.concurrency, args.duration, rec)
+            elif scenario == "downloads":
+                await drive(lambda: download_request(client, data, auth, rng), max(1, args.concurrency // 4), args.duration, rec)
+            elif scenario == "mixed":
+                mix = [lambda: read_request(client, data, auth, rng)] * 8 + [lambda: upload_request(client, data, auth, rng, payload)] * 2 + [lambda: download_request(client, data, auth, rng)]
+                await drive(lambda: rng.choice(mix)(), args.concurrency, args.duration, rec)
+            results[scenario] = rec.summary(time.perf_counter() - start)
+    return results
+
+
+def peak_rss_mb(pid: int):
+    # VmHWM: high-water mark of the resident set, of the server and its
+    # children (password hashing pool); Linux only
+    def hwm(p):
+        try:
+            with open(f"/proc/{p}/status") as f:
+                return next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+        except (OSError, StopIteration):
+            return 0
+    if not os.path.exists(f"/proc/{pid}"):
+        return None
+    children = []
+    for p in os.listdir("/proc"):
+        if p.isdigit():
+            try:
+                with open(f"/proc/{p}/stat") as f:
+                    if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                        children.append(int(p))
+            except (OSError, IndexError, ValueError):
+                pass
+    return {"server": round(hwm(pid) / 1024, 1), "with_children": round(sum(hwm(p) for p in [pid] + children) / 1024, 1)}
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for name, current in result["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        for q in ("p95_ms", "p99_ms"):
+            old, new = before["latency"].get(q), current["latency"].get(q)
+            if old and new and new > old * (1 + tolerance):
+                regressions.append(f"{name}: {q} {old} -> {new}")
+        old, new = before.get("throughput_rps"), current.get("throughput_rps")
+        if old and new and new < old * (1 - tolerance) and name != "login":
+            regressions.append(f"{name}: throughput_rps {old} -> {new}")
+        if current["errors"] > before["errors"]:
+            regressions.append(f"{name}: errors {before['errors']} -> {current['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url", help="empty database to seed (default: scratch SQLite)")
+    parser.add_argument("--teachers", type=int, default=4)
+    parser.add_argument("--courses", type=int, default=3, help="courses per teacher")
+    parser.add_argument("--students", type=int, default=120)
+    parser.add_argument("--assignments", type=int, default=10, help="assignments per course")
+    parser.add_argument("--versions", type=int, default=2, help="submission versions per student and assignment")
+    parser.add_argument("--scenarios", type=lambda s: [x for x in s.split(",") if x], default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per timed scenario")
+    parser.add_argument("--upload-kb", type=int, default=512)
+    parser.add_argument("--download-mb", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=int(os.getenv("BCRYPT_ROUNDS", "12")))
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--output", help="also write the JSON result here")
+    parser.add_argument("--baseline", help="earlier --output to compare against; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown before flagging")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**os.environ, "DATABASE_URL": args.database_url or f"sqlite:///{os.path.join(tmp, 'load.db')}",
+               "BLOB_ROOT": os.path.join(tmp, "blobs"), "BCRYPT_ROUNDS": str(args.rounds), "SLOW_REQUEST_MS": os.getenv("SLOW_REQUEST_MS", "1000000")}
+        os.environ.update(env)
+        started = time.perf_counter()
+        data = seed(args)
+        seed_s = time.perf_counter() - started
+        port = free_port()
+        # run from the scratch dir: the API creates its storage folders relative to cwd
+        server = subprocess.Popen([sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning", "--workers", str(args.workers)],
+                                  env={**env, "PYTHONPATH": os.pathsep.join([os.getcwd(), env.get("PYTHONPATH", "")])}, cwd=tmp)
+        try:
+            for _ in range(300):
+                try:
+                    socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            scenarios = asyncio.run(run(f"http://127.0.0.1:{port}", data, args))
+            rss = peak_rss_mb(server.pid)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+    result = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "database_url")} | {"database": (args.database_url or "sqlite").split(":")[0]},
+        "seed": {"seconds": round(seed_s, 2), "submission_rows": data["submission_rows"]},
+        "scenarios": scenarios,
+        "peak_rss_mb": rss,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            result["regressions"] = compare(result, json.load(f), args.tolerance)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
+    if result.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+# Recompute the latest_submissions projection from the submissions table, e.g.
+# after rows were imported or edited outside the API.
+#   python -m backend.tools.rebuild_latest_submissions
+import json, time
+from backend.database import SessionLocal
+from backend.latest_submissions import rebuild
+
+db = SessionLocal()
+try:
+    start = time.perf_counter()
+    rows = rebuild(db)
+    print(json.dumps({"rows": rows, "seconds": round(time.perf_counter() - start, 3)}))
+finally:
+    db.close()
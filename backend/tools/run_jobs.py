@@ -0,0 +1,56 @@
+# Process background jobs outside the API (JOBS_BACKEND=database; start the API
+# with JOBS_WORKERS=0 so only this process runs them).
+#   JOBS_BACKEND=database python -m backend.tools.run_jobs --workers 4
+#   python -m backend.tools.run_jobs --requeue   # re-enqueue uploads left pending, then exit
+#   python -m backend.tools.run_jobs --backfill  # also process files uploaded before processing existed
+import argparse, asyncio, json, logging
+from sqlalchemy import update
+from backend.database import SessionLocal
+from backend.models import Submission, Assignment, PROCESSING_PENDING
+from backend import jobs, processing
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--workers", type=int, default=jobs.JOBS_WORKERS or 2)
+parser.add_argument("--requeue", action="store_true", help="enqueue rows whose processing is pending and exit")
+parser.add_argument("--backfill", action="store_true", help="mark never-processed files pending first (implies --requeue)")
+args = parser.parse_args()
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+
+def backfill() -> int:
+    with SessionLocal() as db:
+        marked = db.execute(update(Submission).where(Submission.processing_status.is_(None), Submission.blob_sha256.is_not(None))
+                            .values(processing_status=PROCESSING_PENDING)).rowcount
+        marked += db.execute(update(Assignment).where(Assignment.processing_status.is_(None), Assignment.attachment_sha256.is_not(None))
+                             .values(processing_status=PROCESSING_PENDING)).rowcount
+        db.commit()
+    return marked
+
+
+async def main():
+    if args.backfill or args.requeue:
+        marked = backfill() if args.backfill else 0
+        if not jobs.runner.queue.durable:
+            # an in-memory queue dies with this process: work through it here
+            jobs.runner.workers = args.workers
+            await jobs.runner.start()
+        queued = await processing.recover(force=True)
+        while not jobs.runner.queue.durable and (jobs.runner.running or any((await jobs.runner.queue.depth()).values())):
+            await asyncio.sleep(0.2)
+        await jobs.runner.stop()
+        print(json.dumps({"marked": marked, "requeued": queued, **(await jobs.job_stats())}))
+        return
+    if not jobs.runner.queue.durable:
+        parser.error("set JOBS_BACKEND=database: the in-memory queue only holds jobs of its own process")
+    jobs.runner.workers = args.workers
+    await jobs.runner.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await jobs.runner.stop()
+
+
+try:
+    asyncio.run(main())
+except KeyboardInterrupt:
+    pass
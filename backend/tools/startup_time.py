@@ -0,0 +1,99 @@
+# Measure how long the API takes to come up.
+#   python -m backend.tools.startup_time --runs 5
+#   python -m backend.tools.startup_time --max-import-ms 1500 --max-boot-ms 4000   # exit 1 over budget
+# Every run starts a fresh interpreter (nothing cached in sys.modules) against a
+# scratch SQLite database and storage folder:
+#   import      `import backend.main` alone: what each worker pays before serving
+#   cold        uvicorn until GET / answers, on an empty database (migrations run)
+#   warm        same on a database already at head (no Alembic, one SELECT)
+#   preload     gunicorn -c backend/gunicorn_conf.py with --workers, until every
+#               worker answered (skipped when gunicorn is not installed)
+# Prints JSON with the median and max of each, in milliseconds.
+import argparse, json, os, shutil, statistics, subprocess, sys, tempfile, time, urllib.request
+from backend.tools.bench_login_storm import free_port
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import backend.main; print(time.perf_counter() - t)"
+
+
+def _env(tmp: str) -> dict:
+    return {**os.environ, "DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'startup.db')}",
+            "STORAGE_ROOT": os.path.join(tmp, "storage"), "BLOB_ROOT": os.path.join(tmp, "storage", "blobs"),
+            "PYTHONPATH": os.pathsep.join([os.getcwd(), os.environ.get("PYTHONPATH", "")])}
+
+
+def _get(url: str) -> bool:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as r:
+            return r.status == 200
+    except OSError:
+        return False
+
+
+def _serve(cmd: list, env: dict, cwd: str, port: int, answers: int = 1, timeout: float = 60) -> float:
+    started = time.perf_counter()
+    server = subprocess.Popen(cmd, env=env, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        # with several workers sharing the socket, wait until enough distinct
+        # connections were served that every worker is up (best effort)
+        seen = 0
+        while seen < answers:
+            if time.perf_counter() - started > timeout:
+                raise RuntimeError(f"server did not answer within {timeout}s")
+            if server.poll() is not None:
+                raise RuntimeError(f"server exited with {server.returncode}: {server.stderr.read().decode(errors='replace')[-2000:]}")
+            if _get(f"http://127.0.0.1:{port}/"):
+                seen += 1
+            else:
+                time.sleep(0.01)
+        return time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def _summary(samples: list) -> dict:
+    return {"median_ms": round(statistics.median(samples) * 1000, 1), "max_ms": round(max(samples) * 1000, 1), "runs": len(samples)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers for the preload run")
+    parser.add_argument("--max-import-ms", type=float, help="fail when the median import time is higher")
+    parser.add_argument("--max-boot-ms", type=float, help="fail when the median warm boot time is higher")
+    args = parser.parse_args()
+
+    result = {"import": [], "cold": [], "warm": []}
+    uvicorn = [sys.executable, "-m", "uvicorn", "backend.main:app", "--log-level", "warning"]
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = _env(tmp)
+            out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], env=env, cwd=tmp, capture_output=True, text=True, check=True)
+            result["import"].append(float(out.stdout.strip().splitlines()[-1]))
+            for name in ("cold", "warm"):
+                port = free_port()
+                result[name].append(_serve(uvicorn + ["--port", str(port)], env, tmp, port))
+    if shutil.which("gunicorn"):
+        result["preload"] = []
+        conf = os.path.join(os.getcwd(), "backend", "gunicorn_conf.py")
+        for _ in range(args.runs):
+            with tempfile.TemporaryDirectory() as tmp:
+                env = {**_env(tmp), "WEB_CONCURRENCY": str(args.workers)}
+                port = free_port()
+                cmd = ["gunicorn", "-c", conf, "backend.main:app", "--log-level", "warning", "--bind", f"127.0.0.1:{port}"]
+                result["preload"].append(_serve(cmd, env, tmp, port, answers=args.workers))
+
+    report = {name: _summary(samples) for name, samples in result.items()}
+    failures = []
+    if args.max_import_ms is not None and report["import"]["median_ms"] > args.max_import_ms:
+        failures.append(f"import {report['import']['median_ms']} ms > {args.max_import_ms} ms")
+    if args.max_boot_ms is not None and report["warm"]["median_ms"] > args.max_boot_ms:
+        failures.append(f"warm boot {report['warm']['median_ms']} ms > {args.max_boot_ms} ms")
+    report["failures"] = failures
+    print(json.dumps(report, indent=2))
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
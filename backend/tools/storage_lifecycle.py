@@ -0,0 +1,23 @@
+# Compress superseded submission files and apply the retention policy.
+#   python -m backend.tools.storage_lifecycle --dry-run
+#   python -m backend.tools.storage_lifecycle --compress-after-days 30 --keep-versions 3
+# Defaults come from COMPRESS_AFTER_DAYS / RETENTION_KEEP_VERSIONS. Meant for a
+# nightly cron next to gc_blobs; prints a JSON report with the bytes reclaimed.
+import argparse, json
+from datetime import timedelta
+from backend.database import SessionLocal
+from backend.storage_lifecycle import run_lifecycle, COMPRESS_AFTER_DAYS, RETENTION_KEEP_VERSIONS
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--compress-after-days", type=float, default=COMPRESS_AFTER_DAYS, help="compress superseded versions last uploaded before this")
+parser.add_argument("--keep-versions", type=int, default=RETENTION_KEEP_VERSIONS, help="files kept per student and assignment besides graded ones (0: all)")
+parser.add_argument("--limit", type=int, help="compress at most this many blobs in this run")
+parser.add_argument("--dry-run", action="store_true")
+args = parser.parse_args()
+
+db = SessionLocal()
+try:
+    report = run_lifecycle(db, timedelta(days=args.compress_after_days), args.keep_versions, dry_run=args.dry_run, limit=args.limit)
+    print(json.dumps(report, indent=2))
+finally:
+    db.close()
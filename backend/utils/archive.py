@@ -0,0 +1,66 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, Optional
+import io
+import re
+import zipfile
+
+
+# Write-only, non-seekable target: zipfile then emits data descriptors after
+# each member instead of seeking back, so the archive can be sent as it is
+# produced. Whatever zipfile writes is handed out by drain() and dropped.
+class _Sink(io.RawIOBase):
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def drain(self) -> Iterator[bytes]:
+        chunks, self._chunks = self._chunks, []
+        yield from chunks
+
+
+@dataclass
+class ZipEntry:
+    name: str
+    open: Callable[[], Iterable[bytes]]
+    size: Optional[int] = None
+    modified: Optional[datetime] = None
+
+
+# Stream a ZIP built from `entries` (which may itself be a generator). Members
+# are stored, not deflated: submissions are mostly PDFs/images that do not
+# compress, and memory stays at one read chunk whatever the archive size.
+def zip_stream(entries: Iterable[ZipEntry]) -> Iterator[bytes]:
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for entry in entries:
+            modified = entry.modified or datetime.utcnow()
+            info = zipfile.ZipInfo(entry.name, date_time=modified.timetuple()[:6] if modified.year >= 1980 else (1980, 1, 1, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_STORED
+            if entry.size is not None:
+                # lets zipfile pick zip64 headers for members over 4 GiB up front
+                info.file_size = entry.size
+            with zf.open(info, "w", force_zip64=entry.size is None) as member:
+                for chunk in entry.open():
+                    member.write(chunk)
+                    yield from sink.drain()
+            yield from sink.drain()
+    yield from sink.drain()
+
+
+_unsafe = re.compile(r'[\\/:*?"<>|\x00-\x1f]+')
+
+
+def safe_name(name: str) -> str:
+    return _unsafe.sub("_", name).strip(" .") or "_"
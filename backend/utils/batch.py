@@ -0,0 +1,53 @@
+from fastapi import HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+from typing import Type
+import csv
+import io
+import os
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "5000"))
+
+CSV_TYPES = ("text/csv", "application/csv", "text/plain")
+
+
+def check_batch_size(n: int) -> None:
+    if n > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {BATCH_MAX_ITEMS} items")
+
+
+# Batch endpoints take either a JSON body (validated against `model`) or a CSV
+# file, sent as the raw body (Content-Type: text/csv) or as the `file` part of a
+# multipart form. Returns the model or the CSV rows as dicts keyed by the
+# lower-cased header.
+async def read_json_or_csv(request: Request, model: Type[BaseModel]):
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type == "multipart/form-data":
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Expected a CSV file in the 'file' field")
+        return _parse_csv(await upload.read())
+    if content_type in CSV_TYPES:
+        return _parse_csv(await request.body())
+    try:
+        return model.model_validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+
+
+def _parse_csv(raw: bytes) -> list[dict]:
+    try:
+        text = raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="CSV must be UTF-8")
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames:
+        raise HTTPException(status_code=400, detail="CSV is empty")
+    reader.fieldnames = [(f or "").strip().lower() for f in reader.fieldnames]
+    return [{k: (v or "").strip() for k, v in row.items() if k} for row in reader]
+
+
+def summarize(results: list[dict], ok: set) -> dict:
+    succeeded = sum(1 for r in results if r["status"] in ok)
+    return {"succeeded": succeeded, "failed": len(results) - succeeded, "results": results}
@@ -0,0 +1,115 @@
+from typing import Iterable, Iterator, Optional
+import gzip
+import io
+import os
+import shutil
+import struct
+from .files import CHUNK_SIZE
+
+# Codecs for blobs at rest (see storage_lifecycle.py). Compressed blobs are
+# plain .gz / .zst files, so they stay readable with standard tools. zstd needs
+# `pip install zstandard`; without it everything is stored as gzip.
+GZIP = "gzip"
+ZSTD = "zstd"
+SUFFIXES = {ZSTD: ".zst", GZIP: ".gz"}
+
+# formats that are already compressed: another pass only costs CPU
+_PACKED = {
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".avif", ".mp3", ".m4a", ".ogg", ".mp4", ".mov", ".webm", ".mkv",
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".zst", ".7z", ".rar",
+    ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".odp", ".epub", ".jar", ".apk",
+}
+_TEXT = {".txt", ".csv", ".tsv", ".md", ".json", ".xml", ".html", ".htm", ".svg", ".tex", ".rtf", ".ipynb", ".log",
+         ".py", ".java", ".c", ".h", ".cpp", ".cs", ".js", ".ts", ".sql", ".r", ".m", ".go", ".rs", ".rb", ".php"}
+
+
+def zstd_available() -> bool:
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+# (encoding, level) for a file, or None when it should be left as is. Text
+# compresses several times over and is read rarely once superseded, so it gets
+# the strongest setting; PDFs and office binaries mostly hold deflated streams
+# already and get a cheap pass that still catches fonts and uncompressed pages.
+def choose_codec(filename: str, content_type: Optional[str] = None) -> Optional[tuple[str, int]]:
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in _PACKED or (content_type or "").startswith(("image/", "video/", "audio/")):
+        return None
+    text = ext in _TEXT or (content_type or "").startswith("text/")
+    if zstd_available():
+        return (ZSTD, 19) if text else (ZSTD, 6)
+    return (GZIP, 9) if text else (GZIP, 6)
+
+
+def compress_file(src: str, dst: str, encoding: str, level: int) -> int:
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        if encoding == ZSTD:
+            import zstandard
+            # the frame header carries the original size (see decoded_size)
+            zstandard.ZstdCompressor(level=level, write_content_size=True).copy_stream(fin, fout, size=os.path.getsize(src), read_size=CHUNK_SIZE)
+        else:
+            with gzip.GzipFile(fileobj=fout, mode="wb", compresslevel=level, mtime=0) as gz:
+                shutil.copyfileobj(fin, gz, CHUNK_SIZE)
+    return os.path.getsize(dst)
+
+
+# Original size from the first bytes (zstd frame header) or the last four
+# (gzip ISIZE, modulo 4 GiB: uploads are far below that, see MAX_UPLOAD_MB).
+HEAD_BYTES = 18
+TAIL_BYTES = 4
+
+
+def decoded_size(encoding: str, head: bytes = b"", tail: bytes = b"") -> int:
+    if encoding == ZSTD:
+        import zstandard
+        size = zstandard.frame_content_size(head)
+        if size < 0:
+            raise ValueError("zstd frame without content size")
+        return size
+    return struct.unpack("<I", tail[-TAIL_BYTES:])[0]
+
+
+class _ChunkReader(io.RawIOBase):
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buffer:
+            self._buffer = next(self._chunks, None)
+            if self._buffer is None:
+                self._buffer = b""
+                return 0
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+# Decompress a stream of stored chunks and yield bytes start..end (inclusive,
+# end None for "to the end") of the original. Seeking means decompressing up
+# to `start`: fine for the occasional resumed download of an old version.
+def iter_decompressed(chunks: Iterable[bytes], encoding: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+    raw = io.BufferedReader(_ChunkReader(chunks), CHUNK_SIZE)
+    if encoding == ZSTD:
+        import zstandard
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, read_size=CHUNK_SIZE)
+    else:
+        reader = gzip.GzipFile(fileobj=raw, mode="rb")
+    with reader:
+        pos = 0
+        while end is None or pos <= end:
+            chunk = reader.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            lo, hi = max(start - pos, 0), len(chunk) if end is None else min(end + 1 - pos, len(chunk))
+            pos += len(chunk)
+            if lo < hi:
+                yield chunk[lo:hi]
@@ -0,0 +1,18 @@
+from typing import Any, Iterable
+
+# Cells a spreadsheet app would read as a formula (=, +, -, @) or as a prefix
+# it strips before doing so (tab, CR). The CSV exports hold text users typed
+# (names, titles, comments, file names) and are opened by teachers in Excel or
+# LibreOffice, so such text gets a leading apostrophe and shows as typed.
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def csv_safe(value: Any) -> Any:
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+# every cell of a row through csv_safe(); numbers and None are left alone
+def csv_row(values: Iterable[Any]) -> list:
+    return [csv_safe(v) for v in values]
@@ -0,0 +1,206 @@
+from fastapi import HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from dataclasses import dataclass
+from email.utils import formatdate
+from urllib.parse import quote
+from typing import Optional
+import anyio
+import hashlib
+import mimetypes
+import os
+import uuid
+from ..settings import STORAGE_ROOT
+
+CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(64 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "100")) * 1024 * 1024
+
+# When set (e.g. "/protected-files"), downloads are handed to nginx through
+# X-Accel-Redirect instead of being streamed by the API worker. The prefix must
+# map to DOWNLOAD_ACCEL_ROOT in an `internal` nginx location (see nginx.conf).
+ACCEL_REDIRECT_PREFIX = os.getenv("DOWNLOAD_ACCEL_PREFIX", "").rstrip("/")
+ACCEL_ROOT = os.getenv("DOWNLOAD_ACCEL_ROOT", STORAGE_ROOT)
+
+
+def make_etag(st: os.stat_result) -> str:
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # weak comparison, as required for If-None-Match
+    candidates = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return etag in candidates
+
+
+# Parse a single `bytes=` range into inclusive (start, end). Absent, malformed or
+# multi-range headers return None and the whole file is served (RFC 9110 allows it).
+def parse_range(header: Optional[str], size: int) -> Optional[tuple[int, int]]:
+    if not header or not header.startswith("bytes="):
+        return None
+    spec = header[len("bytes="):].strip()
+    if "," in spec or "-" not in spec:
+        return None
+    first, last = (p.strip() for p in spec.split("-", 1))
+    try:
+        if first == "":
+            # suffix range: last N bytes
+            length = int(last)
+            if length <= 0:
+                raise ValueError
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else size - 1
+            end = min(end, size - 1)
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+def iter_file(path: str, start: int = 0, end: Optional[int] = None, chunk_size: int = CHUNK_SIZE):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = None if end is None else end - start + 1
+        while remaining is None or remaining > 0:
+            chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+def content_disposition(filename: str) -> str:
+    ascii_name = filename.encode("ascii", "ignore").decode().replace('"', "") or "download"
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename)}"
+
+
+def accel_uri(path: str) -> Optional[str]:
+    if not ACCEL_REDIRECT_PREFIX:
+        return None
+    rel = os.path.relpath(os.path.abspath(path), os.path.abspath(ACCEL_ROOT))
+    if rel.startswith(".."):
+        # file lives outside the directory nginx knows about (e.g. temp fallback)
+        return None
+    return f"{ACCEL_REDIRECT_PREFIX}/{quote(rel.replace(os.sep, '/'))}"
+
+
+# Build a download response for `size` bytes produced by `open_range(start, end)`
+# (inclusive, end may be None for "to the end"), with ETag/304 and single-range
+# support. Sync iterators are consumed from Starlette's threadpool, so memory
+# stays constant whatever the size.
+def ranged_response(request: Request, size: int, etag: str, filename: str, open_range, media_type: Optional[str] = None, last_modified: Optional[float] = None, accel: Optional[str] = None) -> Response:
+    media_type = media_type or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": content_disposition(filename),
+    }
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    if accel:
+        # nginx takes care of Range and the actual byte transfer
+        headers["X-Accel-Redirect"] = accel
+        return Response(status_code=200, media_type=media_type, headers=headers)
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if not if_range or if_range.strip() == etag:
+        byte_range = parse_range(request.headers.get("range"), size)
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(open_range(0, None), media_type=media_type, headers=headers)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(open_range(start, end), status_code=206, media_type=media_type, headers=headers)
+
+
+def file_response(request: Request, path: str, filename: str, media_type: Optional[str] = None) -> Response:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File missing")
+    return ranged_response(request, st.st_size, make_etag(st), filename, lambda start, end: iter_file(path, start, end),
+                           media_type=media_type, last_modified=st.st_mtime, accel=accel_uri(path))
+
+@dataclass
+class SavedFile:
+    path: str
+    size: int
+    sha256: str
+
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"File exceeds the {max_bytes // (1024 * 1024)} MB limit")
+
+
+# Copy an UploadFile to `dest` in UPLOAD_CHUNK_SIZE pieces, hashing as it goes.
+# Data lands in a temp file next to `dest` and is renamed into place only once
+# complete, so readers never see a partial file. Disk I/O runs in worker threads
+# one chunk at a time instead of pinning a threadpool slot for the whole copy.
+async def save_upload(upload: UploadFile, dest: str, max_bytes: int = MAX_UPLOAD_BYTES) -> SavedFile:
+    if upload.size is not None and upload.size > max_bytes:
+        raise _too_large(max_bytes)
+    tmp = os.path.join(os.path.dirname(dest), f".{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with await anyio.open_file(tmp, "wb") as out:
+            while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise _too_large(max_bytes)
+                digest.update(chunk)
+                await out.write(chunk)
+            await out.flush()
+            await anyio.to_thread.run_sync(os.fsync, out.wrapped.fileno())
+        await anyio.to_thread.run_sync(os.replace, tmp, dest)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+    return SavedFile(path=dest, size=size, sha256=digest.hexdigest())
+
+
+# ASGI middleware rejecting oversized request bodies before they are parsed:
+# a declared Content-Length is checked up front, chunked bodies are counted as
+# they arrive. `slack` leaves room for multipart boundaries and form fields.
+class BodySizeLimitMiddleware:
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_BYTES, slack: int = 64 * 1024):
+        self.app = app
+        self.limit = max_bytes + slack
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                if value.isdigit() and int(value) > self.limit:
+                    response = JSONResponse({"detail": _too_large(self.max_bytes).detail}, status_code=413)
+                    return await response(scope, receive, send)
+                break
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.limit:
+                    raise _too_large(self.max_bytes)
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,75 @@
+from fastapi import HTTPException, Query, Request, Response
+from sqlalchemy import and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+import base64
+import json
+import os
+
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "50"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "500"))
+
+# Keyset pagination: a page is "the next `limit` rows after the last row of the
+# previous page" in a fixed (sort column, id) order, so every page costs one
+# index range scan however deep the client has scrolled (OFFSET would re-read
+# every skipped row). List bodies are unchanged; the cursor for the following
+# page travels in the X-Next-Cursor header (and a Link rel="next"), absent on
+# the last page.
+
+
+@dataclass
+class Page:
+    limit: int
+    cursor: Optional[str]
+
+
+def page_params(
+    limit: int = Query(PAGE_SIZE, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+) -> Page:
+    return Page(limit=limit, cursor=cursor)
+
+
+def encode_cursor(values) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, keys) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError
+        return [datetime.fromisoformat(v) if col.type.python_type is datetime else col.type.python_type(v) for v, (col, _) in zip(values, keys)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+# rows strictly after `values` in the (k1, k2, ...) order given by `keys`
+def _after(keys, values):
+    col, descending = keys[0]
+    beyond = col < values[0] if descending else col > values[0]
+    if len(keys) == 1:
+        return beyond
+    return or_(beyond, and_(col == values[0], _after(keys[1:], values[1:])))
+
+
+# `keys` is a list of (column, descending) pairs and must end with a unique
+# column (the primary key) so the order is total. Rows are ORM entities, or
+# with `columns=True` plain rows of a columns-only select, which must include
+# the key columns under their own names.
+async def paginate(db: AsyncSession, stmt, keys, page: Page, request: Request, response: Response, columns: bool = False) -> list:
+    if page.cursor:
+        stmt = stmt.where(_after(keys, decode_cursor(page.cursor, keys)))
+    stmt = stmt.order_by(*(col.desc() if descending else col.asc() for col, descending in keys)).limit(page.limit + 1)
+    result = await db.execute(stmt)
+    rows = result.all() if columns else result.scalars().all()
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        last = rows[-1]
+        cursor = encode_cursor([getattr(last, col.key) for col, _ in keys])
+        response.headers["X-Next-Cursor"] = cursor
+        response.headers["Link"] = f'<{request.url.include_query_params(cursor=cursor)}>; rel="next"'
+    return rows
@@ -0,0 +1,77 @@
+from dataclasses import dataclass
+from typing import Optional
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+
+PDF_MAGIC = b"%PDF-"
+# readers accept the header anywhere in the first KiB (some generators prepend junk)
+PDF_HEADER_WINDOW = 1024
+PDF_TEXT_MAX_CHARS = int(os.getenv("PDF_TEXT_MAX_CHARS", "200000"))
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "256"))
+THUMBNAIL_TIMEOUT = float(os.getenv("THUMBNAIL_TIMEOUT", "30"))
+
+
+class InvalidPdf(Exception):
+    pass
+
+
+@dataclass
+class PdfInfo:
+    page_count: int
+    text: str
+
+
+def looks_like_pdf(head: bytes) -> bool:
+    return PDF_MAGIC in head[:PDF_HEADER_WINDOW]
+
+
+def read_head(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read(PDF_HEADER_WINDOW)
+
+
+# Parse the document (pypdf) for its page count and text. Raises InvalidPdf when
+# the file has a PDF header but cannot be read as one.
+def inspect_pdf(path: str) -> PdfInfo:
+    from pypdf import PdfReader
+    from pypdf.errors import PdfReadError
+    try:
+        reader = PdfReader(path)
+        if reader.is_encrypted:
+            # page count is readable, text is not without the password
+            return PdfInfo(page_count=len(reader.pages), text="")
+        parts, size = [], 0
+        for page in reader.pages:
+            if size >= PDF_TEXT_MAX_CHARS:
+                break
+            chunk = page.extract_text() or ""
+            parts.append(chunk)
+            size += len(chunk)
+        return PdfInfo(page_count=len(reader.pages), text="\n".join(parts)[:PDF_TEXT_MAX_CHARS])
+    except (PdfReadError, ValueError, KeyError, TypeError, AttributeError) as e:
+        raise InvalidPdf(str(e) or type(e).__name__) from e
+
+
+# PNG of the first page, THUMBNAIL_SIZE px on its longest side. Needs poppler's
+# `pdftoppm` on PATH (poppler-utils); returns None when it is not installed or
+# gives up after THUMBNAIL_TIMEOUT (the file is still processed, just unpreviewed).
+def render_thumbnail(path: str) -> Optional[bytes]:
+    binary = shutil.which("pdftoppm")
+    if binary is None:
+        logging.debug("pdftoppm not found; skipping thumbnail")
+        return None
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, "thumb")
+        cmd = [binary, "-png", "-f", "1", "-l", "1", "-singlefile", "-scale-to", str(THUMBNAIL_SIZE), path, out]
+        try:
+            result = subprocess.run(cmd, capture_output=True, timeout=THUMBNAIL_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            logging.warning("pdftoppm timed out after %ss on %s; skipping thumbnail", THUMBNAIL_TIMEOUT, path)
+            return None
+        if result.returncode != 0:
+            raise InvalidPdf(result.stderr.decode(errors="replace").strip() or "pdftoppm failed")
+        with open(out + ".png", "rb") as f:
+            return f.read()
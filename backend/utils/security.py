@@ -1,29 +1,105 @@
-from passlib.context import CryptContext
+from fastapi import HTTPException
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from jose import jwt, JWTError
 from typing import Optional
+import asyncio
+import functools
+import multiprocessing
 import os
+import time
+from ..metrics import PASSWORD_HASH_TIME
 
 SECRET_KEY = os.getenv("JWT_SECRET", "supersecretjwtkey")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24
+# Put the user's id/role/name in the token so authenticated requests can be served
+# without a users lookup. Role changes then only apply once the token expires.
+JWT_EMBED_CLAIMS = os.getenv("JWT_EMBED_CLAIMS", "0") == "1"
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost factor. Pinning min=max=default makes passlib flag hashes made with
+# any other cost, so they are transparently re-hashed on the next login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Hashing runs in a dedicated process pool so a login storm cannot starve the
+# event loop or Starlette's threadpool. 0 workers = run in the default thread
+# executor instead (handy for tests). Beyond workers + queue, callers get a 503.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "64"))
+
+# passlib and jose are imported on first use, not when the app boots
+@functools.lru_cache(maxsize=None)
+def pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=BCRYPT_ROUNDS,
+        bcrypt__min_rounds=BCRYPT_ROUNDS,
+        bcrypt__max_rounds=BCRYPT_ROUNDS,
+    )
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return pwd_context().hash(password)
 
 def verify_password(plain: str, hashed: str) -> bool:
-    return pwd_context.verify(plain, hashed)
+    return pwd_context().verify(plain, hashed)
+
+# returns (valid, new_hash_or_None); new_hash is set when the stored cost is stale
+def verify_and_update(plain: str, hashed: str) -> tuple[bool, Optional[str]]:
+    return pwd_context().verify_and_update(plain, hashed)
+
+_hash_pool: Optional[ProcessPoolExecutor] = None
+_hash_inflight = 0
+
+def _get_hash_pool() -> Optional[ProcessPoolExecutor]:
+    global _hash_pool
+    if PASSWORD_HASH_WORKERS <= 0:
+        return None
+    if _hash_pool is None:
+        # spawn: forking a process that already runs threads (uvicorn) is unsafe
+        _hash_pool = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _hash_pool
+
+async def _run_hash_job(fn, *args):
+    # only touched from the event loop, so a plain counter is enough
+    global _hash_inflight
+    if _hash_inflight >= max(PASSWORD_HASH_WORKERS, 1) + PASSWORD_HASH_QUEUE:
+        raise HTTPException(status_code=503, detail="Too many concurrent logins, retry shortly", headers={"Retry-After": "1"})
+    _hash_inflight += 1
+    start = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_hash_pool(), fn, *args)
+    finally:
+        _hash_inflight -= 1
+        PASSWORD_HASH_TIME.observe("hash" if fn is hash_password else "verify", value=time.perf_counter() - start)
 
-def create_access_token(subject: str, expires_delta: Optional[timedelta] = None) -> str:
+async def hash_password_async(password: str) -> str:
+    return await _run_hash_job(hash_password, password)
+
+async def verify_password_async(plain: str, hashed: str) -> tuple[bool, Optional[str]]:
+    return await _run_hash_job(verify_and_update, plain, hashed)
+
+def shutdown_hash_pool() -> None:
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown(cancel_futures=True)
+        _hash_pool = None
+
+def hash_pool_stats() -> dict:
+    return {"workers": PASSWORD_HASH_WORKERS, "queue_limit": PASSWORD_HASH_QUEUE, "in_flight": _hash_inflight, "bcrypt_rounds": BCRYPT_ROUNDS}
+
+def create_access_token(subject: str, expires_delta: Optional[timedelta] = None, claims: Optional[dict] = None) -> str:
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode = {"sub": subject, "exp": expire}
+    to_encode = {**(claims or {}), "sub": subject, "exp": expire}
+    from jose import jwt
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def decode_token(token: str) -> Optional[str]:
+def decode_claims(token: str) -> Optional[dict]:
+    from jose import jwt, JWTError
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload.get("sub")
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except JWTError:
         return None
+
+def decode_token(token: str) -> Optional[str]:
+    payload = decode_claims(token)
+    return payload.get("sub") if payload else None
@@ -0,0 +1,51 @@
+from fastapi.responses import JSONResponse, Response
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Iterable
+import json
+
+# JSON encoding for responses. orjson is several times faster than the stdlib
+# encoder and writes the same output for what the API returns (ISO datetimes,
+# UTF-8 strings); without it the stdlib is used with FastAPI's settings.
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        # jsonable_encoder keeps non-string keys (e.g. job stats by id)
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+# the app's default_response_class (see main.py)
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+# Columns-only fast path for list endpoints: select exactly the columns of a
+# response schema, in its field order, and turn the rows into JSON without ORM
+# objects or pydantic validation. Only for data read from our own tables, which
+# the schema already describes; the route keeps its response_model for the docs.
+def schema_columns(model, entity) -> list:
+    return [getattr(entity, name) for name in model.model_fields]
+
+
+def row_dicts(model, rows: Iterable) -> list[dict]:
+    names = tuple(model.model_fields)
+    return [dict(zip(names, row)) for row in rows]
+
+
+def json_response(content: Any, headers: dict | None = None) -> Response:
+    return Response(content=dumps(content), media_type="application/json", headers=headers)